@@ -0,0 +1,529 @@
+"""
+Asyncio counterparts of the playlist operations, for embedding spotcrates in an asyncio service.
+
+Requires the optional 'aio' extra (aiohttp): ``pip install spotcrates[aio]``.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from itertools import chain
+from typing import Dict, Any, List, Tuple, Iterable, Awaitable, Callable, TypeVar
+
+from spotipy import SpotifyException
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None  # type: ignore
+
+from spotcrates.client import TokenBucket, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF_FACTOR, \
+    DEFAULT_BACKOFF_MAX, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, TOKEN_EXPIRY_MARGIN, RATE_LIMITED_STATUS, \
+    READ_ONLY_METHODS, is_retryable_status, get_retry_after, get_backoff, get_client_settings
+from spotcrates.common import FetchProfile, PLAYLIST_ITEMS_PAGE_LIMIT, PLAYLISTS_PAGE_LIMIT, ZERO_EPOCH, batched, \
+    convert_items, get_auth_manager, get_page_offsets
+from spotcrates.index import PlaylistIndex
+from spotcrates.playlists import PlaylistResult, process_config, get_oldest_timestamp, get_config_prefixes, \
+    get_exclude_lists, get_listing_rows, find_playlists, shuffled, create_unique_dest_name
+from spotcrates.tracks import TrackRef, TrackIdSet, to_added_at
+from spotcrates.writer import WRITE_BATCH_SIZE, dedupe, iter_unique
+
+SPOTIFY_API_PREFIX = "https://api.spotify.com/v1/"
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSpotify:
+
+    def __init__(self, auth_manager: Any, api_prefix: str = SPOTIFY_API_PREFIX,
+                 rate_limiter: TokenBucket | None = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 requests_timeout: Tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)):
+        """An asyncio client for the parts of the Spotify Web API that spotcrates uses. Every request
+        goes through a shared rate limiter and a single aiohttp session whose connector allows at most
+        max_concurrency connections to a host. Rate-limited (429) and server error (5xx) responses are
+        retried as RateLimitedSpotify does. Access tokens come from the auth manager and are held in
+        memory until they near expiry.
+
+        :param auth_manager: The spotipy auth manager to get access tokens from.
+        :param api_prefix: The base URL of the Web API.
+        :param rate_limiter: The token bucket shared by all requests from this client.
+        :param max_concurrency: The maximum number of requests in flight to a host at once.
+        :param max_retries: The number of times to retry a failed request.
+        :param backoff_factor: The base delay in seconds for exponential backoff.
+        :param backoff_max: The longest delay in seconds between retries.
+        :param requests_timeout: The connect and read timeouts in seconds.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncSpotify requires aiohttp; install spotcrates with the 'aio' extra")
+        self.auth_manager = auth_manager
+        self.api_prefix = api_prefix
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.requests_timeout = requests_timeout
+        self.session: aiohttp.ClientSession | None = None
+        self.token_lock = asyncio.Lock()
+        self.auth_header: Dict[str, str] = {}
+        self.auth_expires_at = 0.0
+
+    async def __aenter__(self) -> "AsyncSpotify":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the client's connections."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def me(self) -> Dict[str, Any]:
+        return await self.request("GET", "me")
+
+    async def current_user_playlists(self, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        return await self.request("GET", "me/playlists", params={"limit": limit, "offset": offset})
+
+    async def playlist(self, playlist_id: str, fields: str | None = None) -> Dict[str, Any]:
+        return await self.request("GET", f"playlists/{playlist_id}", params={"fields": fields})
+
+    async def playlist_items(self, playlist_id: str, fields: str | None = None, limit: int = 50,
+                             offset: int = 0) -> Dict[str, Any]:
+        return await self.request("GET", f"playlists/{playlist_id}/items",
+                                  params={"fields": fields, "limit": limit, "offset": offset,
+                                          "additional_types": "track,episode"})
+
+    async def user_playlist_create(self, user: str, name: str, public: bool = True) -> Dict[str, Any]:
+        return await self.request("POST", f"users/{user}/playlists",
+                                  payload={"name": name, "public": public, "collaborative": False,
+                                           "description": ""})
+
+    async def playlist_add_items(self, playlist_id: str, items: List[str]) -> Dict[str, Any]:
+        return await self.request("POST", f"playlists/{playlist_id}/items", payload={"uris": get_track_uris(items)})
+
+    async def playlist_replace_items(self, playlist_id: str, items: List[str]) -> Dict[str, Any]:
+        return await self.request("PUT", f"playlists/{playlist_id}/items", payload={"uris": get_track_uris(items)})
+
+    async def request(self, method: str, path: str, params: Dict[str, Any] | None = None,
+                      payload: Any = None) -> Any:
+        """Sends a request to the Web API, retrying it as configured.
+
+        :param method: The HTTP method.
+        :param path: The path relative to the API prefix, or a full URL.
+        :param params: The query parameters. Those set to None are left out.
+        :param payload: The JSON body, if any.
+        :return: The decoded JSON response, or None if it had no body.
+        """
+        url = path if path.startswith("http") else self.api_prefix + path
+        query = {key: value for key, value in (params or {}).items() if value is not None}
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                return await self._send(method, url, query, payload)
+            except SpotifyException as e:
+                if attempt >= self.max_retries or not is_retryable_status(e.http_status):
+                    raise
+                if e.http_status == RATE_LIMITED_STATUS:
+                    delay = get_retry_after(e.headers) or get_backoff(attempt, self.backoff_factor, self.backoff_max)
+                    self.rate_limiter.block_for(delay)
+                    delay = 0
+                else:
+                    delay = get_backoff(attempt, self.backoff_factor, self.backoff_max)
+                status = e.http_status
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries or not (method in READ_ONLY_METHODS or is_connect_error(e)):
+                    raise
+                delay = get_backoff(attempt, self.backoff_factor, self.backoff_max)
+                status = None
+            attempt += 1
+            logger.warning(f"Retrying {method} to {url} (attempt {attempt} of {self.max_retries}, status {status})")
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _acquire(self):
+        while True:
+            wait = self.rate_limiter.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def _send(self, method: str, url: str, query: Dict[str, Any], payload: Any) -> Any:
+        headers = await self._auth_headers()
+        async with self._get_session().request(method, url, params=query, json=payload,
+                                               headers=headers) as response:
+            body = await response.text()
+            if response.status >= 400:
+                try:
+                    message = json.loads(body)["error"]["message"]
+                except (ValueError, KeyError, TypeError):
+                    message = body or "error"
+                raise SpotifyException(response.status, -1, f"{url}:\n {message}", headers=dict(response.headers))
+            return json.loads(body) if body else None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        # Created on first use so that it belongs to the running event loop
+        if self.session is None:
+            connect_timeout, read_timeout = self.requests_timeout
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            )
+        return self.session
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        async with self.token_lock:
+            if not self.auth_header or self.auth_expires_at - TOKEN_EXPIRY_MARGIN < time.time():
+                # The auth manager may read the token cache file or refresh the token over HTTP
+                token = await asyncio.to_thread(self.auth_manager.get_access_token, as_dict=False)
+                self.auth_header = {"Authorization": f"Bearer {token}"}
+                self.auth_expires_at = self._get_token_expiry()
+            return self.auth_header
+
+    def _get_token_expiry(self) -> float:
+        """Returns when the cached access token expires, or zero if that is unknown."""
+        cache_handler = getattr(self.auth_manager, "cache_handler", None)
+        if not cache_handler:
+            return 0
+        token_info = cache_handler.get_cached_token()
+        return token_info.get("expires_at", 0) if token_info else 0
+
+
+class AsyncPlaylists:
+
+    def __init__(self, spotify: AsyncSpotify, config: Dict | None = None):
+        """The asyncio counterpart of Playlists. Independent reads run concurrently, bounded by the
+        client's per-host connection limit rather than by a pool of threads, and every operation
+        waits for the tasks it starts before it returns.
+
+        :param spotify: The asyncio Spotify client.
+        :param config: The configuration for the playlists class.
+        """
+        self.spotify = spotify
+        self.config = process_config(config)
+        self.logger = logging.getLogger(__name__)
+
+        # Memos of account data, cleared whenever we create or modify a playlist
+        self._memo_lock = asyncio.Lock()
+        self._all_playlists: List[Dict] | None = None
+        self._me: Dict | None = None
+        self._playlist_index: PlaylistIndex | None = None
+        # Concurrent reads of the same playlist share one fetch, forgotten once it finishes
+        self._track_reads: Dict[Tuple[str, FetchProfile], asyncio.Future] = {}
+        # The number of readers waiting on each fetch still in progress
+        self._track_readers: Dict[asyncio.Future, int] = {}
+
+    async def get_all_playlists(self) -> List[Dict]:
+        """Returns every playlist the current user owns or follows. The listing is fetched once and
+        reused until this instance creates or modifies a playlist."""
+        async with self._memo_lock:
+            if self._all_playlists is None:
+                self._all_playlists = await get_all_items(
+                    await self.spotify.current_user_playlists(limit=PLAYLISTS_PAGE_LIMIT),
+                    lambda offset: self.spotify.current_user_playlists(limit=PLAYLISTS_PAGE_LIMIT, offset=offset),
+                )
+            return list(self._all_playlists)
+
+    async def list_all_playlists(self, sort_fields=None, filters=None, limit: int | None = None) -> List[Dict]:
+        return get_listing_rows(await self.get_all_playlists(), sort_fields, filters, limit=limit)
+
+    async def append_daily_mix(self, randomize: bool, target_name: str | None):
+        """Appends the tracks of the "daily mix" playlists to the target list, leaving out any found in
+        the "exclude" playlists or already in the target. The mixes and exclude lists are read
+        concurrently.
+
+        :param randomize: Whether to randomize the "daily mix" tracks before appending them.
+        :param target_name: The name of the list to append to or create. The configured
+          list at 'daily_mix_target' is used if no name is provided here.
+        """
+        # The processed config always has a default target
+        daily_mix_target = target_name or self.config["daily_mix_target"]
+
+        playlist_index = await self._get_playlist_index()
+        dailies = playlist_index.with_prefix(*get_config_prefixes(self.config, "daily_mix_prefix"))
+        daily_ids = {daily["id"] for daily in dailies}
+        target_list = next((playlist for playlist in playlist_index.find_names(daily_mix_target)
+                            if playlist["id"] not in daily_ids), None)
+        exclude_lists = get_exclude_lists(self.config, playlist_index, daily_ids, target_list)
+
+        if not target_list:
+            target_list = await self._create_playlist(daily_mix_target)
+
+        if not dailies:
+            self.logger.warning(f"No daily mixes found with the prefix(es) "
+                                f"{get_config_prefixes(self.config, 'daily_mix_prefix')}")
+            return
+
+        # The exclude lists and the mixes are all read at once
+        contributors = [target_list, *exclude_lists]
+        track_lists = await gather_all(self._get_tracks(playlist["id"], FetchProfile.TRACK_IDS)
+                                       for playlist in [*contributors, *dailies])
+        exclude_ids = TrackIdSet(track.id for track in chain.from_iterable(track_lists[:len(contributors)]))
+        daily_tracks = track_lists[len(contributors):]
+
+        orig_daily_count = sum(len(tracks) for tracks in daily_tracks)
+        add_ids = dedupe(track.id for track in chain.from_iterable(daily_tracks) if track.id not in exclude_ids)
+        self.logger.info(f"{len(add_ids)} to add from an original count of {orig_daily_count}")
+        if not add_ids:
+            self.logger.warning("No daily songs to add")
+            return
+
+        if randomize:
+            random.shuffle(add_ids)
+        await self._append(target_list["id"], add_ids)
+
+    async def append_recent_subscriptions(self, randomize: bool, target_name: str | None):
+        """Appends tracks added to the configured subscription playlists since the configured maximum
+        age to the target list, leaving out any already in the target or the exclude playlists. Each
+        subscribed playlist is read once, in full, and all of them concurrently.
+
+        :param randomize: Whether to randomize the new tracks before appending them.
+        :param target_name: The target list to append to. The configured target list at
+          'subscriptions_target' is used if no name is provided here.
+        """
+        # The processed config always has a default target
+        subscriptions_target = target_name or self.config["subscriptions_target"]
+
+        playlist_index = await self._get_playlist_index()
+        target_list = playlist_index.find_name(subscriptions_target)
+        exclude_lists = get_exclude_lists(self.config, playlist_index, set(), target_list)
+        oldest_added_at = to_added_at(get_oldest_timestamp(self.config))
+
+        if not target_list:
+            target_list = await self._create_playlist(subscriptions_target)
+
+        subscription_playlists = self.config.get("playlists")
+        if not subscription_playlists:
+            self.logger.warning("No subscription playlists defined")
+            return
+
+        unique_playlist_ids = list(dict.fromkeys(chain.from_iterable(subscription_playlists.values())))
+        # The exclude lists and the subscribed playlists are all read at once
+        contributor_ids = [playlist["id"] for playlist in [target_list, *exclude_lists]]
+        track_lists = await gather_all(
+            [self._get_tracks(playlist_id, FetchProfile.TRACK_IDS) for playlist_id in contributor_ids]
+            + [self._get_tracks(playlist_id, FetchProfile.ADDED_TRACK_IDS) for playlist_id in unique_playlist_ids])
+        exclude_ids = TrackIdSet(track.id for track in chain.from_iterable(track_lists[:len(contributor_ids)]))
+        subscription_tracks = track_lists[len(contributor_ids):]
+
+        include_zero_timestamps = self.config.get("include_zero_timestamps", False)
+        add_ids = dedupe(track.id for track in chain.from_iterable(subscription_tracks)
+                         if track.added_at is not None and track.id not in exclude_ids
+                         and (track.added_at >= oldest_added_at
+                              or (include_zero_timestamps and track.added_at == ZERO_EPOCH)))
+        self.logger.info(f"{len(add_ids)} subscription tracks to add")
+
+        if randomize:
+            random.shuffle(add_ids)
+        await self._append(target_list["id"], add_ids)
+
+    async def randomize_playlist(self, playlist: Dict[str, Any]) -> PlaylistResult:
+        """Randomizes the tracks in the given playlist.
+
+        :param playlist: The playlist to randomize.
+        :return: The result of the randomization attempt.
+        """
+        try:
+            playlist_tracks = await self._get_tracks(playlist["id"], FetchProfile.TRACK_IDS)
+            await self._replace(playlist["id"], [track.id for track in shuffled(playlist_tracks)])
+            return PlaylistResult.SUCCESS
+        except Exception:
+            self.logger.warning(f"Problems randomizing playlist '{playlist['name']}'", exc_info=True)
+            return PlaylistResult.FAILURE
+
+    async def randomize_playlists(self, playlists: List[str]) -> Dict[str, PlaylistResult]:
+        """Replaces the tracks in the target lists with a randomized version of the same tracks. The
+        playlists are randomized concurrently.
+
+        :param playlists: A list of playlist names and/or IDs.
+        :return: The results of the randomizing.
+        """
+        targets, missing_targets = find_playlists(await self._get_playlist_index(), playlists)
+
+        results = dict(zip(targets.keys(), await gather_all(self.randomize_playlist(playlist)
+                                                            for playlist in targets.values())))
+        for missing_target in missing_targets:
+            results[missing_target] = PlaylistResult.NOT_FOUND
+        return results
+
+    async def copy_list(self, arguments: List[str], randomize: bool) -> Tuple[PlaylistResult, str | None]:
+        """Copies the named playlist into a new playlist.
+
+        :param arguments: The name of the playlist to copy, optionally followed by the destination name.
+        :param randomize: Whether to randomize the order of the copied tracks.
+        :return: The result and the destination name.
+        """
+        try:
+            source_name = arguments[0]
+            playlist_index = await self._get_playlist_index()
+            if len(arguments) < 2:
+                dest_name = create_unique_dest_name(playlist_index, source_name)
+            else:
+                dest_name = arguments[1]
+
+            source = playlist_index.find_name(source_name, ignore_case=True)
+            if not source:
+                self.logger.warning(f"No playlist found for name '{source_name}'")
+                return PlaylistResult.NOT_FOUND, None
+
+            tracks_to_copy = await self._get_tracks(source["id"], FetchProfile.TRACK_IDS)
+            new_playlist = await self._create_playlist(dest_name)
+
+            track_ids = [track.id for track in tracks_to_copy]
+            if randomize:
+                random.shuffle(track_ids)
+            await self._append(new_playlist["id"], track_ids)
+            return PlaylistResult.SUCCESS, dest_name
+        except Exception:
+            self.logger.warning("Problems copying list", exc_info=True)
+            return PlaylistResult.FAILURE, None
+
+    # ===Internal Methods=== #
+
+    async def _get_playlist_index(self) -> PlaylistIndex:
+        """Returns an index over the playlist listing, built once per listing."""
+        all_playlists = await self.get_all_playlists()
+        async with self._memo_lock:
+            if self._playlist_index is None:
+                self._playlist_index = PlaylistIndex(all_playlists)
+            return self._playlist_index
+
+    async def _get_me(self) -> Dict:
+        async with self._memo_lock:
+            if self._me is None:
+                self._me = await self.spotify.me()
+            return self._me
+
+    async def _create_playlist(self, name: str) -> Dict:
+        """Creates a private playlist with the given name for the current user."""
+        me = await self._get_me()
+        new_playlist = await self.spotify.user_playlist_create(me["id"], name, public=False)
+        self._invalidate_playlists()
+        return new_playlist
+
+    async def _get_tracks(self, playlist_id: str, profile: FetchProfile) -> List[TrackRef]:
+        """Returns references to the playlist's valid tracks. Concurrent reads of the same playlist
+        share a single fetch, which is cancelled once every reader waiting on it is. Reads after the
+        fetch finishes fetch the playlist again, as it may have changed."""
+        key = (playlist_id, profile)
+        read = self._track_reads.get(key)
+        if read is None:
+            read = asyncio.ensure_future(self._fetch_tracks(playlist_id, profile))
+            read.add_done_callback(lambda done: self._forget_read(key, done))
+            self._track_reads[key] = read
+        self._track_readers[read] = self._track_readers.get(read, 0) + 1
+        try:
+            # Shielded so that one reader being cancelled does not cancel the fetch for the others
+            return list(await asyncio.shield(read))
+        except BaseException:
+            if read.done() or self._track_readers[read] == 1:
+                # Either the fetch failed or no one else is waiting for it
+                read.cancel()
+                self._forget_read(key, read)
+            raise
+        finally:
+            readers = self._track_readers.pop(read) - 1
+            if readers:
+                self._track_readers[read] = readers
+
+    def _forget_read(self, key: Tuple[str, FetchProfile], read: asyncio.Future):
+        if self._track_reads.get(key) is read:
+            del self._track_reads[key]
+
+    async def _fetch_tracks(self, playlist_id: str, profile: FetchProfile) -> List[TrackRef]:
+        return await get_all_items(
+            await self.spotify.playlist_items(playlist_id, fields=profile.fields, limit=PLAYLIST_ITEMS_PAGE_LIMIT),
+            lambda offset: self.spotify.playlist_items(playlist_id, fields=profile.fields,
+                                                       limit=PLAYLIST_ITEMS_PAGE_LIMIT, offset=offset),
+            TrackRef.from_item,
+        )
+
+    async def _append(self, playlist_id: str, track_ids: Iterable[str]):
+        """Appends the given tracks in order, one batch after another, skipping repeats."""
+        try:
+            for id_batch in batched(iter_unique(track_ids), WRITE_BATCH_SIZE):
+                await self.spotify.playlist_add_items(playlist_id, id_batch)
+                self.logger.debug(f"Batch size: {len(id_batch)}")
+        finally:
+            self._invalidate_playlist(playlist_id)
+
+    async def _replace(self, playlist_id: str, track_ids: Iterable[str]):
+        """Makes the given tracks the playlist's only contents."""
+        try:
+            id_batches = list(batched(iter_unique(track_ids), WRITE_BATCH_SIZE)) or [[]]
+            await self.spotify.playlist_replace_items(playlist_id, id_batches[0])
+            for id_batch in id_batches[1:]:
+                await self.spotify.playlist_add_items(playlist_id, id_batch)
+        finally:
+            self._invalidate_playlist(playlist_id)
+
+    def _invalidate_playlists(self):
+        """Drops the memoized playlist listing and the index built from it."""
+        self._all_playlists = None
+        self._playlist_index = None
+
+    def _invalidate_playlist(self, playlist_id: str):
+        """Drops what has been read of a playlist that this instance has just modified."""
+        for key in [key for key in self._track_reads if key[0] == playlist_id]:
+            del self._track_reads[key]
+        self._invalidate_playlists()
+
+
+async def gather_all(aws: Iterable[Awaitable[T]]) -> List[T]:
+    """Runs the given awaitables concurrently and returns their results in order. If one fails, the
+    others are cancelled and waited for before the error is raised, so no task outlives the call."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def get_all_items(first_page: Dict[str, Any], page_fetcher: Callable[[int], Awaitable[Dict[str, Any]]],
+                        transform: Callable[[Any], Any] | None = None) -> List:
+    """Returns the items from the first page of a result set and every page after it. The remaining
+    pages are fetched concurrently and their items returned in order.
+
+    :param first_page: The first page of results.
+    :param page_fetcher: Fetches the page at the given offset.
+    :param transform: An optional function applied to each item as its page arrives. Items it
+      returns None for are dropped.
+    :return: The items of every page.
+    """
+    pages = [first_page, *await gather_all(page_fetcher(offset) for offset in get_page_offsets(first_page))]
+    return list(chain.from_iterable(convert_items(page["items"], transform) for page in pages if page))
+
+
+def is_connect_error(error: Exception) -> bool:
+    """Returns whether a request failed while connecting, before the server could have received it."""
+    return isinstance(error, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError))
+
+
+def get_track_uris(track_ids: Iterable[str]) -> List[str]:
+    """Returns the Spotify URIs for the given track IDs. Values that are already URIs are kept as-is."""
+    return [track_id if track_id.startswith("spotify:") else f"spotify:track:{track_id}" for track_id in track_ids]
+
+
+def get_async_spotify_handle(config: Dict[str, Dict[str, Any]]) -> AsyncSpotify:
+    """Returns an AsyncSpotify client for the given config, sharing the auth cache and the '[spotify]'
+    request settings with get_spotify_handle."""
+    spotify_cfg = config.get("spotify")
+    if not spotify_cfg:
+        raise Exception("No Spotify config defined")
+    settings = get_client_settings(spotify_cfg)
+    # Connections are pooled by the aiohttp connector rather than per thread
+    del settings["session_pool"]
+    return AsyncSpotify(get_auth_manager(spotify_cfg), **settings)
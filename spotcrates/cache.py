@@ -0,0 +1,411 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Iterable, Tuple, Callable, TypeVar
+
+from spotcrates.common import DEFAULT_CACHE_DIR, FetchProfile
+from spotcrates.filters import FieldName
+from spotcrates.index import TrigramIndex
+from spotcrates.tracks import TrackRef, TrackIdSet, parse_added_at, format_added_at
+
+DEFAULT_PLAYLIST_CACHE_DIR = Path(DEFAULT_CACHE_DIR, "playlists")
+DEFAULT_EXCLUSION_INDEX_FILE = Path(DEFAULT_CACHE_DIR, "exclusions.json")
+DEFAULT_SUBSCRIPTION_STATE_FILE = Path(DEFAULT_CACHE_DIR, "subscriptions.json")
+DEFAULT_LISTING_INDEX_FILE = Path(DEFAULT_CACHE_DIR, "listing_index.bin")
+DEFAULT_CACHE_MAX_SIZE_MB = 100
+CACHE_ENTRY_SUFFIX = ".json"
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class PlaylistCache:
+
+    def __init__(self, cache_dir: Path | str = DEFAULT_PLAYLIST_CACHE_DIR,
+                 max_bytes: int = DEFAULT_CACHE_MAX_SIZE_MB * 1024 * 1024):
+        """An on-disk cache of playlist contents keyed by playlist ID and snapshot ID. Since
+        Spotify issues a new snapshot ID whenever a playlist changes, a cached entry never goes
+        stale; superseded snapshots are dropped when a newer one is stored. The least recently
+        used entries are evicted once the cache grows past its size budget.
+
+        :param cache_dir: The directory holding the cache entries.
+        :param max_bytes: The size budget for all cache entries.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # The size of each entry, least recently used first, read from the cache directory on the first put
+        self._entries: OrderedDict[Path, int] | None = None
+        self._total_bytes = 0
+
+    def get(self, playlist_id: str, snapshot_id: str, profile: FetchProfile) -> List[TrackRef] | None:
+        """Returns the cached tracks for the given playlist snapshot, or None if there are none.
+
+        :param playlist_id: The ID of the playlist.
+        :param snapshot_id: The playlist's current snapshot ID.
+        :param profile: The fetch profile the tracks were read with.
+        :return: The cached tracks or None on a cache miss.
+        """
+        entry_path = self._entry_path(playlist_id, snapshot_id, profile)
+        tracks = _load_json(entry_path, lambda rows: [TrackRef.from_row(row) for row in rows], "cache entry")
+        if tracks is None:
+            return None
+        try:
+            # Touch the entry so that eviction sees it as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Evicted by another process since it was read
+            pass
+
+        with self.lock:
+            if self._entries is not None and entry_path in self._entries:
+                self._entries.move_to_end(entry_path)
+
+        self.logger.debug(f"Cache hit for playlist {playlist_id} ({len(tracks)} tracks)")
+        return tracks
+
+    def put(self, playlist_id: str, snapshot_id: str, profile: FetchProfile, tracks: List[TrackRef]):
+        """Stores the tracks for the given playlist snapshot, replacing any earlier snapshot of the
+        same playlist and evicting old entries if the cache is over budget.
+
+        :param playlist_id: The ID of the playlist.
+        :param snapshot_id: The playlist's snapshot ID when the tracks were read.
+        :param profile: The fetch profile the tracks were read with.
+        :param tracks: The tracks to store.
+        """
+        entry_path = self._entry_path(playlist_id, snapshot_id, profile)
+        with self.lock:
+            try:
+                entry_size = _write_json_atomic(entry_path, [track.to_row() for track in tracks])
+            except Exception:
+                self.logger.warning(f"Problems writing cache entry {entry_path}", exc_info=True)
+                return
+
+            entries = self._get_entries()
+            stale_prefix = f"{playlist_id}.{profile.name.lower()}."
+            for stale_path in [path for path in entries if path.name.startswith(stale_prefix)]:
+                if stale_path != entry_path:
+                    stale_path.unlink(missing_ok=True)
+                self._total_bytes -= entries.pop(stale_path)
+            entries[entry_path] = entry_size
+            self._total_bytes += entry_size
+
+            self._evict()
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self.lock:
+            for entry_path in self.cache_dir.glob(f"*{CACHE_ENTRY_SUFFIX}"):
+                entry_path.unlink(missing_ok=True)
+            self._entries = None
+            self._total_bytes = 0
+
+    def _entry_path(self, playlist_id: str, snapshot_id: str, profile: FetchProfile) -> Path:
+        # Snapshot IDs are base64 and may contain path separators
+        snapshot_digest = hashlib.sha1(snapshot_id.encode("utf-8")).hexdigest()
+        return Path(self.cache_dir, f"{playlist_id}.{profile.name.lower()}.{snapshot_digest}{CACHE_ENTRY_SUFFIX}")
+
+    def _get_entries(self) -> OrderedDict[Path, int]:
+        """Returns the tracked entry sizes, scanning the cache directory the first time."""
+        if self._entries is None:
+            found = []
+            for entry_path in self.cache_dir.glob(f"*{CACHE_ENTRY_SUFFIX}"):
+                try:
+                    entry_stat = entry_path.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+            self._entries = OrderedDict((entry_path, entry_size) for _, entry_size, entry_path in sorted(found))
+            self._total_bytes = sum(self._entries.values())
+        return self._entries
+
+    def _evict(self):
+        entries = self._get_entries()
+        while self._total_bytes > self.max_bytes and entries:
+            entry_path, entry_size = entries.popitem(last=False)
+            entry_path.unlink(missing_ok=True)
+            self._total_bytes -= entry_size
+            self.logger.debug(f"Evicted cache entry {entry_path}")
+
+
+class ExclusionIndex:
+
+    def __init__(self, index_file: Path | str = DEFAULT_EXCLUSION_INDEX_FILE):
+        """A persistent index of the track IDs in the playlists whose tracks are excluded from the daily mix
+        and subscription targets. Each playlist's IDs are stored with the snapshot ID they were read
+        from, so only the playlists that have changed since the last run are read again.
+
+        :param index_file: The file holding the index.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.index_file = Path(index_file)
+        self.lock = threading.Lock()
+        self._entries: Dict[str, Tuple[str, TrackIdSet]] | None = None
+
+    def get_ids(self, playlists: Iterable[Tuple[str, str | None]],
+                loader: Callable[[str, str | None], Iterable[str]]) -> TrackIdSet:
+        """Returns the IDs of every track in the given playlists, reading only the playlists whose
+        snapshot ID differs from the indexed one.
+
+        :param playlists: The (playlist ID, snapshot ID) of each contributing playlist. Playlists
+          without a snapshot ID are always read and are not indexed.
+        :param loader: A callable returning the track IDs for the given playlist and snapshot IDs.
+        :return: The union of the track IDs in the given playlists.
+        """
+        with self.lock:
+            entries = self._get_entries()
+            id_sets = []
+            changed = False
+            for playlist_id, snapshot_id in playlists:
+                entry = entries.get(playlist_id)
+                if snapshot_id and entry and entry[0] == snapshot_id:
+                    id_sets.append(entry[1])
+                    continue
+
+                playlist_ids = loader(playlist_id, snapshot_id)
+                if not isinstance(playlist_ids, TrackIdSet):
+                    playlist_ids = TrackIdSet(playlist_ids)
+                id_sets.append(playlist_ids)
+                if snapshot_id:
+                    entries[playlist_id] = (snapshot_id, playlist_ids)
+                    changed = True
+                    self.logger.debug(f"Indexed {len(playlist_ids)} tracks for playlist {playlist_id}")
+
+            if changed:
+                self._save(entries)
+            return TrackIdSet().union(*id_sets)
+
+    def add_ids(self, playlist_id: str, snapshot_id: str | None, new_snapshot_id: str | None,
+                track_ids: Iterable[str]):
+        """Records tracks appended to an indexed playlist so that the change need not be read back.
+        Nothing is recorded unless the index holds the playlist as of the snapshot the tracks were
+        appended to.
+
+        :param playlist_id: The ID of the playlist the tracks were added to.
+        :param snapshot_id: The playlist's snapshot ID before the tracks were added.
+        :param new_snapshot_id: The playlist's snapshot ID after the tracks were added.
+        :param track_ids: The IDs of the added tracks.
+        """
+        if not snapshot_id or not new_snapshot_id:
+            return
+        with self.lock:
+            entries = self._get_entries()
+            entry = entries.get(playlist_id)
+            if not entry or entry[0] != snapshot_id:
+                return
+            entries[playlist_id] = (new_snapshot_id, entry[1].union(track_ids))
+            self._save(entries)
+
+    def _get_entries(self) -> Dict[str, Tuple[str, TrackIdSet]]:
+        if self._entries is None:
+            self._entries = _load_json(self.index_file, lambda rows: {
+                playlist_id: (entry["snapshot_id"], TrackIdSet.from_row(entry["ids"]))
+                for playlist_id, entry in rows.items()}, "exclusion index") or {}
+        return self._entries
+
+    def _save(self, entries: Dict[str, Tuple[str, TrackIdSet]]):
+        try:
+            _write_json_atomic(self.index_file, {playlist_id: {"snapshot_id": snapshot_id, "ids": track_ids.to_row()}
+                                                 for playlist_id, (snapshot_id, track_ids) in entries.items()})
+        except Exception:
+            self.logger.warning(f"Problems writing exclusion index {self.index_file}", exc_info=True)
+
+
+class HighWaterMark:
+    """What a subscriptions run last saw of a subscribed playlist for a target playlist."""
+
+    __slots__ = ("snapshot_id", "total", "newest_added_at", "oldest_added_at")
+
+    def __init__(self, snapshot_id: str, total: int | None = None, newest_added_at: int | None = None,
+                 oldest_added_at: int | None = None):
+        self.snapshot_id = snapshot_id
+        self.total = total
+        self.newest_added_at = newest_added_at
+        # The cutoff the tracks were read back to: tracks added before it were never considered
+        self.oldest_added_at = oldest_added_at
+
+    def covers(self, oldest_added_at: int) -> bool:
+        """Returns whether the tracks added since the given cutoff were all considered when this mark was
+        made, i.e. whether the mark's cutoff is no later."""
+        return self.oldest_added_at is not None and self.oldest_added_at <= oldest_added_at
+
+    def to_row(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable representation of this mark."""
+        return {"snapshot_id": self.snapshot_id, "total": self.total,
+                "newest_added_at": format_added_at(self.newest_added_at),
+                "oldest_added_at": format_added_at(self.oldest_added_at)}
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "HighWaterMark":
+        """Creates a mark from the output of to_row."""
+        return cls(row["snapshot_id"], row.get("total"), parse_added_at(row.get("newest_added_at")),
+                   parse_added_at(row.get("oldest_added_at")))
+
+    def __eq__(self, other):
+        if isinstance(other, HighWaterMark):
+            return (self.snapshot_id, self.total, self.newest_added_at, self.oldest_added_at) == \
+                (other.snapshot_id, other.total, other.newest_added_at, other.oldest_added_at)
+        return NotImplemented
+
+
+class SubscriptionState:
+
+    def __init__(self, state_file: Path | str = DEFAULT_SUBSCRIPTION_STATE_FILE):
+        """The high-water marks of the subscribed playlists as of the last subscriptions run to each target
+        playlist. A playlist whose snapshot ID is unchanged can be skipped if its mark covers the current
+        cutoff, and a changed one need only be read back to its newest previously seen track. Updated marks
+        are held in memory until saved.
+
+        :param state_file: The file holding the state.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.state_file = Path(state_file)
+        self.lock = threading.Lock()
+        self._marks: Dict[str, Dict[str, HighWaterMark]] | None = None
+
+    def get(self, target_id: str, playlist_id: str) -> HighWaterMark | None:
+        """Returns the mark recorded for the given subscribed playlist and target, if any."""
+        with self.lock:
+            return self._get_marks().get(target_id, {}).get(playlist_id)
+
+    def set(self, target_id: str, playlist_id: str, mark: HighWaterMark):
+        """Records a new mark for the given subscribed playlist and target. The mark is not persisted until
+        saved."""
+        with self.lock:
+            self._get_marks().setdefault(target_id, {})[playlist_id] = mark
+
+    def save(self):
+        """Writes the recorded marks to the state file."""
+        with self.lock:
+            marks = self._get_marks()
+            try:
+                _write_json_atomic(self.state_file, {
+                    target_id: {playlist_id: mark.to_row() for playlist_id, mark in target_marks.items()}
+                    for target_id, target_marks in marks.items()})
+            except Exception:
+                self.logger.warning(f"Problems writing subscription state {self.state_file}", exc_info=True)
+
+    def _get_marks(self) -> Dict[str, Dict[str, HighWaterMark]]:
+        if self._marks is None:
+            self._marks = _load_json(self.state_file, lambda rows: {
+                target_id: {playlist_id: HighWaterMark.from_row(row) for playlist_id, row in target_rows.items()}
+                for target_id, target_rows in rows.items()}, "subscription state") or {}
+        return self._marks
+
+
+class ListingIndex:
+
+    def __init__(self, index_file: Path | str = DEFAULT_LISTING_INDEX_FILE):
+        """A persistent trigram index of the playlist listing used to narrow 'list-playlists' filters.
+        Only the playlists that are new or have a new snapshot since the last run are indexed again.
+
+        :param index_file: The file holding the index.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.index_file = Path(index_file)
+        self.lock = threading.Lock()
+        self._index: TrigramIndex | None = None
+
+    def get_index(self, rows: List[Dict[FieldName, Any]], versions: List[str | None] | None = None) -> TrigramIndex:
+        """Returns the index updated with the given listing rows, saving it if anything changed.
+
+        :param rows: The complete playlist listing, as from Playlists.list_all_playlists.
+        :param versions: The snapshot ID of each row's playlist, if known.
+        :return: The index of the given rows.
+        """
+        with self.lock:
+            index = self._get_index()
+            if index.update(rows, versions):
+                self.logger.debug(f"Updated the listing index ({len(index)} playlists)")
+                self._save(index)
+            return index
+
+    def _get_index(self) -> TrigramIndex:
+        if self._index is None:
+            index = _load_file(self.index_file, TrigramIndex.from_bytes, "listing index")
+            # Not "or": an index's truth value is its length, which would decode the whole index
+            self._index = TrigramIndex() if index is None else index
+        return self._index
+
+    def _save(self, index: TrigramIndex):
+        try:
+            _write_atomic(self.index_file, index.to_bytes())
+        except Exception:
+            self.logger.warning(f"Problems writing listing index {self.index_file}", exc_info=True)
+
+
+def _write_atomic(path: Path, content: bytes) -> int:
+    """Writes the content to a temporary file beside the given one, then moves it into place, so that readers
+    never see a partly written file.
+
+    :return: The number of bytes written.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    with open(temp_path, "wb") as temp_handle:
+        temp_handle.write(content)
+    os.replace(temp_path, path)
+    return len(content)
+
+
+def _write_json_atomic(path: Path, data: Any) -> int:
+    """Writes the data as compact JSON with _write_atomic, returning the number of bytes written."""
+    return _write_atomic(path, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def _load_file(path: Path, parse: Callable[[bytes], T], description: str) -> T | None:
+    """Returns the parsed content of the given file, or None if it is missing or cannot be parsed.
+
+    :param path: The file to read.
+    :param parse: Creates the result from the file's content.
+    :param description: What the file holds, for the warning logged when it cannot be read.
+    """
+    try:
+        with open(path, "rb") as file_handle:
+            return parse(file_handle.read())
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning(f"Problems reading {description} {path}", exc_info=True)
+        return None
+
+
+def _load_json(path: Path, parse: Callable[[Any], T], description: str) -> T | None:
+    """Returns the parsed content of the given JSON file, or None if it is missing or cannot be parsed. See
+    _load_file."""
+    return _load_file(path, lambda content: parse(json.loads(content)), description)
+
+
+def get_playlist_cache(config: Dict[str, Dict[str, Any]]) -> PlaylistCache:
+    """Creates a playlist cache from the '[cache]' section of the given config."""
+    cache_cfg = config.get("cache") or {}
+    cache_dir = cache_cfg.get("cache_dir", DEFAULT_PLAYLIST_CACHE_DIR)
+    max_size_mb = cache_cfg.get("max_size_mb", DEFAULT_CACHE_MAX_SIZE_MB)
+    return PlaylistCache(cache_dir, int(max_size_mb * 1024 * 1024))
+
+
+def get_exclusion_index(config: Dict[str, Dict[str, Any]]) -> ExclusionIndex:
+    """Creates an exclusion index from the '[cache]' section of the given config."""
+    cache_cfg = config.get("cache") or {}
+    return ExclusionIndex(cache_cfg.get("exclusion_index", DEFAULT_EXCLUSION_INDEX_FILE))
+
+
+def get_subscription_state(config: Dict[str, Dict[str, Any]]) -> SubscriptionState:
+    """Creates a subscription state store from the '[cache]' section of the given config."""
+    cache_cfg = config.get("cache") or {}
+    return SubscriptionState(cache_cfg.get("subscription_state", DEFAULT_SUBSCRIPTION_STATE_FILE))
+
+
+def get_listing_index(config: Dict[str, Dict[str, Any]]) -> ListingIndex | None:
+    """Creates a listing index from the '[cache]' section of the given config, or returns None unless
+    the index is enabled with 'use_listing_index'."""
+    cache_cfg = config.get("cache") or {}
+    if not cache_cfg.get("use_listing_index", False):
+        return None
+    return ListingIndex(cache_cfg.get("listing_index", DEFAULT_LISTING_INDEX_FILE))
@@ -7,11 +7,12 @@ CLI runner for Spotify automation.
 import argparse
 import logging
 import sys
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, TypeVar
 
 import pygtrie
 import tomli_w
 
+from spotcrates.cache import get_playlist_cache, get_exclusion_index, get_subscription_state, get_listing_index
 from spotcrates.common import BaseLookup, truncate_long_value, get_spotify_handle, DEFAULT_CONFIG_FILE, get_config
 from spotcrates.filters import FieldName
 
@@ -31,12 +32,15 @@ logging.getLogger('urllib3').setLevel(logging.INFO)
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 COMMANDS = ["copy", "commands", "daily", "init-config", "list-playlists", "randomize", "subscriptions"]
 
 COMMAND_DESCRIPTION = f"""
 {'COMMAND NAME':<16} DESCRIPTION
 {'commands':<16} Prints this command list.
-{'copy':<16} Copies a playlist into a new playlist. You may optionally specify a destination playlist name.
+{'copy':<16} Copies a playlist into a new playlist. You may optionally specify a destination playlist name,
+{'':<16} or copy several playlists at once with --multiple.
 {'daily':<16} Add "Daily Mix" entries to the end of the target playlist, filtering for excluded entries.
 {'init-config':<16} Initializes the configuration file. Uses the --config_file location as the target. Will not overwrite.
 {'list-playlists':<16} Prints a table describing your playlists.
@@ -53,26 +57,36 @@ def print_commands():
     print(COMMAND_DESCRIPTION)
 
 
-def append_daily_mix(config: Dict[str, Any], args: argparse.Namespace):
-    sp = get_spotify_handle(config)
+def get_cache_store(factory: Callable[[Dict[str, Any]], T], config: Dict[str, Any],
+                    args: argparse.Namespace) -> T | None:
+    """Returns the cache store the given factory creates from the config, e.g. get_playlist_cache, unless
+    caching has been disabled."""
+    if args.no_cache:
+        return None
+    return factory(config)
 
-    playlists = Playlists(sp, config.get("playlists"))
-    playlists.append_daily_mix(args.randomize, args.target)
 
+def append_daily_mix(config: Dict[str, Any], args: argparse.Namespace):
+    with get_spotify_handle(config) as sp:
+        playlists = Playlists(sp, config.get("playlists"), get_cache_store(get_playlist_cache, config, args),
+                              get_cache_store(get_exclusion_index, config, args))
+        playlists.append_daily_mix(args.randomize, args.target)
 
-def append_recent_subscriptions(config: Dict[str, Any], args: argparse.Namespace):
-    sp = get_spotify_handle(config)
 
-    playlists = Playlists(sp, config.get("subscriptions"))
-    playlists.append_recent_subscriptions(args.randomize, args.target)
+def append_recent_subscriptions(config: Dict[str, Any], args: argparse.Namespace):
+    with get_spotify_handle(config) as sp:
+        playlists = Playlists(sp, config.get("subscriptions"), get_cache_store(get_playlist_cache, config, args),
+                              get_cache_store(get_exclusion_index, config, args),
+                              get_cache_store(get_subscription_state, config, args))
+        playlists.append_recent_subscriptions(args.randomize, args.target)
 
 
 def randomize_lists(config: Dict[str, Any], args: argparse.Namespace):
     arguments = args.arguments
     if arguments:
-        sp = get_spotify_handle(config)
-        playlists = Playlists(sp, config.get("playlists"))
-        results = playlists.randomize_playlists(arguments)
+        with get_spotify_handle(config) as sp:
+            playlists = Playlists(sp, config.get("playlists"), get_cache_store(get_playlist_cache, config, args))
+            results = playlists.randomize_playlists(arguments)
 
         for item, result in results.items():
             print(f"{item}: {result.label}")
@@ -84,14 +98,18 @@ def randomize_lists(config: Dict[str, Any], args: argparse.Namespace):
 def copy_list(config: Dict[str, Any], args: argparse.Namespace):
     arguments = args.arguments
     if arguments:
-        sp = get_spotify_handle(config)
-        playlists = Playlists(sp, config.get("playlists"))
-        result, copy_name = playlists.copy_list(arguments, args.randomize)
-
-        if PlaylistResult.SUCCESS == result:
-            print(f"Successfully copied {arguments[0]} to {copy_name}")
-        else:
-            logger.warning(f"Problems copying {arguments[0]}")
+        with get_spotify_handle(config) as sp:
+            playlists = Playlists(sp, config.get("playlists"), get_cache_store(get_playlist_cache, config, args))
+            if args.multiple:
+                results = playlists.copy_lists(arguments, args.randomize)
+            else:
+                results = {arguments[0]: playlists.copy_list(arguments, args.randomize)}
+
+        for source_name, (result, copy_name) in results.items():
+            if PlaylistResult.SUCCESS == result:
+                print(f"Successfully copied {source_name} to {copy_name}")
+            else:
+                logger.warning(f"Problems copying {source_name}: {result.label}")
 
     else:
         logger.warning("No playlist specified; nothing to copy")
@@ -99,16 +117,17 @@ def copy_list(config: Dict[str, Any], args: argparse.Namespace):
 
 
 def list_playlists(config: Dict[str, Any], args: argparse.Namespace):
-    sp = get_spotify_handle(config)
-    playlists = Playlists(sp, config.get("playlists"))
-
-    try:
-        all_playlists = playlists.list_all_playlists(
-            filters=args.filters, sort_fields=args.sort_fields
-        )
-    except Exception as e:
-        logger.warning(f"Problems listing playlists: {e}")
-        return 1
+    with get_spotify_handle(config) as sp:
+        listing_index = get_cache_store(get_listing_index, config, args)
+        playlists = Playlists(sp, config.get("playlists"), listing_index=listing_index)
+
+        try:
+            all_playlists = playlists.list_all_playlists(
+                filters=args.filters, sort_fields=args.sort_fields, limit=args.limit
+            )
+        except Exception as e:
+            logger.warning(f"Problems listing playlists: {e}")
+            return 1
 
     print(f"{'PLAYLIST NAME':<32} {'SIZE':<5} {'ID':<24} {'OWNER':<16} DESCRIPTION")
     for playlist_row in all_playlists:
@@ -171,6 +190,17 @@ class CommandLookup(BaseLookup):
         return lookup
 
 
+def positive_int(value: str) -> int:
+    """Parses a command line value that must be a whole number greater than zero."""
+    try:
+        parsed = int(value)
+    except ValueError:
+        parsed = 0
+    if parsed < 1:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a positive whole number")
+    return parsed
+
+
 def parse_cmdline(argv: List):
     """
     Returns the parsed argument list and return code.
@@ -184,8 +214,14 @@ def parse_cmdline(argv: List):
                         help=f"The location of the config file (default: {DEFAULT_CONFIG_FILE})",
                         default=DEFAULT_CONFIG_FILE, type=Path)
     parser.add_argument("-s", "--sort_fields", help="The fields to sort against, applied in order")
-    parser.add_argument("-f", "--filters", help="Filters to apply to the list")
+    parser.add_argument("--limit", help="The most playlists to list, taken after sorting", type=positive_int)
+    parser.add_argument("-f", "--filters",
+                        help="Filters to apply to the list, separated by commas; combine with '|', '!' and parentheses")
     parser.add_argument("-r", "--randomize", help="Randomize the target list", action='store_true')
+    parser.add_argument("-m", "--multiple", help="Treat every argument as a source playlist to copy",
+                        action='store_true')
+    parser.add_argument("--no-cache", help="Read playlist contents from Spotify rather than the local cache",
+                        action='store_true')
     parser.add_argument('--version', action='version', version=__version__)
     parser.add_argument("-t", "--target",
                         help="Specify the target name of the operation (overrides any default value)")
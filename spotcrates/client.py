@@ -0,0 +1,295 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, Callable, Mapping
+
+import requests
+import spotipy
+import urllib3
+from spotipy import SpotifyException
+
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_BACKOFF_MAX = 60.0
+DEFAULT_POOL_SIZE = DEFAULT_MAX_CONCURRENCY
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+# Refresh access tokens this many seconds before they expire
+TOKEN_EXPIRY_MARGIN = 60
+RATE_LIMITED_STATUS = 429
+# Requests that only read, and so may be sent again when their response is lost. Writes such as adding
+# tracks would be applied twice.
+READ_ONLY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float = DEFAULT_REQUESTS_PER_SECOND, capacity: int = DEFAULT_BURST,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """A thread-safe token bucket that limits how quickly requests may be sent. Every caller
+        shares the same bucket, so concurrent workers together stay under the configured rate.
+
+        :param rate: The number of tokens added per second.
+        :param capacity: The maximum number of tokens that can accumulate, i.e. the largest burst.
+        :param clock: The monotonic clock to measure time with.
+        :param sleep: The function used to wait for tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token from the bucket, waiting until one is available."""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            self.sleep(wait)
+
+    def try_acquire(self) -> float:
+        """Takes a token from the bucket if one is available without waiting.
+
+        :return: Zero if a token was taken, otherwise how many seconds to wait before trying again.
+        """
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            wait = self.blocked_until - now
+            if wait > 0:
+                return wait
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def block_for(self, seconds: float):
+        """Stops handing out tokens for the given number of seconds, e.g. to honor a Retry-After header.
+
+        :param seconds: How long to hold off all callers.
+        """
+        with self.lock:
+            now = self.clock()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = max(self.updated, self.blocked_until)
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+
+class SessionPool:
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, keep_alive: bool = True):
+        """Holds one requests session that every worker thread shares. The session's connection pool
+        keeps up to ``pool_size`` connections alive and hands each concurrent request its own connection,
+        so it should be at least as large as the client's ``max_concurrency``.
+
+        :param pool_size: The number of connections kept open per host.
+        :param keep_alive: Whether to keep connections open between requests.
+        """
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.session: requests.Session | None = None
+        self.lock = threading.Lock()
+
+    def get(self) -> requests.Session:
+        """Returns the shared session, creating it on first use."""
+        with self.lock:
+            if self.session is None:
+                self.session = self._build_session()
+            return self.session
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        return self.get().request(method, url, **kwargs)
+
+    def close(self):
+        """Closes the shared session and every connection it holds open."""
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        # Retries are handled in RateLimitedSpotify so that a 429 reaches it with its headers intact
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                                pool_block=True, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+
+class RateLimitedSpotify(spotipy.Spotify):
+
+    def __init__(self, *args, rate_limiter: TokenBucket | None = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 session_pool: SessionPool | None = None,
+                 **kwargs):
+        """A thread-safe Spotify client that sends every request through a shared rate limiter and
+        retries rate-limited (429) and server error (5xx) responses. A 429 holds off every caller for
+        the response's Retry-After period; other retries use jittered exponential backoff. Every
+        worker thread sends its requests through the same keep-alive session; close the client (or use
+        it as a context manager) to release the session's connections.
+
+        :param rate_limiter: The token bucket shared by all requests from this client.
+        :param max_concurrency: The maximum number of requests in flight at once.
+        :param max_retries: The number of times to retry a failed request.
+        :param backoff_factor: The base delay in seconds for exponential backoff.
+        :param backoff_max: The longest delay in seconds between retries.
+        :param session_pool: The shared session to send requests with.
+        """
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_max = backoff_max
+        self.session_pool = session_pool or SessionPool(max(DEFAULT_POOL_SIZE, max_concurrency))
+        self.token_lock = threading.Lock()
+        self.auth_header: Dict[str, str] = {}
+        self.auth_expires_at = 0.0
+        super().__init__(*args, backoff_factor=backoff_factor, **kwargs)
+
+    def __enter__(self) -> "RateLimitedSpotify":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _build_session(self):
+        self._session = self.session_pool
+
+    def close(self):
+        """Closes the client's session and the connections it holds open."""
+        session_pool = getattr(self, "session_pool", None)
+        if session_pool is not None:
+            session_pool.close()
+
+    def _auth_headers(self):
+        # Hold the current token in memory so that concurrent requests neither re-read the token
+        # cache nor race each other to refresh it
+        with self.token_lock:
+            if not self.auth_header or self.auth_expires_at - TOKEN_EXPIRY_MARGIN < time.time():
+                self.auth_header = super()._auth_headers()
+                self.auth_expires_at = self._get_token_expiry()
+            # Callers add their own entries to the returned headers
+            return dict(self.auth_header)
+
+    def _get_token_expiry(self) -> float:
+        """Returns when the cached access token expires, or zero if that is unknown."""
+        cache_handler = getattr(self.auth_manager, "cache_handler", None)
+        if self._auth or not cache_handler:
+            return 0
+        token_info = cache_handler.get_cached_token()
+        return token_info.get("expires_at", 0) if token_info else 0
+
+    def _internal_call(self, method, url, payload, params):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                with self.concurrency:
+                    # The parent call consumes entries from the params dict
+                    return super()._internal_call(method, url, payload, dict(params))
+            except SpotifyException as e:
+                if attempt >= self.max_retries or not is_retryable_status(e.http_status):
+                    raise
+                if e.http_status == RATE_LIMITED_STATUS:
+                    delay = get_retry_after(e.headers) or self._get_backoff(attempt)
+                    self.rate_limiter.block_for(delay)
+                    delay = 0
+                else:
+                    delay = self._get_backoff(attempt)
+                status = e.http_status
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries or not (method in READ_ONLY_METHODS or is_connect_error(e)):
+                    raise
+                delay = self._get_backoff(attempt)
+                status = None
+            attempt += 1
+            logger.warning(f"Retrying {method} to {url} (attempt {attempt} of {self.max_retries}, status {status})")
+            if delay:
+                time.sleep(delay)
+
+    def _get_backoff(self, attempt: int) -> float:
+        return get_backoff(attempt, self.backoff_factor, self.backoff_max)
+
+
+def get_backoff(attempt: int, backoff_factor: float, backoff_max: float) -> float:
+    """Returns an exponential backoff delay for the given attempt with "equal" jitter applied."""
+    ceiling = min(backoff_max, backoff_factor * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def is_retryable_status(http_status: int | None) -> bool:
+    """Returns whether a request that failed with the given status is worth retrying."""
+    if http_status is None:
+        return False
+    return http_status == RATE_LIMITED_STATUS or 500 <= http_status < 600
+
+
+def is_connect_error(error: requests.exceptions.RequestException) -> bool:
+    """Returns whether a request failed while connecting, before the server could have received it."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    # Refused and unresolvable connections arrive as the pool's error, with the connect failure as its reason
+    return isinstance(getattr(error.args[0], "reason", None), urllib3.exceptions.ConnectTimeoutError)
+
+
+def get_retry_after(headers: Mapping[str, str] | None) -> float | None:
+    """Returns the number of seconds from the given response headers' Retry-After value, if any."""
+    if not headers:
+        return None
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        logger.warning(f"Could not parse Retry-After value {retry_after}")
+        return None
+
+
+def get_client_settings(spotify_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the RateLimitedSpotify keyword arguments for the given '[spotify]' config section."""
+    max_concurrency = int(spotify_cfg.get("max_concurrency", DEFAULT_MAX_CONCURRENCY))
+    return {
+        "rate_limiter": TokenBucket(
+            float(spotify_cfg.get("requests_per_second", DEFAULT_REQUESTS_PER_SECOND)),
+            int(spotify_cfg.get("burst", DEFAULT_BURST)),
+        ),
+        "max_concurrency": max_concurrency,
+        "max_retries": int(spotify_cfg.get("max_retries", DEFAULT_MAX_RETRIES)),
+        "backoff_factor": float(spotify_cfg.get("backoff_factor", DEFAULT_BACKOFF_FACTOR)),
+        "backoff_max": float(spotify_cfg.get("backoff_max", DEFAULT_BACKOFF_MAX)),
+        "session_pool": SessionPool(
+            # Every request in flight needs its own connection from the shared pool
+            max(int(spotify_cfg.get("pool_size", max_concurrency)), max_concurrency),
+            bool(spotify_cfg.get("keep_alive", True)),
+        ),
+        "requests_timeout": (
+            float(spotify_cfg.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+            float(spotify_cfg.get("read_timeout", DEFAULT_READ_TIMEOUT)),
+        ),
+    }
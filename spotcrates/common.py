@@ -1,9 +1,13 @@
 import datetime
 import logging
+import threading
 from abc import ABC, abstractmethod
-from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from enum import Enum
+from itertools import islice, chain
 from pathlib import Path
-from typing import Iterable, Dict, Any
+from typing import Iterable, Dict, Any, Callable, List, Iterator, Deque, Hashable, TypeVar
 
 import spotipy
 import tomli
@@ -12,6 +16,8 @@ from pygtrie import CharTrie
 
 from spotipy import Spotify
 
+from spotcrates.client import RateLimitedSpotify, get_client_settings
+
 DEFAULT_CONFIG_DIR = user_config_dir("spotcrates")
 DEFAULT_CONFIG_FILE = Path(DEFAULT_CONFIG_DIR, "spotcrates_config.toml")
 DEFAULT_CACHE_DIR = user_cache_dir("spotcrates")
@@ -20,14 +26,84 @@ DEFAULT_AUTH_SCOPES = ["playlist-modify-private", "playlist-read-private"]
 DEFAULT_REDIRECT_URI = 'http://127.0.0.1:5000/'
 DEFAULT_TARGET = "default_target"
 ISO_8601_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# The 'added_at' value Spotify reports for tracks added before it recorded add times
+ZERO_ADDED_AT = '1970-01-01T00:00:00Z'
 ZERO_TIMESTAMP = datetime.datetime.strptime(
-    '1970-01-01T00:00:00Z', ISO_8601_TIMESTAMP_FORMAT
+    ZERO_ADDED_AT, ISO_8601_TIMESTAMP_FORMAT
 )
+ZERO_EPOCH = 0
+DEFAULT_PAGE_WORKERS = 4
+DEFAULT_PAGE_RETRIES = 3
+# The largest page sizes the Spotify API accepts for each listing
+PLAYLIST_ITEMS_PAGE_LIMIT = 100
+PLAYLISTS_PAGE_LIMIT = 50
+PAGING_FIELDS = "next,offset,limit,total"
+
+T = TypeVar("T")
+
 
 class NotFoundException(Exception):
     pass
 
 
+class PagingException(Exception):
+    pass
+
+
+class FetchProfile(Enum):
+    """The playlist item fields to request for a given use, passed as the API's 'fields' filter."""
+
+    def __init__(self, label, fields):
+        self.label = label
+        self.fields = fields
+
+    FULL = ("Full", None)
+    TRACK_IDS = ("Track IDs", f"{PAGING_FIELDS},items(track(id))")
+    ADDED_TRACK_IDS = ("Added Track IDs", f"{PAGING_FIELDS},items(added_at,track(id))")
+
+
+class SingleFlight:
+
+    def __init__(self) -> None:
+        """Coalesces concurrent calls by key: the first caller for a key runs the call, while callers for
+        the same key that arrive before it finishes wait for and share its result. Nothing is remembered
+        once the call finishes, so a later caller runs the call again."""
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """Returns the result of the given call for the key, running it only if no other caller is.
+
+        :param key: The key identifying the call.
+        :param func: The call to run if there is no call in flight for the key.
+        :return: The shared result of the call.
+        """
+        with self.lock:
+            existing = self.calls.get(key)
+            leader = existing is None
+            future: Future = Future() if existing is None else existing
+            if leader:
+                self.calls[key] = future
+
+        if leader:
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self.lock:
+                    if self.calls.get(key) is future:
+                        del self.calls[key]
+        return future.result()
+
+    def forget(self, predicate: Callable[[Any], bool]):
+        """Stops sharing the calls in flight whose keys match the given predicate with later callers."""
+        with self.lock:
+            for key in [key for key in self.calls if predicate(key)]:
+                del self.calls[key]
+
+
 def batched(iterable: Iterable, n: int):
     """Batch data into lists of length n. The last batch may be shorter."""
     it = iter(iterable)
@@ -38,21 +114,119 @@ def batched(iterable: Iterable, n: int):
         yield batch
 
 
-def get_all_items(spotify: Spotify, first_page: Dict[str, Any]):
-    """Collects the 'items' contents from every page in the given result set."""
-    all_items = []
+def get_all_items(spotify: Spotify, first_page: Dict[str, Any],
+                  page_fetcher: Callable[[int], Dict[str, Any]] | None = None,
+                  max_workers: int = DEFAULT_PAGE_WORKERS,
+                  page_retries: int = DEFAULT_PAGE_RETRIES,
+                  transform: Callable[[Any], Any] | None = None):
+    """Collects the 'items' contents from every page in the given result set.
 
-    all_items.extend(first_page["items"])
+    See iter_all_items for a description of the parameters and paging behavior.
 
-    try:
-        next_page = spotify.next(first_page)
+    :return: The non-null items from every page.
+    """
+    return list(iter_all_items(spotify, first_page, page_fetcher, max_workers, page_retries, transform))
+
+
+def iter_all_items(spotify: Spotify, first_page: Dict[str, Any],
+                   page_fetcher: Callable[[int], Dict[str, Any]] | None = None,
+                   max_workers: int = DEFAULT_PAGE_WORKERS,
+                   page_retries: int = DEFAULT_PAGE_RETRIES,
+                   transform: Callable[[Any], Any] | None = None) -> Iterator[Any]:
+    """Yields the non-null 'items' contents from every page in the given result set, page by page.
+
+    Without a page fetcher, the pages are walked one at a time via their 'next' links. With one,
+    the offsets of the remaining pages are computed from the first page's 'total' and 'limit' and
+    up to max_workers pages are fetched ahead of the consumer, which still receives them in order;
+    with a single worker the pages are read one at a time on the caller's thread.
+    Only the pages in flight are held in memory. A transform is applied to each item as soon as its
+    page is decoded (on the worker thread when using a page fetcher), so the raw items can be
+    discarded right away.
+
+    :param spotify: The Spotify client used to follow 'next' links.
+    :param first_page: The first page of the result set.
+    :param page_fetcher: A callable that returns the page starting at the given offset.
+    :param max_workers: The maximum number of pages to fetch at once when using a page fetcher.
+    :param page_retries: The number of times to retry a failed page when using a page fetcher.
+    :param transform: A callable that converts each item; items it maps to None are dropped.
+    :return: A generator of the non-null (transformed) items from every page.
+    :raises PagingException: If a page cannot be fetched (after retrying when using a page fetcher).
+    """
+    yield from convert_items(first_page["items"], transform)
+
+    if page_fetcher:
+        yield from chain.from_iterable(
+            _iter_offset_pages(first_page, page_fetcher, max_workers, page_retries, transform))
+    else:
+        next_page = _fetch_next_page(spotify, first_page)
         while next_page:
-            all_items.extend(next_page["items"])
-            next_page = spotify.next(next_page)
-    except Exception:
-        logging.warning("Problems paging given Spotify items list", exc_info=True)
+            yield from convert_items(next_page["items"], transform)
+            next_page = _fetch_next_page(spotify, next_page)
+
+
+def _fetch_next_page(spotify: Spotify, page: Dict[str, Any]) -> Dict[str, Any] | None:
+    try:
+        return spotify.next(page)
+    except Exception as e:
+        # Stopping here would hand the caller a silently truncated result set
+        raise PagingException(f"Could not fetch the page after offset {page.get('offset')}") from e
+
 
-    return [item for item in all_items if item is not None]
+def get_page_offsets(first_page: Dict[str, Any]) -> List[int]:
+    """Returns the offsets of the pages that follow the given first page of a result set."""
+    total = first_page.get("total")
+    limit = first_page.get("limit")
+    if not total or not limit:
+        return []
+    offset = first_page.get("offset") or 0
+    return list(range(offset + limit, total, limit))
+
+
+def convert_items(items: Iterable, transform: Callable[[Any], Any] | None) -> Iterator:
+    """Yields the given page items that are present, transformed when a transform is given. Items the
+    transform returns None for are dropped."""
+    if transform is None:
+        return (item for item in items if item is not None)
+    return (converted for converted in (transform(item) for item in items if item is not None)
+            if converted is not None)
+
+
+def _iter_offset_pages(first_page: Dict[str, Any], page_fetcher: Callable[[int], Dict[str, Any]],
+                       max_workers: int, page_retries: int,
+                       transform: Callable[[Any], Any] | None) -> Iterator[List]:
+    offsets = get_page_offsets(first_page)
+    if not offsets:
+        return
+
+    window = max(1, min(max_workers, len(offsets)))
+    if window == 1:
+        # A single worker gains nothing from a thread, so read the pages in the caller's
+        for offset in offsets:
+            yield _fetch_page_items(page_fetcher, offset, page_retries, transform)
+        return
+    with ThreadPoolExecutor(max_workers=window) as executor:
+        pending: Deque[Future] = deque()
+        for offset in offsets:
+            pending.append(executor.submit(_fetch_page_items, page_fetcher, offset, page_retries, transform))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _fetch_page_items(page_fetcher: Callable[[int], Dict[str, Any]], offset: int, page_retries: int,
+                      transform: Callable[[Any], Any] | None = None) -> List:
+    attempt = 0
+    while True:
+        try:
+            page = page_fetcher(offset)
+            return list(convert_items(page["items"], transform)) if page else []
+        except Exception as e:
+            attempt += 1
+            if attempt > page_retries:
+                raise PagingException(f"Could not fetch page at offset {offset} after {attempt} attempts") from e
+            logging.warning(f"Problems fetching page at offset {offset} (attempt {attempt}); retrying",
+                            exc_info=True)
 
 
 def truncate_long_value(full_value: str, length: int, trim_tail: bool = True) -> str:
@@ -103,6 +277,11 @@ def get_spotify_handle(config: Dict[str, Dict[str, Any]]):
     spotify_cfg = config.get("spotify")
     if not spotify_cfg:
         raise Exception("No Spotify config defined")
+    return RateLimitedSpotify(auth_manager=get_auth_manager(spotify_cfg), **get_client_settings(spotify_cfg))
+
+
+def get_auth_manager(spotify_cfg: Dict[str, Any]) -> spotipy.oauth2.SpotifyOAuth:
+    """Returns the OAuth manager for the given '[spotify]' config section, backed by the auth cache file."""
     auth_scopes = spotify_cfg.get("auth_scopes", DEFAULT_AUTH_SCOPES)
     redirect_uri = spotify_cfg.get("redirect_uri", DEFAULT_REDIRECT_URI)
     cache_path = prepare_auth_cache_loc(spotify_cfg)
@@ -119,7 +298,7 @@ def get_spotify_handle(config: Dict[str, Dict[str, Any]]):
         auth_manager = spotipy.oauth2.SpotifyOAuth(
             cache_handler=cache_handler, scope=auth_scopes
         )
-    return spotipy.Spotify(auth_manager=auth_manager)
+    return auth_manager
 
 
 def prepare_auth_cache_loc(config: Dict[str, Any]):
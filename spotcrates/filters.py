@@ -1,12 +1,19 @@
+import functools
+import heapq
 import logging
-from collections import defaultdict
+import math
+import operator
+from abc import ABC, abstractmethod
 from enum import Enum, auto
-from typing import Dict, List
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Set, Tuple, TYPE_CHECKING
 
 import pygtrie
 
 from spotcrates.common import NotFoundException, BaseLookup
 
+if TYPE_CHECKING:
+    from spotcrates.index import TrigramIndex
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,26 +31,51 @@ class FilterType(Enum):
     GREATER_EQUAL = auto()
     LESS_EQUAL = auto()
 
-    def test(self, filter_val, target_val) -> bool:
+    @property
+    def is_numeric(self) -> bool:
+        """Whether this type compares integers rather than case-insensitive strings."""
+        return self in NUMERIC_FILTER_TYPES
+
+    def normalize(self, value) -> Any:
+        """Returns the given filter or target value in the form this type compares."""
+        if self.is_numeric:
+            return int(value)
+        return str(value).lower()
+
+    def compile(self, filter_val) -> Callable[[Any], bool]:
+        """Returns a test of normalized target values against the given filter value, which is
+        normalized once here rather than on every comparison.
+
+        :param filter_val: The value to test targets against.
+        :return: A function of a normalized target value that returns whether it passes.
+        """
+        value = self.normalize(filter_val)
         if self == FilterType.CONTAINS:
-            return str(filter_val).lower() in str(target_val).lower()
+            return lambda target: value in target
         elif self == FilterType.EQUALS:
-            return str(filter_val).lower() == str(target_val).lower()
+            return value.__eq__
         elif self == FilterType.STARTS:
-            return str(target_val).lower().startswith(str(filter_val).lower())
+            return lambda target: target.startswith(value)
         elif self == FilterType.ENDS:
-            return str(target_val).lower().endswith(str(filter_val).lower())
+            return lambda target: target.endswith(value)
         elif self == FilterType.GREATER:
-            return int(target_val) > int(filter_val)
+            return value.__lt__
         elif self == FilterType.GREATER_EQUAL:
-            return int(target_val) >= int(filter_val)
+            return value.__le__
         elif self == FilterType.LESS:
-            return int(target_val) < int(filter_val)
+            return value.__gt__
         elif self == FilterType.LESS_EQUAL:
-            return int(target_val) <= int(filter_val)
+            return value.__ge__
         else:
             raise NotFoundException(f"Unhandled filter type {self}")
 
+    def test(self, filter_val, target_val) -> bool:
+        return self.compile(filter_val)(self.normalize(target_val))
+
+
+NUMERIC_FILTER_TYPES = frozenset({FilterType.GREATER, FilterType.GREATER_EQUAL, FilterType.LESS,
+                                  FilterType.LESS_EQUAL})
+
 
 class FieldName(Enum):
     SPOTIFY_ID = auto()
@@ -53,6 +85,10 @@ class FieldName(Enum):
     PLAYLIST_DESCRIPTION = auto()
     ALL = auto()
 
+    # Listing rows are keyed by field, and members are only ever equal to themselves, so hash by identity
+    # rather than with Enum's slower hash of the member name
+    __hash__ = object.__hash__
+
     @staticmethod
     def list_regular_fields():
         for field in FieldName:
@@ -61,6 +97,18 @@ class FieldName(Enum):
             yield field
 
 
+# Relative costs of the comparisons and of the values they scan, used to order filters cheapest first.
+# Numeric comparisons are cheapest; substring scans of long descriptions are the most expensive.
+FILTER_TYPE_COSTS = {FilterType.EQUALS: 2, FilterType.STARTS: 2, FilterType.ENDS: 2, FilterType.CONTAINS: 4,
+                     **{filter_type: 1 for filter_type in NUMERIC_FILTER_TYPES}}
+FIELD_COSTS = {FieldName.SPOTIFY_ID: 1, FieldName.SIZE: 1, FieldName.OWNER: 1, FieldName.PLAYLIST_NAME: 2,
+               FieldName.PLAYLIST_DESCRIPTION: 5}
+FIELD_COSTS[FieldName.ALL] = sum(FIELD_COSTS.values())
+
+# Marks a field value not yet read from the item being filtered
+_UNREAD = object()
+
+
 class FilterLookup(BaseLookup):
 
     def eval_filter_type(self, filter_type) -> FilterType:
@@ -115,20 +163,35 @@ class FieldLookup(BaseLookup):
         return lookup
 
 
+# The lookups are read-only once built, so every filter and sort shares them
+FILTER_LOOKUP = FilterLookup()
+FIELD_LOOKUP = FieldLookup()
+
+
 class FieldFilter:
 
     def __init__(self, field, filter_type, value):
-        """Represents a filter with the given settings.
+        """Represents a filter with the given settings. The filter value is normalized and the
+        comparison chosen once, when the filter is created.
 
         :param field: The name of the field to filter.
         :param filter_type: The type of filter to apply.
         :param value: The value to test filter against.
         """
-        self.filter_lookup = FilterLookup()
-        self.field_lookup = FieldLookup()
+        self.filter_lookup = FILTER_LOOKUP
+        self.field_lookup = FIELD_LOOKUP
         self.filter_type = self.filter_lookup.eval_filter_type(filter_type)
         self.field = self.field_lookup.eval_field_name(field)
         self.value = value
+        try:
+            self.matches = self.filter_type.compile(value)
+        except ValueError:
+            raise InvalidFilterException(f"Invalid value '{value}' for {self.filter_type.name} filter")
+
+    @property
+    def cost(self) -> int:
+        """The relative cost of evaluating this filter against an item."""
+        return FILTER_TYPE_COSTS[self.filter_type] * FIELD_COSTS[self.field]
 
     def passes(self, target_value) -> bool:
         """Returns whether the given value passes the configured filter.
@@ -136,7 +199,11 @@ class FieldFilter:
         :param target_value: The value to evaluate.
         :return: Whether the value passes the filter.
         """
-        return self.filter_type.test(self.value, target_value)
+        try:
+            return self.matches(self.filter_type.normalize(target_value))
+        except ValueError:
+            # A non-numeric value never passes a numeric comparison
+            return False
 
     def __repr__(self):
         return f"FieldFilter({self.field}, {self.value}, {self.filter_type})"
@@ -151,83 +218,570 @@ class FieldFilter:
         return NotImplemented
 
 
-def parse_filters(filters: str) -> Dict[FieldName, List[FieldFilter]]:
+# Estimated fractions of playlists that pass each type of filter, used with the costs to plan evaluation
+FILTER_TYPE_SELECTIVITY = {FilterType.EQUALS: 0.05, FilterType.STARTS: 0.1, FilterType.ENDS: 0.1,
+                           FilterType.CONTAINS: 0.2, **{filter_type: 0.5 for filter_type in NUMERIC_FILTER_TYPES}}
+
+# A compiled node, called with an item and the item's field values read so far
+_NodeTest = Callable[[Dict[FieldName, Any], List[Any]], bool]
+
+
+class FilterNode(ABC):
+    """A node in a parsed filter expression."""
+
+    @property
+    @abstractmethod
+    def cost(self) -> float:
+        """The expected relative cost of evaluating this node against an item."""
+
+    @property
+    @abstractmethod
+    def selectivity(self) -> float:
+        """The estimated fraction of items that pass this node."""
+
+    @abstractmethod
+    def terms(self) -> Iterator["FilterTerm"]:
+        """Yields the filter terms under this node."""
+
+    def plan(self) -> "FilterNode":
+        """Returns an equivalent node with its children in the order that is cheapest to evaluate."""
+        return self
+
+    def candidates(self, index: "TrigramIndex") -> Set[int] | None:
+        """Returns the indexed documents that could pass this node, or None if the index cannot narrow
+        them down."""
+        return None
+
+    @abstractmethod
+    def compile(self, fields: List[FieldName], lowered: List[bool]) -> _NodeTest:
+        """Returns a function that evaluates this node against an item.
+
+        :param fields: The item fields, in the order of the item's value list.
+        :param lowered: Whether each field's value is lowercased when it is read.
+        :return: A function of an item and its list of values read so far.
+        """
+
+
+class FilterTerm(FilterNode):
+
+    def __init__(self, field_filter: FieldFilter):
+        """A single field filter.
+
+        :param field_filter: The filter to apply.
+        """
+        self.field_filter = field_filter
+
+    @property
+    def cost(self) -> float:
+        return self.field_filter.cost
+
+    @property
+    def selectivity(self) -> float:
+        selectivity = FILTER_TYPE_SELECTIVITY[self.field_filter.filter_type]
+        if self.field_filter.field == FieldName.ALL:
+            # Passing on any one of the fields
+            return 1 - (1 - selectivity) ** len(list(FieldName.list_regular_fields()))
+        return selectivity
+
+    def terms(self) -> Iterator["FilterTerm"]:
+        yield self
+
+    def candidates(self, index: "TrigramIndex") -> Set[int] | None:
+        filter_type = self.field_filter.filter_type
+        if filter_type.is_numeric:
+            return None
+        return index.search(self.field_filter.field, filter_type, filter_type.normalize(self.field_filter.value))
+
+    def compile(self, fields: List[FieldName], lowered: List[bool]) -> _NodeTest:
+        field = self.field_filter.field
+        positions = range(len(fields)) if field == FieldName.ALL else (fields.index(field),)
+        numeric = self.field_filter.filter_type.is_numeric
+        matches = self.field_filter.matches
+
+        def test(item: Dict[FieldName, Any], values: List[Any]) -> bool:
+            # Fields are read, and lowercased if any string filter uses them, on first use
+            for pos in positions:
+                value = values[pos]
+                if value is _UNREAD:
+                    value = item.get(fields[pos])
+                    if lowered[pos]:
+                        value = str(value).lower()
+                    values[pos] = value
+                if matches(value) if not numeric else _passes_numeric(matches, value):
+                    return True
+            return False
+
+        return test
+
+    def __repr__(self):
+        return repr(self.field_filter)
+
+    def __eq__(self, other):
+        if isinstance(other, FilterTerm):
+            return self.field_filter == other.field_filter
+        return NotImplemented
+
+
+class FilterGroup(FilterNode):
+
+    def __init__(self, children: List[FilterNode]):
+        """Combines the results of several nodes.
+
+        :param children: The nodes to combine.
+        """
+        self.children = children
+
+    def terms(self) -> Iterator["FilterTerm"]:
+        for child in self.children:
+            yield from child.terms()
+
+    def _plan_children(self) -> List[FilterNode]:
+        """Plans the children, merging in the children of any nested group of the same type."""
+        children: List[FilterNode] = []
+        for child in self.children:
+            child = child.plan()
+            if type(child) is type(self) and isinstance(child, FilterGroup):
+                children.extend(child.children)
+            else:
+                children.append(child)
+        return children
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.children})"
+
+    def __eq__(self, other):
+        if isinstance(other, FilterGroup):
+            return type(self) is type(other) and self.children == other.children
+        return NotImplemented
+
+
+class FilterAnd(FilterGroup):
+    """Passes items that pass every child, stopping at the first that fails."""
+
+    @property
+    def cost(self) -> float:
+        # Each child only runs if the ones before it passed
+        cost, reached = 0.0, 1.0
+        for child in self.children:
+            cost += reached * child.cost
+            reached *= child.selectivity
+        return cost
+
+    @property
+    def selectivity(self) -> float:
+        return math.prod(child.selectivity for child in self.children)
+
+    def plan(self) -> FilterNode:
+        children = self._plan_children()
+        # The cheapest order runs the children with the lowest cost per item they reject first
+        children.sort(key=lambda child: _rank(child.cost, 1 - child.selectivity))
+        return children[0] if len(children) == 1 else FilterAnd(children)
+
+    def candidates(self, index: "TrigramIndex") -> Set[int] | None:
+        # An item must be a candidate of every child that narrows
+        candidates = None
+        for child in self.children:
+            child_candidates = child.candidates(index)
+            if child_candidates is not None:
+                candidates = child_candidates if candidates is None else candidates & child_candidates
+                if not candidates:
+                    break
+        return candidates
+
+    def compile(self, fields: List[FieldName], lowered: List[bool]) -> _NodeTest:
+        tests = [child.compile(fields, lowered) for child in self.children]
+
+        def test(item: Dict[FieldName, Any], values: List[Any]) -> bool:
+            for child_test in tests:
+                if not child_test(item, values):
+                    return False
+            return True
+
+        return test
+
+
+class FilterOr(FilterGroup):
+    """Passes items that pass any child, stopping at the first that passes."""
+
+    @property
+    def cost(self) -> float:
+        # Each child only runs if the ones before it failed
+        cost, reached = 0.0, 1.0
+        for child in self.children:
+            cost += reached * child.cost
+            reached *= 1 - child.selectivity
+        return cost
+
+    @property
+    def selectivity(self) -> float:
+        return 1 - math.prod(1 - child.selectivity for child in self.children)
+
+    def plan(self) -> FilterNode:
+        children = self._plan_children()
+        # The cheapest order runs the children with the lowest cost per item they accept first
+        children.sort(key=lambda child: _rank(child.cost, child.selectivity))
+        return children[0] if len(children) == 1 else FilterOr(children)
+
+    def candidates(self, index: "TrigramIndex") -> Set[int] | None:
+        # An item may pass on any child, so every child must narrow
+        candidates: Set[int] = set()
+        for child in self.children:
+            child_candidates = child.candidates(index)
+            if child_candidates is None:
+                return None
+            candidates |= child_candidates
+        return candidates
+
+    def compile(self, fields: List[FieldName], lowered: List[bool]) -> _NodeTest:
+        tests = [child.compile(fields, lowered) for child in self.children]
+
+        def test(item: Dict[FieldName, Any], values: List[Any]) -> bool:
+            for child_test in tests:
+                if child_test(item, values):
+                    return True
+            return False
+
+        return test
+
+
+class FilterNot(FilterNode):
+
+    def __init__(self, child: FilterNode):
+        """Passes items that fail the child.
+
+        :param child: The node to negate.
+        """
+        self.child = child
+
+    @property
+    def cost(self) -> float:
+        return self.child.cost
+
+    @property
+    def selectivity(self) -> float:
+        return 1 - self.child.selectivity
+
+    def terms(self) -> Iterator["FilterTerm"]:
+        return self.child.terms()
+
+    def plan(self) -> FilterNode:
+        child = self.child.plan()
+        if isinstance(child, FilterNot):
+            return child.child
+        return FilterNot(child)
+
+    def compile(self, fields: List[FieldName], lowered: List[bool]) -> _NodeTest:
+        child_test = self.child.compile(fields, lowered)
+        return lambda item, values: not child_test(item, values)
+
+    def __repr__(self):
+        return f"FilterNot({self.child})"
+
+    def __eq__(self, other):
+        if isinstance(other, FilterNot):
+            return self.child == other.child
+        return NotImplemented
+
+
+def _rank(cost: float, decided: float) -> float:
+    """Orders short-circuiting children by their cost per item they decide the result for."""
+    return cost / decided if decided > 0 else math.inf
+
+
+def _passes_numeric(matches: Callable[[Any], bool], value) -> bool:
+    try:
+        return matches(int(value))
+    except (TypeError, ValueError):
+        # A non-numeric value never passes a numeric comparison
+        return False
+
+
+class FilterQuery:
+
+    def __init__(self, root: FilterNode | None):
+        """A planned filter expression, callable as a predicate on items. An empty expression
+        passes every item.
+
+        :param root: The parsed expression, or None for no filters.
+        """
+        self.root = root.plan() if root else None
+        self.fields = list(FieldName.list_regular_fields())
+        self.lowered = [False] * len(self.fields)
+        self._test: _NodeTest | None = None
+        if self.root:
+            for term in self.root.terms():
+                if not term.field_filter.filter_type.is_numeric:
+                    for pos, field in enumerate(self.fields):
+                        if term.field_filter.field in (field, FieldName.ALL):
+                            self.lowered[pos] = True
+            self._test = self.root.compile(self.fields, self.lowered)
+
+    def __call__(self, item: Dict[FieldName, Any]) -> bool:
+        if self._test is None:
+            return True
+        return self._test(item, [_UNREAD] * len(self.fields))
+
+    def candidates(self, index: "TrigramIndex") -> Set[int] | None:
+        """Returns the indexed documents that could pass this query, or None if the index cannot narrow
+        them down."""
+        return self.root.candidates(index) if self.root else None
+
+    def __bool__(self):
+        return self.root is not None
+
+    def __repr__(self):
+        return f"FilterQuery({self.root})"
+
+
+class FilterSet(Dict[FieldName, List[FieldFilter]]):
+    """Parsed filters keyed by field, compiled into a predicate that can be applied to any number of
+    items. An item passes if it passes every filter; an 'all' filter passes if any of the item's
+    fields does."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._query: FilterQuery | None = None
+
+    def __missing__(self, field: FieldName) -> List[FieldFilter]:
+        field_filters: List[FieldFilter] = []
+        self[field] = field_filters
+        return field_filters
+
+    def __setitem__(self, field: FieldName, field_filters: List[FieldFilter]):
+        self._query = None
+        super().__setitem__(field, field_filters)
+
+    def __delitem__(self, field: FieldName):
+        self._query = None
+        super().__delitem__(field)
+
+    def __call__(self, item: Dict[FieldName, Any]) -> bool:
+        return self.query(item)
+
+    @property
+    def query(self) -> FilterQuery:
+        """These filters as a planned query, built on first use."""
+        if self._query is None:
+            self._query = self.to_query()
+        return self._query
+
+    def to_query(self) -> FilterQuery:
+        """Returns these filters as a planned query."""
+        terms: List[FilterNode] = [FilterTerm(field_filter) for field_filters in self.values()
+                                   for field_filter in field_filters]
+        return FilterQuery(FilterAnd(terms) if terms else None)
+
+
+# The characters with a meaning of their own in filter expressions
+AND_TOKEN = ","
+OR_TOKEN = "|"
+NOT_TOKEN = "!"
+OPEN_TOKEN = "("
+CLOSE_TOKEN = ")"
+QUOTE = '"'
+
+
+def _tokenize_filters(filters: str) -> Iterator[str | List[str]]:
+    """Yields the operators in a filter expression as strings and each filter term as a list of its
+    colon-separated parts. Separators inside double quotes are part of the value, and a closing
+    parenthesis only ends a term inside a group."""
+    depth = 0
+    pos = 0
+    length = len(filters)
+    while pos < length:
+        char = filters[pos]
+        if char.isspace():
+            pos += 1
+        elif char in (AND_TOKEN, OR_TOKEN, NOT_TOKEN, OPEN_TOKEN) or (char == CLOSE_TOKEN and depth):
+            depth += (char == OPEN_TOKEN) - (char == CLOSE_TOKEN)
+            pos += 1
+            yield char
+        else:
+            parts = []
+            part_start = pos
+            quoted = False
+            while pos < length:
+                char = filters[pos]
+                if char == QUOTE:
+                    quoted = not quoted
+                elif not quoted:
+                    if char in (AND_TOKEN, OR_TOKEN) or (char == CLOSE_TOKEN and depth):
+                        break
+                    if char == ":":
+                        parts.append(filters[part_start:pos])
+                        part_start = pos + 1
+                pos += 1
+            if quoted:
+                raise InvalidFilterException(f"Unclosed quote in filter expression {filters}")
+            parts.append(filters[part_start:pos])
+            yield [_unquote(part.strip()) for part in parts]
+
+
+def _unquote(part: str) -> str:
+    if len(part) > 1 and part[0] == part[-1] == QUOTE:
+        return part[1:-1]
+    return part
+
+
+def _to_field_filter(parts: List[str]) -> FieldFilter:
+    if len(parts) == 1:
+        return FieldFilter(FieldName.ALL, FilterType.CONTAINS, parts[0])
+    elif len(parts) == 2:
+        return FieldFilter(parts[0], FilterType.CONTAINS, parts[1])
+    return FieldFilter(parts[0], parts[1], ":".join(parts[2:]))
+
+
+class _FilterParser:
+    """Parses a filter expression by recursive descent. NOT binds tightest, then AND (a comma),
+    then OR (a pipe); parentheses group."""
+
+    def __init__(self, filters: str):
+        self.filters = filters
+        self.tokens = list(_tokenize_filters(filters))
+        self.pos = 0
+
+    def parse(self) -> FilterNode:
+        node = self._parse_or()
+        if self.pos < len(self.tokens):
+            raise InvalidFilterException(f"Unexpected '{self._describe(self.pos)}' in filter expression {self.filters}")
+        return node
+
+    def _describe(self, pos: int) -> str:
+        token = self.tokens[pos]
+        return token if isinstance(token, str) else ":".join(token)
+
+    def _peek(self) -> str | List[str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _parse_or(self) -> FilterNode:
+        children = [self._parse_and()]
+        while self._peek() == OR_TOKEN:
+            self.pos += 1
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else FilterOr(children)
+
+    def _parse_and(self) -> FilterNode:
+        children = [self._parse_unary()]
+        while self._peek() == AND_TOKEN:
+            self.pos += 1
+            children.append(self._parse_unary())
+        return children[0] if len(children) == 1 else FilterAnd(children)
+
+    def _parse_unary(self) -> FilterNode:
+        token = self._peek()
+        if token == NOT_TOKEN:
+            self.pos += 1
+            return FilterNot(self._parse_unary())
+        elif token == OPEN_TOKEN:
+            self.pos += 1
+            node = self._parse_or()
+            if self._peek() != CLOSE_TOKEN:
+                raise InvalidFilterException(f"Unclosed group in filter expression {self.filters}")
+            self.pos += 1
+            return node
+        elif isinstance(token, list):
+            self.pos += 1
+            return FilterTerm(_to_field_filter(token))
+        elif self.pos and self.tokens[self.pos - 1] != AND_TOKEN:
+            raise InvalidFilterException(f"Missing filter after '{self._describe(self.pos - 1)}' in filter "
+                                         f"expression {self.filters}")
+        # As before, a missing term in a list (e.g. a trailing comma) is an empty 'contains' that every item passes
+        return FilterTerm(_to_field_filter([""]))
+
+
+def parse_query(filters: str | None) -> FilterQuery:
+    """Parses a filter expression into a planned query. Terms are filters as accepted by
+    parse_filters. Terms may be combined with ',' (and), '|' (or), a '!' prefix (not) and
+    parentheses, e.g.:
+
+    (name:jazz|name:funk),!owner:spotify,size:gt:50
+
+    Wrap a value in double quotes to include any of these characters.
+
+    :param filters: The filter expression.
+    :return: A predicate that returns whether an item passes the expression.
+    """
+    if not filters or not filters.strip():
+        return FilterQuery(None)
+    return FilterQuery(_FilterParser(filters).parse())
+
+
+def parse_filters(filters: str | None) -> FilterSet:
     """Returns a dict keyed by field with values being a list of
     name:PoP
     size:gt:22
     name:twin
 
+    The result is also a predicate that returns whether an item passes every filter. Use
+    parse_query for expressions with '|', '!' or groups.
 
     :param filters: A str with a comma-separated list of filters
     :return: A map of field names to lower-case "contains" filter strings.
     """
-    parsed_filters: Dict[FieldName, List[FieldFilter]] = defaultdict(list)
+    parsed_filters = FilterSet()
 
-    if not filters:
+    if not filters or not filters.strip():
         return parsed_filters
 
-    raw_filters = [raw_filter.strip() for raw_filter in filters.split(",")]
-    split_raw_filters = [raw_filter.split(":") for raw_filter in raw_filters]
+    node = _FilterParser(filters).parse()
+    children = node.children if isinstance(node, FilterAnd) else [node]
+    for child in children:
+        if not isinstance(child, FilterTerm):
+            raise InvalidFilterException(f"Filter expression {filters} is not a list of filters; use parse_query")
+        parsed_filters[child.field_filter.field].append(child.field_filter)
 
-    for raw_exp in split_raw_filters:
-        exp_field_count = len(raw_exp)
+    return parsed_filters
 
-        if exp_field_count < 1:
-            raise InvalidFilterException(
-                f"Invalid filter expression {':'.join(raw_exp)}"
-            )
 
-        stripped_exp = [field.strip() for field in raw_exp]
+def iter_filtered(items: Iterable[Dict], predicate: Callable[[Dict], bool]) -> Iterator[Dict]:
+    """Yields the items that pass the given filters, in order, as they are read. An item with the same
+    ID as one already yielded is skipped.
 
-        if exp_field_count == 1:
-            field_filter = FieldFilter(
-                FieldName.ALL, FilterType.CONTAINS, stripped_exp[0]
-            )
-        elif exp_field_count == 2:
-            field_filter = FieldFilter(
-                stripped_exp[0], FilterType.CONTAINS, stripped_exp[1]
-            )
-        else:
-            field_filter = FieldFilter(
-                stripped_exp[0], stripped_exp[1], stripped_exp[2]
-            )
-        parsed_filters[field_filter.field].append(field_filter)
+    :param items: The values to filter.
+    :param predicate: The filters to apply, e.g. from parse_query or parse_filters.
+    :return: A generator of the values that pass all of the filters.
+    """
+    seen_ids = set()
+    for item in items:
+        if predicate(item):
+            item_id = item[FieldName.SPOTIFY_ID]
+            if item_id not in seen_ids:
+                seen_ids.add(item_id)
+                yield item
 
-    return parsed_filters
+
+@functools.lru_cache(maxsize=32)
+def _get_filter_query(filters: str | None) -> FilterQuery:
+    return parse_query(filters)
 
 
-def filter_list(items, filters):
+def filter_list(items: Iterable[Dict], filters: str | FilterQuery | FilterSet | None,
+                index: "TrigramIndex | None" = None):
     """Evaluates the given list of values against the given list of filters, returning
     items that pass all of the filters.
 
     :param items: The values to filter.
-    :param filters: The filters to apply.
+    :param filters: The filters to apply, either as an expression or as parsed by parse_query or
+        parse_filters.
+    :param index: An optional trigram index of the values, used to skip those that cannot pass.
     :return: The values that pass all of the filters.
     """
-    parsed_filters = parse_filters(filters)
-
-    filtered_items = items
-    for field in FieldName:
-        field_filters = parsed_filters[field]
-        if field_filters:
-            for cur_filter in field_filters:
-                matching_items = []
-                for cur_item in filtered_items:
-                    if FieldName.ALL == field:
-                        for regular_field in FieldName.list_regular_fields():
-                            item_field = cur_item.get(regular_field)
-                            if cur_filter.passes(item_field):
-                                matching_items.append(cur_item)
-                    else:
-                        item_field = cur_item.get(field)
-                        if cur_filter.passes(item_field):
-                            matching_items.append(cur_item)
-
-                filtered_items = list(
-                    {v[FieldName.SPOTIFY_ID]: v for v in matching_items}.values()
-                )
-
-    return filtered_items
+    if isinstance(filters, FilterSet):
+        query = filters.query
+    elif isinstance(filters, FilterQuery):
+        query = filters
+    else:
+        query = _get_filter_query(filters)
+    if not query:
+        return items
+
+    if index is not None:
+        candidates = query.candidates(index)
+        if candidates is not None:
+            logger.debug(f"Trigram index narrowed the filters to {len(candidates)} candidates")
+            items = index.select(items, candidates)
+
+    return list(iter_filtered(items, query))
 
 
 class SortType(Enum):
@@ -253,15 +807,51 @@ class SortLookup(BaseLookup):
         return lookup
 
 
+SORT_LOOKUP = SortLookup()
+
+
 class FieldSort:
     def __init__(self, field, sort_type):
-        self.sort_lookup = SortLookup()
-        self.field_lookup = FieldLookup()
+        self.sort_lookup = SORT_LOOKUP
+        self.field_lookup = FIELD_LOOKUP
         self.sort_type = self.sort_lookup.eval_sort_type(sort_type)
         self.field = self.field_lookup.eval_field_name(field)
 
+    @property
+    def descending(self) -> bool:
+        return self.sort_type == SortType.DESCENDING
+
+    def __repr__(self):
+        return f"FieldSort({self.field}, {self.sort_type})"
+
 
-def parse_sorts(sorts: str) -> List[FieldSort]:
+def _descending_key(value) -> Any:
+    """Returns a key that orders values in reverse. Numbers are negated; strings become their negated
+    code points plus a terminator that sorts a string after any longer string it begins."""
+    if isinstance(value, str):
+        return tuple(-ord(char) for char in value) + (1,)
+    return -value
+
+
+def get_sort_key(sorts: List[FieldSort]) -> Tuple[Callable[[Dict], Any], bool]:
+    """Returns a key function that orders items by all of the given sorts, and whether the key is to be
+    applied in reverse. When every sort has the same direction the key is the tuple of the sorted
+    fields; otherwise the descending fields' values are transformed so that one ascending key
+    orders every field in its own direction.
+
+    :param sorts: The sorts to apply, most significant first.
+    :return: The key function and whether to reverse it.
+    """
+    get_values = operator.itemgetter(*(sort.field for sort in sorts))
+    if len({sort.descending for sort in sorts}) == 1:
+        return get_values, sorts[0].descending
+
+    descending = tuple(sort.descending for sort in sorts)
+    return (lambda item: tuple(_descending_key(value) if reverse else value
+                               for value, reverse in zip(get_values(item), descending))), False
+
+
+def parse_sorts(sorts: str | None) -> List[FieldSort]:
     """Evaluates the sort expressions in the given string, returning the parsed sorts.
 
     :param sorts: The sorts to parse.
@@ -287,19 +877,25 @@ def parse_sorts(sorts: str) -> List[FieldSort]:
     return parsed_sorts
 
 
-def sort_list(items: List, sort_exp: str):
+def sort_list(items: List, sort_exp: str | None, limit: int | None = None):
+    """Sorts the given items by each of the fields in the given sort expression in turn, e.g.
+    "size:desc,name". Items that compare equal on every field keep their order.
+
+    :param items: The values to sort.
+    :param sort_exp: A comma-separated list of fields to sort by, each with an optional direction.
+    :param limit: The number of items to return, if not all of them. Only the first items are kept
+        while sorting rather than sorting the whole list.
+    :return: The sorted values.
+    """
     parsed_sorts = parse_sorts(sort_exp)
 
     if not parsed_sorts:
-        return items
-
-    if len(parsed_sorts) > 1:
-        logger.warning("Only the first sort field is currently applied")
-
-    sorter = parsed_sorts[0]
-
-    return sorted(
-        items,
-        key=lambda d: d[sorter.field],
-        reverse=sorter.sort_type == SortType.DESCENDING,
-    )
+        return items if limit is None else items[:limit]
+
+    key, reverse = get_sort_key(parsed_sorts)
+    if limit is None:
+        return sorted(items, key=key, reverse=reverse)
+    # Equivalent to sorting and slicing, in O(n log limit)
+    if reverse:
+        return heapq.nlargest(limit, items, key=key)
+    return heapq.nsmallest(limit, items, key=key)
@@ -0,0 +1,386 @@
+import hashlib
+import json
+import struct
+import sys
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Iterable, Any, Set, cast
+
+import pygtrie
+
+from spotcrates.filters import FieldName, FilterType
+
+# The listing fields covered by the trigram index, in the order their text is stored
+TRIGRAM_FIELDS = [FieldName.PLAYLIST_NAME, FieldName.OWNER, FieldName.PLAYLIST_DESCRIPTION]
+# The short listing fields that are scanned rather than indexed
+SCANNED_FIELDS = [FieldName.SPOTIFY_ID, FieldName.SIZE]
+
+# Mark the start and end of each indexed value so that 'starts', 'ends' and 'equals' filters can
+# narrow by their anchored trigrams
+TEXT_START = "\x02"
+TEXT_END = "\x03"
+
+# Postings hold document numbers as unsigned 32-bit values, stored little-endian on disk
+POSTING_TYPECODE = "I"
+# The listing position of a document that is not in the latest listing
+NO_POSITION = 0xFFFFFFFF
+VERSION_SEPARATOR = "\x00"
+# A saved index starts with the size of its JSON header, which locates the binary sections after it
+HEADER_SIZE = struct.Struct("<I")
+
+
+class PlaylistIndex:
+
+    def __init__(self, playlists: Iterable[Dict[str, Any]]):
+        """Indexes a playlist listing by ID, by exact and case-folded name, and by name prefix so
+        that lookups do not scan the whole listing. Results are returned in listing order.
+
+        :param playlists: The playlists to index, e.g. the result of Playlists.get_all_playlists.
+        """
+        self.playlists: List[Dict[str, Any]] = []
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_name: Dict[str, List[int]] = {}
+        self.by_folded_name: Dict[str, List[int]] = {}
+        self.name_trie = pygtrie.CharTrie()
+
+        for playlist in playlists:
+            if not playlist:
+                continue
+            position = len(self.playlists)
+            self.playlists.append(playlist)
+            playlist_id = playlist.get("id")
+            if playlist_id:
+                self.by_id.setdefault(playlist_id, playlist)
+            name = playlist.get("name")
+            if name:
+                self.by_name.setdefault(name, []).append(position)
+                self.by_folded_name.setdefault(name.casefold(), []).append(position)
+                self.name_trie.setdefault(name, []).append(position)
+
+    def __len__(self):
+        return len(self.playlists)
+
+    def get(self, playlist_id: str) -> Dict[str, Any] | None:
+        """Returns the playlist with the given ID, if any."""
+        return self.by_id.get(playlist_id)
+
+    def find_names(self, name: str, ignore_case: bool = False) -> List[Dict[str, Any]]:
+        """Returns every playlist with the given name.
+
+        :param name: The playlist name to look up.
+        :param ignore_case: Whether to match the name without regard to case.
+        :return: The matching playlists in listing order.
+        """
+        if not name:
+            return []
+        if ignore_case:
+            positions = self.by_folded_name.get(name.casefold(), [])
+        else:
+            positions = self.by_name.get(name, [])
+        return [self.playlists[position] for position in positions]
+
+    def find_name(self, name: str, ignore_case: bool = False) -> Dict[str, Any] | None:
+        """Returns the first playlist with the given name, if any."""
+        matches = self.find_names(name, ignore_case)
+        return matches[0] if matches else None
+
+    def contains_name(self, name: str, ignore_case: bool = False) -> bool:
+        """Returns whether any playlist has the given name."""
+        if ignore_case:
+            return name.casefold() in self.by_folded_name
+        return name in self.by_name
+
+    def with_prefix(self, *prefixes: str) -> List[Dict[str, Any]]:
+        """Returns the playlists whose names start with any of the given (case-sensitive) prefixes.
+
+        :param prefixes: The name prefixes to match.
+        :return: The matching playlists in listing order, each included once.
+        """
+        positions = set()
+        for prefix in prefixes:
+            if prefix is None:
+                continue
+            try:
+                for prefix_positions in self.name_trie.itervalues(prefix=prefix):
+                    positions.update(prefix_positions)
+            except KeyError:
+                # No names start with this prefix
+                continue
+        return [self.playlists[position] for position in sorted(positions)]
+
+
+def get_trigrams(text: str) -> Set[str]:
+    """Returns the three-character substrings of the given text."""
+    return {text[pos:pos + 3] for pos in range(len(text) - 2)}
+
+
+def get_text_version(row: Dict[FieldName, Any]) -> str:
+    """Returns a version for a listing row that has no snapshot ID: the text of its indexed fields."""
+    return VERSION_SEPARATOR.join(str(row.get(field)) for field in TRIGRAM_FIELDS)
+
+
+def get_listing_digest(ids: List[str], versions: List[str]) -> str:
+    """Returns a digest of the given playlist IDs and versions of a listing, in order."""
+    digest = hashlib.sha1("\n".join(ids).encode("utf-8"))
+    digest.update(VERSION_SEPARATOR.encode("utf-8"))
+    digest.update("\n".join(versions).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def new_postings() -> array:
+    return array(POSTING_TYPECODE)
+
+
+def encode_postings(docs: array) -> bytes:
+    """Returns the given document numbers as little-endian values."""
+    if sys.byteorder != "little":
+        docs = array(POSTING_TYPECODE, docs)
+        docs.byteswap()
+    return docs.tobytes()
+
+
+def decode_postings(data: memoryview, offset: int, count: int) -> array:
+    """Returns the given number of document numbers encoded by encode_postings at the offset in data."""
+    docs = new_postings()
+    docs.frombytes(data[offset:offset + count * docs.itemsize])
+    if sys.byteorder != "little":
+        docs.byteswap()
+    return docs
+
+
+class TrigramIndex:
+
+    def __init__(self):
+        """An inverted index of the lowercased three-character substrings of the playlist names, owners
+        and descriptions in a listing, used to narrow 'contains', 'starts', 'ends' and 'equals' filters
+        to the playlists that could match before the filters are checked. The short ID and size fields
+        are scanned instead. Each indexed playlist is a numbered document, recorded with its version
+        (snapshot ID). A playlist whose version changes is indexed again under a new number, and the old
+        one is left in the postings as a hole until there are more holes than documents.
+
+        An update with the same listing as the last one, by digest of its IDs and versions, reads no
+        playlist text. A loaded index only decodes the postings that searches ask for, and its documents
+        once an update changes them."""
+        self.ids: List[str | None] = []
+        self.versions: List[str | None] = []
+        self.docs: Dict[str, int] = {}
+        self.postings: Dict[FieldName, Dict[str, array]] = {field: defaultdict(new_postings) for field in TRIGRAM_FIELDS}
+        self.holes = 0
+        self.digest: str | None = None
+        # The listing rows from the latest update and the position of each document in them
+        self.rows: List[Dict[FieldName, Any]] = []
+        self.positions = new_postings()
+        # The saved index this was loaded from, and where its undecoded documents and postings are in it
+        self._data: memoryview | None = None
+        self._docs_span: List[int] = []
+        self._spans: Dict[FieldName, Dict[str, List[int]]] = {field: {} for field in TRIGRAM_FIELDS}
+
+    def __len__(self):
+        self._load()
+        return len(self.docs)
+
+    def __contains__(self, playlist_id: str) -> bool:
+        self._load()
+        return playlist_id in self.docs
+
+    def update(self, rows: List[Dict[FieldName, Any]], versions: List[str | None] | None = None) -> bool:
+        """Indexes the given listing rows, e.g. from Playlists.list_all_playlists. Only the playlists
+        whose versions are new or have changed since the last update are indexed again, and playlists no
+        longer in the listing are dropped. A playlist listed more than once is indexed as of its first row.
+
+        :param rows: The complete playlist listing.
+        :param versions: The version of each row's playlist, such as its snapshot ID. Rows without one
+            are versioned by their text.
+        :return: Whether the index changed.
+        """
+        row_ids = [row[FieldName.SPOTIFY_ID] for row in rows]
+        if versions and all(versions):
+            row_versions = cast(List[str], versions)
+        else:
+            row_versions = [version or get_text_version(row)
+                            for row, version in zip(rows, versions or [None] * len(rows))]
+        digest = get_listing_digest(row_ids, row_versions)
+        self.rows = rows
+        if digest == self.digest:
+            return False
+
+        self._load()
+        positions: Dict[int, int] = {}
+        for position, (playlist_id, version) in enumerate(zip(row_ids, row_versions)):
+            doc = self.docs.get(playlist_id)
+            if doc is not None and doc in positions:
+                continue
+            if doc is None or self.versions[doc] != version:
+                if doc is not None:
+                    self._remove(doc)
+                doc = self._add(playlist_id, version, rows[position])
+            positions[doc] = position
+
+        for doc in [doc for doc in self.docs.values() if doc not in positions]:
+            self._remove(doc)
+
+        if self.holes > len(self.docs):
+            positions = self._compact(rows, positions)
+
+        self.digest = digest
+        self.positions = array(POSTING_TYPECODE, [NO_POSITION]) * len(self.ids)
+        for doc, position in positions.items():
+            self.positions[doc] = position
+        return True
+
+    def search(self, field: FieldName, filter_type: FilterType, value: str) -> Set[int] | None:
+        """Returns the documents whose field could pass the given filter, or None if the index cannot
+        narrow it (a numeric filter, or a value too short to hold a trigram). The candidates may
+        include holes and must still be checked against the filter.
+
+        :param field: The field to search, which may be FieldName.ALL.
+        :param filter_type: The type of filter.
+        :param value: The lowercased filter value.
+        :return: The candidate document numbers, or None for every document.
+        """
+        if field == FieldName.ALL:
+            candidates: Set[int] = set()
+            for regular_field in FieldName.list_regular_fields():
+                field_candidates = self.search(regular_field, filter_type, value)
+                if field_candidates is None:
+                    return None
+                candidates.update(field_candidates)
+            return candidates
+
+        if field in SCANNED_FIELDS:
+            if filter_type.is_numeric:
+                return None
+            matches = filter_type.compile(value)
+            rows = self.rows
+            return {doc for doc, position in enumerate(self.positions)
+                    if position != NO_POSITION and matches(str(rows[position].get(field)).lower())}
+
+        if filter_type == FilterType.CONTAINS:
+            trigrams = get_trigrams(value)
+        elif filter_type == FilterType.STARTS:
+            trigrams = get_trigrams(TEXT_START + value)
+        elif filter_type == FilterType.ENDS:
+            trigrams = get_trigrams(value + TEXT_END)
+        elif filter_type == FilterType.EQUALS:
+            trigrams = get_trigrams(TEXT_START + value + TEXT_END)
+        else:
+            return None
+        if not trigrams:
+            return None
+
+        # Intersect the shortest postings first, stopping once nothing is left
+        doc_lists = sorted((self._get_postings(field, trigram) for trigram in trigrams), key=len)
+        candidates = set(doc_lists[0])
+        for doc_list in doc_lists[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(doc_list)
+        return candidates
+
+    def select(self, items: Iterable[Dict[FieldName, Any]], candidates: Set[int]) -> Iterable[Dict[FieldName, Any]]:
+        """Returns the given items, less the indexed playlists that are not candidates. For the rows of
+        the latest update, only the candidates are visited, in listing order.
+
+        :param items: The listing rows being filtered.
+        :param candidates: The candidate document numbers from search.
+        :return: The items that may pass the search.
+        """
+        if items is self.rows:
+            positions = self.positions
+            return [self.rows[position] for position in sorted(positions[doc] for doc in candidates)
+                    if position != NO_POSITION]
+        self._load()
+        candidate_ids = {self.ids[doc] for doc in candidates}
+        return (item for item in items
+                if item[FieldName.SPOTIFY_ID] in candidate_ids or item[FieldName.SPOTIFY_ID] not in self.docs)
+
+    def to_bytes(self) -> bytes:
+        """Returns this index as a JSON header followed by the document positions, the documents and the
+        postings it locates."""
+        self._load()
+        body = bytearray()
+
+        def add_section(section: bytes, count: int) -> List[int]:
+            offset = len(body)
+            body.extend(section)
+            return [offset, count]
+
+        documents = json.dumps([self.ids, self.versions], separators=(",", ":")).encode("utf-8")
+        header = {"digest": self.digest, "holes": self.holes,
+                  "positions": add_section(encode_postings(self.positions), len(self.positions)),
+                  "docs": add_section(documents, len(documents)),
+                  "postings": {field.name: {trigram: add_section(encode_postings(docs), len(docs))
+                                            for trigram, docs in postings.items()}
+                               for field, postings in self.postings.items()}}
+        header["size"] = len(body)
+        header_data = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        return HEADER_SIZE.pack(len(header_data)) + header_data + body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TrigramIndex":
+        """Creates an index from the output of to_bytes, leaving its documents and postings to be decoded
+        as they are needed."""
+        (header_size,) = HEADER_SIZE.unpack_from(data)
+        body_start = HEADER_SIZE.size + header_size
+        header = json.loads(data[HEADER_SIZE.size:body_start])
+        if len(data) - body_start != header["size"]:
+            raise ValueError(f"Expected {header['size']} bytes of index data, got {len(data) - body_start}")
+        index = cls()
+        index.digest = header["digest"]
+        index.holes = header["holes"]
+        index._data = memoryview(data)[body_start:]
+        index.positions = decode_postings(index._data, *header["positions"])
+        index._docs_span = header["docs"]
+        index._spans = {field: header["postings"][field.name] for field in TRIGRAM_FIELDS}
+        return index
+
+    def _get_postings(self, field: FieldName, trigram: str) -> array:
+        postings = self.postings[field]
+        docs = postings.get(trigram)
+        if docs is None:
+            span = self._spans[field].pop(trigram, None)
+            if span is None or self._data is None:
+                return new_postings()
+            docs = postings[trigram] = decode_postings(self._data, *span)
+        return docs
+
+    def _load(self):
+        """Decodes the documents and the remaining postings of a loaded index."""
+        if self._data is None:
+            return
+        offset, size = self._docs_span
+        self.ids, self.versions = json.loads(bytes(self._data[offset:offset + size]))
+        self.docs = {playlist_id: doc for doc, playlist_id in enumerate(self.ids) if playlist_id is not None}
+        for field, spans in self._spans.items():
+            self.postings[field].update((trigram, decode_postings(self._data, *span)) for trigram, span in spans.items())
+            spans.clear()
+        self._data = None
+
+    def _add(self, playlist_id: str, version: str, row: Dict[FieldName, Any]) -> int:
+        doc = len(self.ids)
+        self.ids.append(playlist_id)
+        self.versions.append(version)
+        self.docs[playlist_id] = doc
+        for field in TRIGRAM_FIELDS:
+            postings = self.postings[field]
+            for trigram in get_trigrams(TEXT_START + str(row.get(field)).lower() + TEXT_END):
+                postings[trigram].append(doc)
+        return doc
+
+    def _remove(self, doc: int):
+        self.docs.pop(self.ids[doc] or "", None)
+        self.ids[doc] = None
+        self.versions[doc] = None
+        self.holes += 1
+
+    def _compact(self, rows: List[Dict[FieldName, Any]], positions: Dict[int, int]) -> Dict[int, int]:
+        """Renumbers the documents without holes from their listing rows, returning the new numbers'
+        listing positions."""
+        live = [(self.ids[doc], self.versions[doc], position) for doc, position in positions.items()]
+        self.ids, self.versions, self.docs, self.holes = [], [], {}, 0
+        self.postings = {field: defaultdict(new_postings) for field in TRIGRAM_FIELDS}
+        compacted = {}
+        for playlist_id, version, position in live:
+            if playlist_id is not None and version is not None:
+                compacted[self._add(playlist_id, version, rows[position])] = position
+        return compacted
@@ -1,15 +1,22 @@
 import datetime
 import logging
 import random
-from contextlib import suppress
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import List, Set, Dict, Tuple, Any, Iterable
+from itertools import chain
+from typing import List, Set, Dict, Tuple, Any, Iterable, Callable, Iterator, TypeVar
 
 from durations_nlp import Duration
 from spotipy import Spotify
 
-from spotcrates.common import batched, get_all_items, ISO_8601_TIMESTAMP_FORMAT, ZERO_TIMESTAMP
+from spotcrates.common import iter_all_items, ISO_8601_TIMESTAMP_FORMAT, ZERO_EPOCH, FetchProfile, \
+    PLAYLIST_ITEMS_PAGE_LIMIT, PLAYLISTS_PAGE_LIMIT, get_page_offsets, SingleFlight
+from spotcrates.cache import PlaylistCache, ExclusionIndex, SubscriptionState, HighWaterMark, ListingIndex
 from spotcrates.filters import FieldName, filter_list, sort_list
+from spotcrates.index import PlaylistIndex
+from spotcrates.tracks import TrackRef, TrackIdSet, to_added_at
+from spotcrates.writer import PlaylistWriter, iter_unique
 
 config_defaults = {
     "daily_mix_prefix": "Daily Mix",
@@ -20,8 +27,15 @@ config_defaults = {
     "include_zero_timestamps": True,
     "playlists": {},
     "oldest_timestamp": None,
+    "page_workers": 1,
+    "playlist_workers": 4,
 }
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
 
 class PlaylistException(Exception):
     pass
@@ -49,44 +63,49 @@ class PlaylistResult(Enum):
 
 class Playlists:
 
-    def __init__(self, spotify: Spotify, config: Dict | None = None):
+    def __init__(self, spotify: Spotify, config: Dict | None = None, cache: PlaylistCache | None = None,
+                 exclusions: ExclusionIndex | None = None, subscription_state: SubscriptionState | None = None,
+                 listing_index: ListingIndex | None = None):
         """Creates an instance of the playlist manipulation class.
 
         :param spotify: A handle for the initialized SpotiPy client.
         :param config: The configuration for the playlists class.
+        :param cache: An optional cache of playlist contents keyed by snapshot ID.
+        :param exclusions: An optional persistent index of the target and exclude playlists' track IDs.
+        :param subscription_state: An optional record of what the last subscriptions run saw.
+        :param listing_index: An optional persistent trigram index of the playlist listing for filtering.
         """
         self.spotify = spotify
+        self.cache = cache
+        self.exclusions = exclusions
+        self.subscription_state = subscription_state
+        self.listing_index = listing_index
+        self.writer = PlaylistWriter(spotify)
         self.logger = logging.getLogger(__name__)
 
         self.config = self._process_config(config)
 
-    def get_all_playlists(self) -> List[Dict]:
-        return get_all_items(self.spotify, self.spotify.current_user_playlists())
-
-    def list_all_playlists(self, sort_fields=None, filters=None) -> List[Dict]:
-        playlist_entries = []
-        for playlist in self.get_all_playlists():
-            playlist_entries.append(
-                {
-                    FieldName.SPOTIFY_ID: playlist["id"],
-                    FieldName.PLAYLIST_NAME: playlist["name"],
-                    FieldName.SIZE: playlist["tracks"]["total"],
-                    FieldName.OWNER: playlist["owner"]["id"],
-                    FieldName.PLAYLIST_DESCRIPTION: playlist["description"],
-                }
-            )
-
-        if not sort_fields and not filters:
-            return playlist_entries
-
-        processed_entries = playlist_entries
-        if filters:
-            processed_entries = filter_list(processed_entries, filters)
-
-        if sort_fields:
-            processed_entries = sort_list(processed_entries, sort_fields)
+        # Run-scoped memos of account data, cleared whenever we create or modify a playlist
+        self._memo_lock = threading.RLock()
+        self._all_playlists: List[Dict] | None = None
+        self._me: Dict | None = None
+        self._playlist_index: PlaylistIndex | None = None
+        # Reads of the same playlist contents share one fetch for the rest of the run
+        self._track_reads = SingleFlight()
 
-        return processed_entries
+    def get_all_playlists(self) -> List[Dict]:
+        """Returns every playlist the current user owns or follows. The listing is fetched once and
+        reused until this instance creates or modifies a playlist."""
+        with self._memo_lock:
+            if self._all_playlists is None:
+                self._all_playlists = list(self._iter_all_items(
+                    self.spotify.current_user_playlists(limit=PLAYLISTS_PAGE_LIMIT),
+                    lambda offset: self.spotify.current_user_playlists(limit=PLAYLISTS_PAGE_LIMIT, offset=offset),
+                ))
+            return list(self._all_playlists)
+
+    def list_all_playlists(self, sort_fields=None, filters=None, limit: int | None = None) -> List[Dict]:
+        return get_listing_rows(self.get_all_playlists(), sort_fields, filters, self.listing_index, limit)
 
     def append_daily_mix(self, randomize: bool, target_name: str):
         """Combines all of the "daily mix" playlists for the account and removes any
@@ -99,51 +118,49 @@ class Playlists:
         :param target_name: The name of the list to append to or create. The configured
         list at 'daily_mix_target' is used if no name is provided here.
         """
-        dailies = []
-        target_list = None
-        exclude_lists = []
-        daily_mix_prefix = self.config.get("daily_mix_prefix")
+        daily_mix_prefixes = self._get_config_prefixes("daily_mix_prefix")
         if target_name:
             daily_mix_target = target_name
         else:
             daily_mix_target = self.config.get("daily_mix_target")
 
-        daily_mix_exclude_prefix = self.config.get("daily_mix_exclude_prefix")
-        for playlist in self.get_all_playlists():
-            list_name = playlist.get("name")
-            if list_name:
-                if list_name.startswith(daily_mix_prefix):
-                    dailies.append(playlist)
-                elif list_name == daily_mix_target:
-                    target_list = playlist
-                elif list_name.startswith(daily_mix_exclude_prefix):
-                    exclude_lists.append(playlist)
+        playlist_index = self._get_playlist_index()
+        dailies = playlist_index.with_prefix(*daily_mix_prefixes)
+        daily_ids = {daily["id"] for daily in dailies}
+        target_list = next((playlist for playlist in playlist_index.find_names(daily_mix_target)
+                            if playlist["id"] not in daily_ids), None)
+        exclude_lists = self._get_exclude_lists(playlist_index, daily_ids, target_list)
 
         # TODO: Optionally create if it doesn't exist
         if not target_list:
-            me = self.spotify.me()
-
-            target_list = self.spotify.user_playlist_create(
-                me["id"], daily_mix_target, public=False
-            )
+            target_list = self._create_playlist(daily_mix_target)
 
         # user_playlist_add_tracks(user, playlist_id, tracks, position=None)
         if not dailies:
             self.logger.warning(
-                f"No daily mixes found with the prefix '{daily_mix_prefix}'"
+                f"No daily mixes found with the prefix(es) {daily_mix_prefixes}"
             )
             return
 
         exclude_ids = self._get_excludes(exclude_lists, target_list)
 
+        if not randomize:
+            # Without a shuffle, the first mixes can be written while later ones are still being read
+            add_count, orig_daily_count = self._append_daily_tracks(target_list, dailies, exclude_ids)
+            self.logger.info(
+                f"{add_count} added from an original count of {orig_daily_count}"
+            )
+            if not add_count:
+                self.logger.warning("No daily songs to add")
+            return
+
         add_tracks, orig_daily_count = self._fetch_daily_tracks(dailies, exclude_ids)
 
         self.logger.info(
             f"{len(add_tracks)} to add from an original count of {orig_daily_count}"
         )
         if add_tracks:
-            if randomize:
-                random.shuffle(add_tracks)
+            random.shuffle(add_tracks)
             self._add_tracks_to_playlist(target_list, add_tracks)
         else:
             self.logger.warning("No daily songs to add")
@@ -155,9 +172,8 @@ class Playlists:
         :return: The result of the randomization attempt.
         """
         try:
-            playlist_tracks = self._get_playlist_id_tracks(playlist["id"])
-            random.shuffle(playlist_tracks)
-            self._add_tracks_to_playlist(playlist, playlist_tracks, replace_playlist=True)
+            playlist_tracks = self._get_playlist_id_tracks(playlist)
+            self._add_tracks_to_playlist(playlist, self._shuffled(playlist_tracks), replace_playlist=True)
             return PlaylistResult.SUCCESS
         except Exception:
             self.logger.warning(f"Problems randomizing playlist '{playlist['name']}'", exc_info=True)
@@ -171,35 +187,26 @@ class Playlists:
         :param target_name: The target list to append to. The configured target list at
           'subscriptions_target' is used if no name is provided here.
         """
-        target_list = None
-        exclude_lists = []
         if target_name:
             subscriptions_target = target_name
         else:
             subscriptions_target = self.config.get("subscriptions_target")
-        exclude_prefix = self.config.get("daily_mix_exclude_prefix")
-        for playlist in self.get_all_playlists():
-            list_name = playlist["name"]
-            if list_name:
-                if list_name == subscriptions_target:
-                    target_list = playlist
-                elif list_name.startswith(exclude_prefix):
-                    exclude_lists.append(playlist)
+
+        playlist_index = self._get_playlist_index()
+        target_list = playlist_index.find_name(subscriptions_target)
+        exclude_lists = self._get_exclude_lists(playlist_index, set(), target_list)
 
         oldest_timestamp = self._get_oldest_timestamp()
 
         # TODO: Optionally create if it doesn't exist
         if not target_list:
-            me = self.spotify.me()
-
-            target_list = self.spotify.user_playlist_create(
-                me["id"], subscriptions_target, public=False
-            )
+            target_list = self._create_playlist(subscriptions_target)
 
         excludes = self._get_excludes(exclude_lists, target_list)
 
         include_zero_timestamps = self.config.get("include_zero_timestamps", False)
-        playlist_ids = self._get_subscription_playlist_ids(oldest_timestamp, excludes, include_zero_timestamps)
+        playlist_ids = self._get_subscription_playlist_ids(oldest_timestamp, excludes, include_zero_timestamps,
+                                                           target_list["id"])
 
         self.logger.info(f"{len(playlist_ids)} subscription tracks to add")
 
@@ -207,31 +214,12 @@ class Playlists:
             playlist_ids = list(playlist_ids)
             random.shuffle(playlist_ids)
 
-        for id_batch in batched(playlist_ids, 100):
-            self.logger.debug(f"Batch size: {len(id_batch)}")
-            self.spotify.playlist_add_items(target_list["id"], id_batch)
+        self._append_to_playlist(target_list, playlist_ids)
+        if self.subscription_state is not None:
+            self.subscription_state.save()
 
     def _get_oldest_timestamp(self):
-        cfg_oldest_timestamp = self.config.get("oldest_timestamp")
-
-        if cfg_oldest_timestamp:
-            try:
-                return datetime.datetime.strptime(
-                    cfg_oldest_timestamp, ISO_8601_TIMESTAMP_FORMAT
-                )
-            except Exception as e:
-                self.logger.warning(f"Could not parse oldest_timestamp value {cfg_oldest_timestamp}",
-                                    exc_info=True)
-
-        max_age = "NO_MAX_AGE"
-        try:
-            max_age = self.config.get("max_age", "NO_MAX_AGE")
-
-            return datetime.datetime.now() - datetime.timedelta(
-                seconds=Duration(max_age).to_seconds()
-            )
-        except Exception as e:
-            raise PlaylistConfigException(f"Could not parse track age {max_age}", e)
+        return get_oldest_timestamp(self.config)
 
     def randomize_playlists(self, playlists: List[str]) -> Dict[str, PlaylistResult]:
         """Replaces the tracks in the target lists with a randomized version of the same tracks.
@@ -240,20 +228,12 @@ class Playlists:
         :return: The results of the randomizing.
         """
 
-        lower_playlists = [playlist.lower() for playlist in playlists]
+        playlist_index = self._get_playlist_index()
 
-        results = {}
-        for playlist in self.get_all_playlists():
-            list_name = playlist["name"]
-            if list_name and list_name.lower() in lower_playlists:
-                results[list_name] = self.randomize_playlist(playlist)
-            else:
-                list_id = playlist['id']
-                if list_id in playlists:
-                    results[list_id] = self.randomize_playlist(playlist)
+        targets, missing_targets = find_playlists(playlist_index, playlists)
+
+        results = dict(zip(targets.keys(), self._run_for_playlists(self.randomize_playlist, targets.values())))
 
-        found_targets = results.keys()
-        missing_targets = [missing for missing in playlists if missing not in found_targets]
         for missing_target in missing_targets:
             results[missing_target] = PlaylistResult.NOT_FOUND
 
@@ -267,9 +247,9 @@ class Playlists:
             else:
                 dest_name = arguments[1]
 
-            # TODO: make public flag settable
-            new_playlist = self.spotify.user_playlist_create(self.spotify.me()['id'], dest_name, public=False)
+            # Read the source before creating the destination so that the listing is only fetched once
             tracks_to_copy = self._get_playlist_name_tracks(source_name)
+            new_playlist = self._create_playlist(dest_name)
 
             if randomize:
                 random.shuffle(tracks_to_copy)
@@ -280,180 +260,605 @@ class Playlists:
             self.logger.warning("Problems copying list", exc_info=True)
             return PlaylistResult.FAILURE, None
 
+    def copy_lists(self, source_names: List[str], randomize: bool) -> Dict[str, Tuple[PlaylistResult, str | None]]:
+        """Copies each of the given playlists into a new playlist named after its source. The copies
+        are made concurrently.
+
+        :param source_names: The names of the playlists to copy.
+        :param randomize: Whether to randomize the order of the copied tracks.
+        :return: The result and destination name of each copy, keyed by source name.
+        """
+        playlist_index = self._get_playlist_index()
+
+        # Resolve every source and reserve every destination name up front so that concurrent copies
+        # neither refetch the listing nor pick the same name
+        results: Dict[str, Tuple[PlaylistResult, str | None]] = {}
+        copies: List[Tuple[str, Dict, str]] = []
+        reserved_names: Set[str] = set()
+        for source_name in dict.fromkeys(source_names):
+            source = playlist_index.find_name(source_name, ignore_case=True)
+            if not source:
+                self.logger.warning(f"No playlist found for name '{source_name}'")
+                results[source_name] = (PlaylistResult.NOT_FOUND, None)
+                continue
+            try:
+                dest_name = self._create_unique_dest_name(source_name, reserved_names)
+            except PlaylistNamingException:
+                self.logger.warning(f"Problems naming copy of '{source_name}'", exc_info=True)
+                results[source_name] = (PlaylistResult.FAILURE, None)
+                continue
+            reserved_names.add(dest_name.casefold())
+            copies.append((source_name, source, dest_name))
+
+        copy_results = self._run_for_playlists(lambda copy: self._copy_playlist(copy[1], copy[2], randomize), copies)
+        for (source_name, _, dest_name), result in zip(copies, copy_results):
+            results[source_name] = (result, dest_name if result == PlaylistResult.SUCCESS else None)
+
+        # Report in the order the sources were given
+        return {source_name: results[source_name] for source_name in dict.fromkeys(source_names)}
+
     # ===Internal Methods=== #
 
+    def _copy_playlist(self, source: Dict, dest_name: str, randomize: bool) -> PlaylistResult:
+        try:
+            tracks_to_copy = self._get_playlist_id_tracks(source)
+            new_playlist = self._create_playlist(dest_name)
+
+            if randomize:
+                random.shuffle(tracks_to_copy)
+
+            self._add_tracks_to_playlist(new_playlist, tracks_to_copy)
+            return PlaylistResult.SUCCESS
+        except Exception:
+            self.logger.warning(f"Problems copying playlist '{source['name']}'", exc_info=True)
+            return PlaylistResult.FAILURE
+
+    def _run_for_playlists(self, task: Callable[[T], R], playlists: Iterable[T]) -> List[R]:
+        """Runs the given task for each playlist on a bounded pool of workers, returning the results
+        in the order the playlists were given."""
+        return list(self._iter_for_playlists(task, playlists))
+
+    def _iter_for_playlists(self, task: Callable[[T], R], playlists: Iterable[T]) -> Iterator[R]:
+        """Runs the given task for each playlist on a bounded pool of workers, yielding each result in
+        the order the playlists were given as soon as it and those before it are done."""
+        playlists = list(playlists)
+        playlist_workers = min(self.config.get("playlist_workers") or 1, len(playlists))
+        if playlist_workers <= 1:
+            yield from (task(playlist) for playlist in playlists)
+            return
+        with ThreadPoolExecutor(max_workers=playlist_workers) as executor:
+            yield from executor.map(task, playlists)
+
     def _fetch_daily_tracks(self, dailies: List, exclude_ids: Iterable[str]):
-        add_tracks = []
+        add_tracks: List[TrackRef] = []
         orig_daily_count = 0
-        for daily in dailies:
-            daily_items = self._get_playlist_id_tracks(daily["id"])
-            orig_daily_count += len(daily_items)
-            add_tracks.extend(
-                [
-                    daily_item
-                    for daily_item in daily_items
-                    if daily_item["track"]["id"] not in exclude_ids
-                ]
-            )
+        for daily_tracks in self._iter_for_playlists(self._get_daily_tracks, dailies):
+            orig_daily_count += len(daily_tracks)
+            add_tracks.extend(daily_item for daily_item in daily_tracks if daily_item.id not in exclude_ids)
         return add_tracks, orig_daily_count
 
+    def _append_daily_tracks(self, target_list: Dict[str, Any], dailies: List,
+                             exclude_ids: Iterable[str]) -> Tuple[int, int]:
+        """Appends the daily mixes' tracks to the target playlist in mix order, skipping excluded and
+        repeated tracks. The mixes are read ahead on the playlist workers, and each batch is written as
+        soon as it fills rather than after every mix has been read.
+
+        :return: The number of tracks added and the number of tracks in the mixes.
+        """
+        orig_daily_count = 0
+
+        def iter_add_ids() -> Iterator[str]:
+            nonlocal orig_daily_count
+            for daily_tracks in self._iter_for_playlists(self._get_daily_tracks, dailies):
+                orig_daily_count += len(daily_tracks)
+                yield from (daily_item.id for daily_item in daily_tracks if daily_item.id not in exclude_ids)
+
+        add_count = self._append_to_playlist(target_list, iter_add_ids())
+        return add_count, orig_daily_count
+
+    def _get_daily_tracks(self, daily: Dict) -> List[TrackRef]:
+        return list(self._iter_tracks(daily["id"], FetchProfile.TRACK_IDS, daily.get("snapshot_id")))
+
     def _get_subscription_playlist_ids(self,
-                                       oldest_timestamp: datetime,
+                                       oldest_timestamp: datetime.datetime,
                                        excluded_ids: Iterable[str],
-                                       include_zero_timestamps: bool) -> Set[str]:
-        target_playlist_ids: Set[str] = set()
+                                       include_zero_timestamps: bool,
+                                       target_id: str | None = None) -> TrackIdSet:
         subscription_playlists = self.config.get("playlists")
         if not subscription_playlists:
             self.logger.warning("No subscription playlists defined")
-            return target_playlist_ids
-
+            return TrackIdSet()
+
+        # Compare every track against the cutoff as an integer rather than parsing it into a datetime
+        oldest_added_at = to_added_at(oldest_timestamp)
+        # Read each playlist once, however many sets it is in, and all of them concurrently
+        unique_playlist_ids = list(dict.fromkeys(chain.from_iterable(subscription_playlists.values())))
+        playlist_new_ids = dict(zip(unique_playlist_ids, self._run_for_playlists(
+            lambda playlist_id: self._get_new_subscription_ids(playlist_id, oldest_added_at, excluded_ids,
+                                                               include_zero_timestamps, target_id),
+            unique_playlist_ids)))
+
+        set_playlist_ids = []
         for playlist_set, playlist_ids in subscription_playlists.items():
             self.logger.debug(f"Processing subscription set '{playlist_set}'")
-            set_playlist_ids = set()
-            for track in self._get_playlist_id_tracks(*playlist_ids):
-                iso_added = track.get("added_at")
-                if iso_added:
-                    try:
-                        track_timestamp = datetime.datetime.strptime(
-                            iso_added, ISO_8601_TIMESTAMP_FORMAT
-                        )
-                        if self._include_for_added_at(oldest_timestamp, track_timestamp, include_zero_timestamps):
-                            track_id = track.get("track", {}).get("id")
-                            if track_id and track_id not in excluded_ids:
-                                set_playlist_ids.add(track_id)
-                    except Exception:
-                        self.logger.warning(
-                            f"Could not parse timestamp {iso_added}. Skipping track.",
-                            exc_info=True,
-                        )
-                else:
-                    logging.debug("No 'added_at' field for track. Skipping.")
+            set_new_ids = set().union(*(playlist_new_ids[playlist_id] for playlist_id in playlist_ids))
             self.logger.debug(
-                f"Found {len(set_playlist_ids)} newer than {oldest_timestamp} "
+                f"Found {len(set_new_ids)} newer than {oldest_timestamp} "
                 f"in playlist set '{playlist_set}'"
             )
-            target_playlist_ids.update(set_playlist_ids)
+            set_playlist_ids.append(set_new_ids)
 
+        target_playlist_ids = TrackIdSet(chain.from_iterable(set_playlist_ids))
         self.logger.debug(
             f"Found a total of {len(target_playlist_ids)} newer than {oldest_timestamp}"
         )
         return target_playlist_ids
 
+    def _get_new_subscription_ids(self, playlist_id: str, oldest_added_at: int, excluded_ids: Iterable[str],
+                                  include_zero_timestamps: bool, target_id: str | None = None) -> Set[str]:
+        """Returns the IDs of the tracks added to the given subscribed playlist since the oldest 'added_at'
+        value (in seconds since the epoch) that are not excluded."""
+        new_ids = set()
+        since_added_at, new_tracks = self._get_new_subscription_tracks(playlist_id, oldest_added_at, target_id)
+        for track in new_tracks:
+            if track.added_at is not None:
+                if self._include_for_added_at(since_added_at, track.added_at, include_zero_timestamps):
+                    if track.id not in excluded_ids:
+                        new_ids.add(track.id)
+            else:
+                logging.debug("No valid 'added_at' field for track. Skipping.")
+        return new_ids
+
+    def _get_new_subscription_tracks(self, playlist_id: str, oldest_added_at: int,
+                                     target_id: str | None = None) -> Tuple[int, List[TrackRef]]:
+        """Returns the tracks of the given subscribed playlist that may be new along with the time they
+        must have been added after. With a subscription state and a target, a playlist whose snapshot ID
+        has not changed since the last run to that target yields no tracks, and a changed one is read back
+        only to the newest track seen last time. Marks made with a later cutoff are not used, so that a
+        longer maximum age still picks up the older tracks. The new high-water mark is recorded but not
+        saved."""
+        if self.subscription_state is None or target_id is None:
+            snapshot_id = self._get_playlist_version(playlist_id)[0] if self.cache else None
+            return oldest_added_at, self._get_recent_tracks(playlist_id, oldest_added_at, snapshot_id)
+
+        snapshot_id, total = self._get_playlist_version(playlist_id)
+        mark = self.subscription_state.get(target_id, playlist_id)
+        if mark and not mark.covers(oldest_added_at):
+            self.logger.debug(f"Subscription playlist {playlist_id} was last read with a later cutoff")
+            mark = None
+        if mark and snapshot_id and mark.snapshot_id == snapshot_id:
+            self.logger.debug(f"Subscription playlist {playlist_id} is unchanged since the last run")
+            return oldest_added_at, []
+
+        since_added_at = oldest_added_at
+        # Timestamps have one-second resolution, and the newest track seen last time is not new
+        if mark and mark.newest_added_at and mark.newest_added_at >= since_added_at:
+            since_added_at = mark.newest_added_at + 1
+        tracks = self._get_recent_tracks(playlist_id, since_added_at, snapshot_id)
+
+        if snapshot_id:
+            newest_added_at = max((track.added_at for track in tracks
+                                   if track.added_at and track.added_at != ZERO_EPOCH),
+                                  default=mark.newest_added_at if mark else None)
+            if mark and mark.total is not None and total is not None:
+                self.logger.debug(f"Subscription playlist {playlist_id} went from {mark.total} to {total} tracks")
+            # Tracks back to the earlier mark's cutoff have now all been considered
+            covered_added_at = mark.oldest_added_at if mark else oldest_added_at
+            self.subscription_state.set(target_id, playlist_id,
+                                        HighWaterMark(snapshot_id, total, newest_added_at, covered_added_at))
+        return since_added_at, tracks
+
+    def _get_playlist_version(self, playlist_id: str) -> Tuple[str | None, int | None]:
+        """Looks up the current snapshot ID and track count of the given playlist."""
+        try:
+            playlist = self.spotify.playlist(playlist_id, fields="snapshot_id,tracks.total")
+            return playlist.get("snapshot_id"), (playlist.get("tracks") or {}).get("total")
+        except Exception:
+            self.logger.warning(f"Could not look up the snapshot ID for playlist {playlist_id}", exc_info=True)
+            return None, None
+
+    def _get_recent_tracks(self, playlist_id: str, oldest_added_at: int,
+                           snapshot_id: str | None = None) -> List[TrackRef]:
+        """Returns the playlist's tracks that may have been added since the given time. Most subscribed
+        playlists only append, so the pages are read from the end of the playlist backwards, stopping
+        at the first page added entirely before the oldest 'added_at' value. A playlist whose 'added_at' values
+        are missing, zero or out of order is read in full.
+
+        :param playlist_id: The ID of the playlist to read.
+        :param oldest_added_at: The earliest 'added_at' value of interest, in seconds since the epoch.
+        :param snapshot_id: The playlist's current snapshot ID, if known.
+        :return: The tracks added since the oldest 'added_at' value, and possibly some older ones.
+        """
+        profile = FetchProfile.ADDED_TRACK_IDS
+        if self.cache and snapshot_id:
+            cached_tracks = self.cache.get(playlist_id, snapshot_id, profile)
+            if cached_tracks is not None:
+                return cached_tracks
+
+        def fetch_page(offset: int) -> Dict[str, Any]:
+            return self.spotify.playlist_items(playlist_id, fields=profile.fields,
+                                               limit=PLAYLIST_ITEMS_PAGE_LIMIT, offset=offset)
+
+        first_page = self.spotify.playlist_items(playlist_id, fields=profile.fields, limit=PLAYLIST_ITEMS_PAGE_LIMIT)
+        offsets = get_page_offsets(first_page)
+
+        recent_pages: List[List[TrackRef]] = []
+        # The earliest 'added_at' in the pages read so far, which every earlier track must precede
+        newer_bound = None
+        for offset in reversed(offsets):
+            page_tracks = [track for track in (TrackRef.from_item(item) for item in fetch_page(offset)["items"] if item)
+                           if track]
+            if not self._is_added_in_order(page_tracks, newer_bound):
+                self.logger.debug(f"Tracks in playlist {playlist_id} are not in 'added_at' order; reading all")
+                break
+            if page_tracks:
+                newest_added = page_tracks[-1].added_at
+                if newest_added and newest_added < oldest_added_at:
+                    self.logger.debug(f"Read {len(recent_pages) + 1} of {len(offsets) + 1} pages "
+                                      f"for playlist {playlist_id}")
+                    return list(chain.from_iterable(reversed(recent_pages)))
+                newer_bound = page_tracks[0].added_at
+            recent_pages.append(page_tracks)
+        else:
+            # Every later page was in order and recent, so the first page completes the playlist
+            first_tracks = [track for track in (TrackRef.from_item(item) for item in first_page["items"] if item)
+                            if track]
+            if self._is_added_in_order(first_tracks, newer_bound):
+                recent_pages.append(first_tracks)
+                tracks = list(chain.from_iterable(reversed(recent_pages)))
+                if self.cache and snapshot_id:
+                    self.cache.put(playlist_id, snapshot_id, profile, tracks)
+                return tracks
+
+        tracks = list(self._iter_all_items(first_page, fetch_page, TrackRef.from_item))
+        if self.cache and snapshot_id:
+            self.cache.put(playlist_id, snapshot_id, profile, tracks)
+        return tracks
+
     @staticmethod
-    def _include_for_added_at(oldest_timestamp: datetime,
-                              track_timestamp: datetime,
+    def _is_added_in_order(tracks: List[TrackRef], newer_bound: int | None) -> bool:
+        """Returns whether the given tracks have real 'added_at' values in order, none later than the bound."""
+        previous = None
+        for track in tracks:
+            if not track.added_at or track.added_at == ZERO_EPOCH:
+                return False
+            if previous and track.added_at < previous:
+                return False
+            previous = track.added_at
+        return not (previous and newer_bound and previous > newer_bound)
+
+    @staticmethod
+    def _include_for_added_at(oldest_added_at: int,
+                              track_added_at: int,
                               include_zero_timestamps: bool) -> bool:
         if include_zero_timestamps:
-            return track_timestamp >= oldest_timestamp or track_timestamp == ZERO_TIMESTAMP
+            return track_added_at >= oldest_added_at or track_added_at == ZERO_EPOCH
         else:
-            return track_timestamp >= oldest_timestamp
+            return track_added_at >= oldest_added_at
+
+    def _get_playlist_track_ids(self, *args: str | Dict) -> TrackIdSet:
+        return TrackIdSet(chain.from_iterable(self._iter_track_ids(playlist) for playlist in args))
+
+    def _iter_track_ids(self, playlist: str | Dict) -> Iterator[str]:
+        playlist_id, snapshot_id = self._id_and_snapshot(playlist)
+        return (track.id for track in self._iter_tracks(playlist_id, FetchProfile.TRACK_IDS, snapshot_id))
+
+    def _get_playlist_name_tracks(self, *playlist_names: str) -> List[TrackRef]:
+        playlist_index = self._get_playlist_index()
+        playlists = []
+        for playlist_name in playlist_names:
+            playlist = playlist_index.find_name(playlist_name, ignore_case=True)
+            if playlist:
+                playlists.append(playlist)
+            else:
+                self.logger.warning(f"No playlist found for name '{playlist_name}'")
+        return self._get_playlist_id_tracks(*playlists)
 
-    def _get_playlist_track_ids(self, *args: str) -> Set[str]:
-        track_ids: Set[str] = set([])
-        for playlist_id in args:
-            playlist_items = self._filter_for_tracks(playlist_id)
+    def _get_playlist_id_tracks(self, *playlists: str | Dict, profile=FetchProfile.TRACK_IDS) -> List[TrackRef]:
+        tracks: List[TrackRef] = []
+        for playlist in playlists:
+            playlist_id, snapshot_id = self._id_and_snapshot(playlist)
+            tracks.extend(self._iter_tracks(playlist_id, profile, snapshot_id))
 
-            track_ids.update(
-                {playlist_item.get("track", {}).get("id") for playlist_item in playlist_items}
-            )
+        return tracks
 
-        # Remove None in case any IDs failed to resolve
-        with suppress(KeyError):
-            # noinspection PyTypeChecker
-            track_ids.remove(None)  # type: ignore
-        return track_ids
-
-    def _get_playlist_names_to_ids(self, lower=False) -> Dict[str, str]:
-        name_ids = {}
-        for playlist in self.get_all_playlists():
-            if lower:
-                name_ids[playlist['name'].lower()] = playlist['id']
-            else:
-                name_ids[playlist['name']] = playlist['id']
+    @staticmethod
+    def _id_and_snapshot(playlist: str | Dict) -> Tuple[str, str | None]:
+        """Returns the ID and snapshot ID (if known) for the given playlist or playlist ID."""
+        if isinstance(playlist, dict):
+            return playlist["id"], playlist.get("snapshot_id")
+        return playlist, None
+
+    def _iter_all_items(self, first_page: Dict[str, Any],
+                        page_fetcher: Callable[[int], Dict[str, Any]],
+                        transform: Callable[[Any], Any] | None = None) -> Iterator[Any]:
+        """Pages through the given result set by offset, retrying failed pages and fetching the
+        remaining pages concurrently when more than one page worker is configured."""
+        page_workers = self.config.get("page_workers") or 1
+        return iter_all_items(self.spotify, first_page, page_fetcher, max_workers=page_workers,
+                              transform=transform)
+
+    def _iter_tracks(self, playlist_id: str, profile: FetchProfile = FetchProfile.FULL,
+                     snapshot_id: str | None = None) -> Iterator[TrackRef]:
+        """Yields references to the playlist's valid tracks. Without a cache entry to read or write, the
+        tracks are streamed page by page. Otherwise concurrent reads of the same playlist contents share
+        a single cache read (or fetch), and repeated reads are served from the cache.
+
+        :param playlist_id: The ID of the playlist to read.
+        :param profile: The fields to request for each item.
+        :param snapshot_id: The playlist's current snapshot ID, if known.
+        """
+        cache = self.cache
+        if cache is None or snapshot_id is None:
+            return self._stream_tracks(playlist_id, profile)
+        return iter(self._track_reads.do((playlist_id, profile, snapshot_id),
+                                         lambda: self._read_through_cache(cache, playlist_id, profile, snapshot_id)))
+
+    def _stream_tracks(self, playlist_id: str, profile: FetchProfile) -> Iterator[TrackRef]:
+        # Items without a valid track are dropped by TrackRef.from_item
+        return self._iter_all_items(
+            self.spotify.playlist_items(playlist_id, fields=profile.fields, limit=PLAYLIST_ITEMS_PAGE_LIMIT),
+            lambda offset: self.spotify.playlist_items(playlist_id, fields=profile.fields,
+                                                       limit=PLAYLIST_ITEMS_PAGE_LIMIT, offset=offset),
+            TrackRef.from_item,
+        )
 
-        return name_ids
+    def _read_through_cache(self, cache: PlaylistCache, playlist_id: str, profile: FetchProfile,
+                            snapshot_id: str) -> List[TrackRef]:
+        cached_tracks = cache.get(playlist_id, snapshot_id, profile)
+        if cached_tracks is not None:
+            return cached_tracks
 
-    def _get_playlist_name_tracks(self, *playlist_names: str) -> List[dict]:
-        name_id_map = self._get_playlist_names_to_ids(lower=True)
-        playlist_ids = []
-        for lower_name in [name.lower() for name in playlist_names]:
-            playlist_id = name_id_map.get(lower_name)
-            if playlist_id:
-                playlist_ids.append(playlist_id)
-            else:
-                self.logger.warning(f"No playlist found for name '{lower_name}'")
-        return self._get_playlist_id_tracks(*playlist_ids)
+        tracks = list(self._stream_tracks(playlist_id, profile))
+        cache.put(playlist_id, snapshot_id, profile, tracks)
+        return tracks
 
-    def _get_playlist_id_tracks(self, *playlist_ids: str) -> List[dict]:
-        tracks = []
-        for playlist_id in playlist_ids:
-            filtered_tracks = self._filter_for_tracks(playlist_id)
+    def _add_tracks_to_playlist(self, target_list: Dict[str, Any], add_tracks: List[TrackRef], replace_playlist=False):
+        """Appends the given tracks to the target playlist in order, or makes them its only contents when
+        replacing."""
+        track_ids = [add_song.id for add_song in add_tracks]
 
-            tracks.extend(filtered_tracks)
+        if replace_playlist:
+            try:
+                self.writer.replace(target_list["id"], track_ids)
+            finally:
+                self._invalidate_playlist(target_list["id"])
+        else:
+            self._append_to_playlist(target_list, track_ids)
 
-        return tracks
+    def _append_to_playlist(self, target_list: Dict[str, Any], track_ids: Iterable[str]) -> int:
+        """Appends the given tracks to the target playlist, skipping repeats. The IDs may be produced
+        lazily, as the writer sends each batch as soon as it fills.
 
-    def _filter_for_tracks(self, playlist_id):
-        all_tracks = get_all_items(self.spotify, self.spotify.playlist_items(playlist_id))
-        filtered_tracks = []
-        for cur_track in all_tracks:
-            if cur_track.get('track') and cur_track['track'].get('id'):
-                filtered_tracks.append(cur_track)
-        return filtered_tracks
-
-    def _add_tracks_to_playlist(self, target_list: Dict[str, Any], add_tracks: List, replace_playlist=False):
-        track_ids = {add_song["track"]["id"] for add_song in add_tracks}
-
-        first_batch = True
-        for id_batch in batched(track_ids, 100):
-            if replace_playlist and first_batch:
-                self.spotify.playlist_replace_items(target_list["id"], id_batch)
-            else:
-                self.spotify.playlist_add_items(target_list["id"], id_batch)
-            self.logger.debug(f"Batch size: {len(id_batch)}")
-            first_batch = False
+        :return: The number of tracks appended.
+        """
+        appended_ids: List[str] = []
 
-    def _get_excludes(self, exclude_lists: List[Dict], target_list: Dict):
-        exclude_ids = self._get_playlist_track_ids(target_list["id"])
-        for exclude_list in exclude_lists:
-            exclude_ids.update(self._get_playlist_track_ids(exclude_list["id"]))
-        return exclude_ids
+        def record_ids(unique_ids: Iterable[str]) -> Iterator[str]:
+            for track_id in unique_ids:
+                appended_ids.append(track_id)
+                yield track_id
+
+        try:
+            new_snapshot_id = self.writer.append(target_list["id"], record_ids(iter_unique(track_ids)))
+            if self.exclusions is not None:
+                self.exclusions.add_ids(target_list["id"], target_list.get("snapshot_id"), new_snapshot_id,
+                                        appended_ids)
+        finally:
+            # Batches written before any failure have still changed the playlist
+            self._invalidate_playlist(target_list["id"])
+        return len(appended_ids)
+
+    @staticmethod
+    def _shuffled(tracks: List[TrackRef]) -> List[TrackRef]:
+        return shuffled(tracks)
+
+    def _get_excludes(self, exclude_lists: List[Dict], target_list: Dict) -> TrackIdSet:
+        contributors = [target_list, *exclude_lists]
+        if self.exclusions is not None:
+            return self.exclusions.get_ids(
+                ((playlist["id"], playlist.get("snapshot_id")) for playlist in contributors),
+                lambda playlist_id, snapshot_id: self._get_playlist_track_ids(
+                    {"id": playlist_id, "snapshot_id": snapshot_id}),
+            )
+
+        return TrackIdSet().union(*(self._get_playlist_track_ids(playlist) for playlist in contributors))
 
     @staticmethod
     def _process_config(config: Dict | None) -> Dict:
-        processed_config = {}
+        return process_config(config)
+
+    def _get_playlist_index(self) -> PlaylistIndex:
+        """Returns an index over the playlist listing, built once per listing."""
+        with self._memo_lock:
+            if self._playlist_index is None:
+                self._playlist_index = PlaylistIndex(self.get_all_playlists())
+            return self._playlist_index
 
-        source_config = {}
-        if config:
-            source_config = config
+    def _get_config_prefixes(self, key: str) -> List[str]:
+        return get_config_prefixes(self.config, key)
 
-        for key, default_value in config_defaults.items():
-            processed_config[key] = source_config.get(key, default_value)
+    def _get_exclude_lists(self, playlist_index: PlaylistIndex, skip_ids: Set[str],
+                           target_list: Dict | None) -> List[Dict]:
+        return get_exclude_lists(self.config, playlist_index, skip_ids, target_list)
 
-        return processed_config
+    def _get_me(self) -> Dict:
+        """Returns the current user's profile, fetching it at most once."""
+        with self._memo_lock:
+            if self._me is None:
+                self._me = self.spotify.me()
+            return self._me
 
-    def _get_playlist_names(self, lower=False) -> List[str]:
-        if lower:
-            return [playlist["name"].lower() for playlist in self.get_all_playlists()]
+    def _create_playlist(self, name: str) -> Dict:
+        """Creates a private playlist with the given name for the current user."""
+        # TODO: make public flag settable
+        new_playlist = self.spotify.user_playlist_create(self._get_me()["id"], name, public=False)
+        self._invalidate_playlists()
+        return new_playlist
+
+    def _invalidate_playlists(self):
+        """Drops the memoized playlist listing and the index built from it."""
+        with self._memo_lock:
+            self._all_playlists = None
+            self._playlist_index = None
+
+    def _invalidate_playlist(self, playlist_id: str):
+        """Stops sharing reads of a playlist that this instance has just modified."""
+        self._track_reads.forget(lambda key: key[0] == playlist_id)
+        self._invalidate_playlists()
+
+    def _create_unique_dest_name(self, source_name: str, reserved_names: Set[str] | None = None):
+        return create_unique_dest_name(self._get_playlist_index(), source_name, reserved_names)
+
+
+# ===Shared Helpers=== #
+# Used by both Playlists and its asyncio counterpart in spotcrates.aio
+
+def process_config(config: Dict | None) -> Dict:
+    """Returns the given playlist config with defaults filled in for any missing settings."""
+    processed_config = {}
+
+    source_config = {}
+    if config:
+        source_config = config
+
+    for key, default_value in config_defaults.items():
+        processed_config[key] = source_config.get(key, default_value)
+
+    return processed_config
+
+
+def get_oldest_timestamp(config: Dict) -> datetime.datetime:
+    """Returns the earliest 'added_at' time of interest to subscriptions as a naive UTC time, from either
+    the configured oldest timestamp or the configured maximum age."""
+    cfg_oldest_timestamp = config.get("oldest_timestamp")
+
+    if cfg_oldest_timestamp:
+        try:
+            return datetime.datetime.strptime(
+                cfg_oldest_timestamp, ISO_8601_TIMESTAMP_FORMAT
+            )
+        except Exception:
+            logger.warning(f"Could not parse oldest_timestamp value {cfg_oldest_timestamp}",
+                           exc_info=True)
+
+    max_age = "NO_MAX_AGE"
+    try:
+        max_age = config.get("max_age", "NO_MAX_AGE")
+
+        # Naive UTC, like the configured timestamp and the API's 'added_at' values
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(
+            seconds=Duration(max_age).to_seconds()
+        )
+    except Exception as e:
+        raise PlaylistConfigException(f"Could not parse track age {max_age}", e)
+
+
+def get_config_prefixes(config: Dict, key: str) -> List[str]:
+    """Returns the configured name prefix(es) for the given key as a list."""
+    prefixes = config.get(key)
+    if not prefixes:
+        return []
+    if isinstance(prefixes, str):
+        return [prefixes]
+    return list(prefixes)
+
+
+def get_exclude_lists(config: Dict, playlist_index: PlaylistIndex, skip_ids: Set[str],
+                      target_list: Dict | None) -> List[Dict]:
+    """Returns the playlists matching the exclude prefix(es), other than the target and the given IDs."""
+    if target_list:
+        skip_ids = skip_ids | {target_list["id"]}
+    return [playlist for playlist in
+            playlist_index.with_prefix(*get_config_prefixes(config, "daily_mix_exclude_prefix"))
+            if playlist["id"] not in skip_ids]
+
+
+def get_listing_rows(all_playlists: Iterable[Dict], sort_fields=None, filters=None,
+                     listing_index: ListingIndex | None = None, limit: int | None = None) -> List[Dict]:
+    """Returns the rows of the playlist listing table for the given playlists, filtered and sorted. Filters
+    are narrowed through the listing index, if given. With a limit, only that many rows are returned."""
+    playlist_entries = []
+    versions = []
+    for playlist in all_playlists:
+        versions.append(playlist.get("snapshot_id"))
+        playlist_entries.append(
+            {
+                FieldName.SPOTIFY_ID: playlist["id"],
+                FieldName.PLAYLIST_NAME: playlist["name"],
+                FieldName.SIZE: playlist["tracks"]["total"],
+                FieldName.OWNER: playlist["owner"]["id"],
+                FieldName.PLAYLIST_DESCRIPTION: playlist["description"],
+            }
+        )
+
+    if not sort_fields and not filters:
+        return playlist_entries if limit is None else playlist_entries[:limit]
+
+    processed_entries = playlist_entries
+    if filters:
+        index = listing_index.get_index(playlist_entries, versions) if listing_index else None
+        processed_entries = filter_list(processed_entries, filters, index)
+
+    if sort_fields:
+        processed_entries = sort_list(processed_entries, sort_fields, limit)
+    elif limit is not None:
+        processed_entries = processed_entries[:limit]
+
+    return processed_entries
+
+
+def find_playlists(playlist_index: PlaylistIndex, playlists: Iterable[str]) -> Tuple[Dict[str, Dict], List[str]]:
+    """Looks up the given playlist names and IDs. Names are matched without regard to case; anything
+    else is tried as an ID.
+
+    :return: The matching playlists keyed by name or ID, and the names and IDs that matched nothing.
+    """
+    targets: Dict[str, Dict] = {}
+    missing_targets = []
+    for requested in playlists:
+        name_matches = playlist_index.find_names(requested, ignore_case=True)
+        id_match = playlist_index.get(requested)
+        if name_matches:
+            for playlist in name_matches:
+                targets[playlist["name"]] = playlist
+        elif id_match:
+            targets[requested] = id_match
         else:
-            return [playlist["name"] for playlist in self.get_all_playlists()]
+            missing_targets.append(requested)
+    return targets, missing_targets
 
-    def _create_unique_dest_name(self, source_name: str):
-        existing_lists = self._get_playlist_names(lower=True)
-        count = 1
 
-        dest_name = f"{source_name}-{count:02d}"
+def shuffled(tracks: List[TrackRef]) -> List[TrackRef]:
+    """Returns the given tracks in a new random order, never the order they are in now."""
+    shuffled_tracks = list(tracks)
+    if len({track.id for track in tracks}) < 2:
+        return shuffled_tracks
+    while [track.id for track in shuffled_tracks] == [track.id for track in tracks]:
+        random.shuffle(shuffled_tracks)
+    return shuffled_tracks
 
-        if dest_name.lower() not in existing_lists:
-            return dest_name
 
-        max_count = 99
+def create_unique_dest_name(playlist_index: PlaylistIndex, source_name: str,
+                            reserved_names: Set[str] | None = None) -> str:
+    """Returns the first '(source)-NN' name not used by an existing playlist or found in the given
+    set of case-folded names reserved for playlists that are about to be created."""
+    reserved_names = reserved_names or set()
+    count = 1
+
+    dest_name = f"{source_name}-{count:02d}"
+
+    if not (playlist_index.contains_name(dest_name, ignore_case=True) or dest_name.casefold() in reserved_names):
+        return dest_name
 
-        while count <= max_count:
-            count += 1
-            dest_name = f"{source_name}-{count:02d}"
+    max_count = 99
 
-            if dest_name.lower() not in existing_lists:
-                return dest_name
+    while count <= max_count:
+        count += 1
+        dest_name = f"{source_name}-{count:02d}"
+
+        if not (playlist_index.contains_name(dest_name, ignore_case=True)
+                or dest_name.casefold() in reserved_names):
+            return dest_name
 
-        raise PlaylistNamingException(f"Unable to find a unique playlist name (gave up at {dest_name})")
+    raise PlaylistNamingException(f"Unable to find a unique playlist name (gave up at {dest_name})")
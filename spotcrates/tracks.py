@@ -0,0 +1,291 @@
+import array
+import base64
+import bisect
+import calendar
+import datetime
+import functools
+import logging
+import sys
+import time
+from typing import Dict, Any, Tuple, List, Iterable, Iterator, Set
+
+from spotcrates.common import ISO_8601_TIMESTAMP_FORMAT, ZERO_ADDED_AT, ZERO_EPOCH
+
+logger = logging.getLogger(__name__)
+
+# Spotify IDs are 22 base62 digits that encode a 128-bit value
+BASE62_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE62_VALUES = {digit: value for value, digit in enumerate(BASE62_ALPHABET)}
+# Decoding two digits at a time halves the number of divisions
+BASE62_PAIRS = [high + low for high in BASE62_ALPHABET for low in BASE62_ALPHABET]
+BASE62_PAIR_COUNT = len(BASE62_PAIRS)
+TRACK_ID_LENGTH = 22
+ENCODED_ID_BYTES = 16
+MAX_ENCODED_ID = 1 << (ENCODED_ID_BYTES * 8)
+# TrackIdSet holds each encoded ID as two unsigned 64-bit words
+ID_WORD_TYPECODE = "Q"
+ID_WORD_BITS = 64
+ID_WORD_MASK = (1 << ID_WORD_BITS) - 1
+# Playlists repeat 'added_at' values heavily (tracks added in bulk, the zero timestamp), so parses are memoized
+ADDED_AT_CACHE_SIZE = 8192
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+class TrackRef:
+    """A compact reference to a playlist track, holding only what spotcrates uses from the API's
+    playlist item: the track ID, when it was added (in seconds since the epoch, UTC) and (when
+    requested) its artist and album IDs."""
+
+    __slots__ = ("id", "added_at", "artist_ids", "album_id")
+
+    def __init__(self, track_id: str, added_at: int | None = None,
+                 artist_ids: Tuple[str, ...] = (), album_id: str | None = None):
+        self.id = track_id
+        self.added_at = added_at
+        self.artist_ids = artist_ids
+        self.album_id = album_id
+
+    @classmethod
+    def from_item(cls, item: Dict[str, Any]) -> "TrackRef | None":
+        """Creates a reference from a playlist item as returned by the API.
+
+        :param item: The playlist item.
+        :return: The reference, or None if the item does not refer to a valid track.
+        """
+        track = item.get("track")
+        if not track or not track.get("id"):
+            return None
+
+        artist_ids = tuple(artist["id"] for artist in track.get("artists") or () if artist and artist.get("id"))
+        album = track.get("album")
+        album_id = album.get("id") if album else None
+        return cls(track["id"], parse_added_at(item.get("added_at")), artist_ids, album_id)
+
+    def to_row(self) -> List:
+        """Returns a JSON-serializable representation of this reference."""
+        return [self.id, format_added_at(self.added_at), list(self.artist_ids), self.album_id]
+
+    @classmethod
+    def from_row(cls, row: List) -> "TrackRef":
+        """Creates a reference from the output of to_row."""
+        track_id, added_at, artist_ids, album_id = row
+        return cls(track_id, parse_added_at(added_at), tuple(artist_ids), album_id)
+
+    def __eq__(self, other):
+        if isinstance(other, TrackRef):
+            return (self.id, self.added_at, self.artist_ids, self.album_id) == \
+                (other.id, other.added_at, other.artist_ids, other.album_id)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"TrackRef({self.id}, {self.added_at})"
+
+
+@functools.lru_cache(maxsize=ADDED_AT_CACHE_SIZE)
+def parse_added_at(iso_added: str | None) -> int | None:
+    """Parses a playlist item's 'added_at' timestamp into seconds since the epoch (UTC), returning None
+    if it is missing or invalid. The fixed-width 'YYYY-MM-DDTHH:MM:SSZ' form is read by position rather
+    than through strptime, and repeated values are only parsed once."""
+    if not iso_added:
+        return None
+    if iso_added == ZERO_ADDED_AT:
+        return ZERO_EPOCH
+    try:
+        return _parse_fixed_width(iso_added)
+    except ValueError:
+        logger.warning(f"Could not parse timestamp {iso_added}")
+        return None
+
+
+def _parse_fixed_width(iso_added: str) -> int:
+    if (len(iso_added) != 20 or iso_added[4] != "-" or iso_added[7] != "-" or iso_added[10] != "T"
+            or iso_added[13] != ":" or iso_added[16] != ":" or iso_added[19] != "Z"):
+        raise ValueError(iso_added)
+    digits = iso_added[0:4] + iso_added[5:7] + iso_added[8:10] + iso_added[11:13] + iso_added[14:16] + iso_added[17:19]
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(iso_added)
+    hour, minute, second = int(digits[8:10]), int(digits[10:12]), int(digits[12:14])
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError(iso_added)
+    # The date constructor rejects out-of-range days and months
+    days = datetime.date(int(digits[0:4]), int(digits[4:6]), int(digits[6:8])).toordinal() - EPOCH_ORDINAL
+    return days * 86400 + hour * 3600 + minute * 60 + second
+
+
+def format_added_at(added_at: int | None) -> str | None:
+    """Returns the 'added_at' timestamp for the output of parse_added_at."""
+    if added_at is None:
+        return None
+    return time.strftime(ISO_8601_TIMESTAMP_FORMAT, time.gmtime(added_at))
+
+
+def to_added_at(timestamp: datetime.datetime) -> int:
+    """Returns the given time in seconds since the epoch, for comparison with 'added_at' values. Naive
+    times are taken to be UTC, as the API's timestamps are."""
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def encode_track_id(track_id: str) -> bytes | None:
+    """Packs a Spotify track ID into 16 big-endian bytes, so that the encodings sort in numeric order.
+
+    :param track_id: The 22-character base62 track ID.
+    :return: The encoded ID, or None if the ID is not a 22-digit base62 value that fits in 128 bits.
+    """
+    value = encode_track_value(track_id)
+    if value is None:
+        return None
+    return value.to_bytes(ENCODED_ID_BYTES, "big")
+
+
+def encode_track_value(track_id: str) -> int | None:
+    """Returns the 128-bit value of a Spotify track ID, or None if it is not a 22-digit base62 value that
+    fits in 128 bits."""
+    if len(track_id) != TRACK_ID_LENGTH:
+        return None
+    value = 0
+    try:
+        for digit in track_id:
+            value = value * 62 + BASE62_VALUES[digit]
+    except KeyError:
+        return None
+    if value >= MAX_ENCODED_ID:
+        return None
+    return value
+
+
+def decode_track_id(encoded: bytes) -> str:
+    """Returns the track ID for the output of encode_track_id."""
+    return decode_track_value(int.from_bytes(encoded, "big"))
+
+
+def decode_track_value(value: int) -> str:
+    """Returns the track ID for the output of encode_track_value."""
+    digit_pairs = []
+    for _ in range(TRACK_ID_LENGTH // 2):
+        value, pair = divmod(value, BASE62_PAIR_COUNT)
+        digit_pairs.append(BASE62_PAIRS[pair])
+    return "".join(reversed(digit_pairs))
+
+
+def split_values(values: List[int]) -> Tuple[array.array, array.array]:
+    """Returns arrays of the high and low 64-bit words of the given 128-bit values."""
+    return (array.array(ID_WORD_TYPECODE, [value >> ID_WORD_BITS for value in values]),
+            array.array(ID_WORD_TYPECODE, [value & ID_WORD_MASK for value in values]))
+
+
+class TrackIdSet:
+
+    def __init__(self, track_ids: Iterable[str] = ()):
+        """A set of track IDs held as the sorted 128-bit values of the IDs, split into parallel arrays of
+        their high and low 64 bits: 16 bytes per ID rather than the ~70 of a string in a set. Membership
+        tests encode the queried ID and binary search the arrays. The arrays load from
+        and store to a buffer of big-endian 16-byte records without decoding any ID. IDs that cannot be
+        encoded are kept in an ordinary set.
+
+        :param track_ids: The track IDs to hold.
+        """
+        unique_values = set()
+        self.overflow: Set[str] = set()
+        for track_id in track_ids:
+            value = encode_track_value(track_id)
+            if value is None:
+                self.overflow.add(track_id)
+            else:
+                unique_values.add(value)
+        self.high, self.low = split_values(sorted(unique_values))
+
+    @classmethod
+    def from_buffer(cls, buffer: bytes, overflow: Iterable[str] = ()) -> "TrackIdSet":
+        """Creates a set from a sorted buffer of encoded IDs, such as one saved by to_row."""
+        words = array.array(ID_WORD_TYPECODE)
+        words.frombytes(buffer)
+        if sys.byteorder == "little":
+            words.byteswap()
+        id_set = cls()
+        id_set.high = words[0::2]
+        id_set.low = words[1::2]
+        id_set.overflow = set(overflow)
+        return id_set
+
+    @property
+    def buffer(self) -> bytes:
+        """The sorted big-endian 16-byte records of this set's encoded IDs."""
+        words = array.array(ID_WORD_TYPECODE, bytes(ENCODED_ID_BYTES * len(self.high)))
+        words[0::2] = self.high
+        words[1::2] = self.low
+        if sys.byteorder == "little":
+            words.byteswap()
+        return words.tobytes()
+
+    def to_row(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable representation of this set."""
+        return {"buffer": base64.b64encode(self.buffer).decode("ascii"), "overflow": sorted(self.overflow)}
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "TrackIdSet":
+        """Creates a set from the output of to_row."""
+        return cls.from_buffer(base64.b64decode(row["buffer"]), row["overflow"])
+
+    def __len__(self):
+        return len(self.high) + len(self.overflow)
+
+    def __contains__(self, track_id) -> bool:
+        if not isinstance(track_id, str):
+            return False
+        value = encode_track_value(track_id)
+        if value is None:
+            return track_id in self.overflow
+        high = self.high
+        value_high = value >> ID_WORD_BITS
+        start = bisect.bisect_left(high, value_high)
+        if start == len(high) or high[start] != value_high:
+            return False
+        # IDs sharing their high 64 bits are rare, so the low words are only searched within that run
+        end = bisect.bisect_right(high, value_high, start)
+        value_low = value & ID_WORD_MASK
+        position = bisect.bisect_left(self.low, value_low, start, end)
+        return position < end and self.low[position] == value_low
+
+    def __iter__(self) -> Iterator[str]:
+        for value_high, value_low in zip(self.high, self.low):
+            yield decode_track_value(value_high << ID_WORD_BITS | value_low)
+        yield from self.overflow
+
+    def __eq__(self, other):
+        if isinstance(other, TrackIdSet):
+            return self.high == other.high and self.low == other.low and self.overflow == other.overflow
+        if isinstance(other, (set, frozenset)):
+            return len(self) == len(other) and all(track_id in self for track_id in other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TrackIdSet({len(self)} IDs)"
+
+    def union(self, *others: "TrackIdSet | Iterable[str]") -> "TrackIdSet":
+        """Returns a new set holding the IDs in this set and the given sets or iterables of IDs."""
+        union = TrackIdSet()
+        union.high = self.high
+        union.low = self.low
+        union.overflow = set(self.overflow)
+        union.update(*others)
+        return union
+
+    def update(self, *others: "TrackIdSet | Iterable[str]"):
+        """Adds the IDs in the given sets or iterables of IDs to this set."""
+        id_sets = [other if isinstance(other, TrackIdSet) else TrackIdSet(other) for other in others]
+        id_sets = [id_set for id_set in id_sets if len(id_set)]
+        if not id_sets:
+            return
+        values = set()
+        for id_set in [self] + id_sets:
+            values.update([value_high << ID_WORD_BITS | value_low
+                           for value_high, value_low in zip(id_set.high, id_set.low)])
+        self.high, self.low = split_values(sorted(values))
+        self.overflow = self.overflow.union(*(id_set.overflow for id_set in id_sets))
+
+    def missing(self, track_ids: Iterable[str]) -> List[str]:
+        """Returns the given IDs that are not in this set, in the order given."""
+        return [track_id for track_id in track_ids if track_id not in self]
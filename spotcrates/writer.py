@@ -0,0 +1,74 @@
+import logging
+from typing import List, Any, Iterable, Iterator
+
+from spotipy import Spotify
+
+from spotcrates.common import batched
+
+# The most items the API accepts in a single add or replace request
+WRITE_BATCH_SIZE = 100
+
+
+class PlaylistWriter:
+
+    def __init__(self, spotify: Spotify, batch_size: int = WRITE_BATCH_SIZE):
+        """Writes playlist contents in as few API requests as the batch size allows, keeping the
+        order the tracks are given in.
+
+        :param spotify: The Spotify client to write with.
+        :param batch_size: The most tracks to send in a single request.
+        """
+        self.spotify = spotify
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+
+    def append(self, playlist_id: str, track_ids: Iterable[str]) -> str | None:
+        """Appends the given tracks to the end of the playlist in the given order. Each batch is sent as
+        soon as it fills, so the IDs may be produced lazily while earlier batches are written.
+
+        :param playlist_id: The ID of the playlist to add to.
+        :param track_ids: The IDs of the tracks to add. Repeated IDs are only added once.
+        :return: The playlist's snapshot ID after the last batch, if any tracks were added.
+        """
+        snapshot_id = None
+        for id_batch in batched(iter_unique(track_ids), self.batch_size):
+            snapshot_id = get_snapshot_id(self.spotify.playlist_add_items(playlist_id, id_batch), snapshot_id)
+            self.logger.debug(f"Batch size: {len(id_batch)}")
+        return snapshot_id
+
+    def replace(self, playlist_id: str, track_ids: Iterable[str]) -> int:
+        """Makes the given tracks the playlist's only contents, in the given order.
+
+        :param playlist_id: The ID of the playlist to write.
+        :param track_ids: The IDs of the tracks the playlist should hold. Repeated IDs are only
+          written once.
+        :return: The number of API requests made.
+        """
+        unique_ids = dedupe(track_ids)
+        id_batches = list(batched(unique_ids, self.batch_size)) or [[]]
+        self.spotify.playlist_replace_items(playlist_id, id_batches[0])
+        for id_batch in id_batches[1:]:
+            self.spotify.playlist_add_items(playlist_id, id_batch)
+        self.logger.debug(f"Replaced playlist {playlist_id} in {len(id_batches)} requests")
+        return len(id_batches)
+
+
+def dedupe(track_ids: Iterable[str]) -> List[str]:
+    """Returns the given IDs without repeats, keeping the first occurrence of each."""
+    return list(dict.fromkeys(track_ids))
+
+
+def iter_unique(track_ids: Iterable[str]) -> Iterator[str]:
+    """Yields the given IDs without repeats as they arrive, keeping the first occurrence of each."""
+    seen = set()
+    for track_id in track_ids:
+        if track_id not in seen:
+            seen.add(track_id)
+            yield track_id
+
+
+def get_snapshot_id(response: Any, default: str | None) -> str | None:
+    """Returns the snapshot ID from a playlist write response, or the given default if it has none."""
+    if isinstance(response, dict):
+        return response.get("snapshot_id", default)
+    return default
@@ -0,0 +1,58 @@
+"""Times list-playlists filtering over a large synthetic listing with and without the listing index.
+COLD loads the saved index for each filter, as a new 'spotcrates li -f ...' run does, and WARM reuses
+one loaded index. Both include checking the listing against the index.
+
+Run with ``python -m tests.bench_listing_index [playlist count]``.
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from spotcrates.cache import ListingIndex
+from spotcrates.filters import filter_list
+from spotcrates.playlists import get_listing_rows
+
+WORDS = ["jazz", "rock", "chill", "morning", "focus", "party", "indie", "classic", "mix", "radio", "workout",
+         "sleep", "summer", "drive", "piano", "soul", "blues", "metal", "lofi", "dance"]
+FILTERS = ["d:c:jazzq", "name:s:ab", "n:c:piano soul", "d:c:focus,n:c:drive", "all:soul mix"]
+RUNS = 5
+
+
+def make_listing(count: int):
+    rng = random.Random(1)
+    return [{"id": f"{rng.getrandbits(128):022x}"[:22], "name": " ".join(rng.choices(WORDS, k=3)),
+             "tracks": {"total": rng.randrange(500)}, "owner": {"id": f"user{rng.randrange(1000)}"},
+             "description": " ".join(rng.choices(WORDS, k=12)), "snapshot_id": f"{rng.getrandbits(160):040x}"}
+            for _ in range(count)]
+
+
+def time_runs(run) -> float:
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        run()
+    return (time.perf_counter() - start) / RUNS
+
+
+def main(count: int):
+    listing = make_listing(count)
+    rows = get_listing_rows(listing)
+    versions = [playlist["snapshot_id"] for playlist in listing]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_file = Path(temp_dir, "listing_index.bin")
+        # Build and save the index once, as an earlier run would have
+        ListingIndex(index_file).get_index(rows, versions)
+        warm_index = ListingIndex(index_file)
+        print(f"{count} playlists, mean of {RUNS} runs in seconds")
+        print(f"{'FILTER':<24} {'SCAN':>8} {'COLD':>8} {'WARM':>8}")
+        for filters in FILTERS:
+            scan = time_runs(lambda: filter_list(rows, filters))
+            cold = time_runs(lambda: filter_list(rows, filters, ListingIndex(index_file).get_index(rows, versions)))
+            warm = time_runs(lambda: filter_list(rows, filters, warm_index.get_index(rows, versions)))
+            assert filter_list(rows, filters) == filter_list(rows, filters, warm_index.get_index(rows, versions))
+            print(f"{filters:<24} {scan:>8.4f} {cold:>8.4f} {warm:>8.4f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30000)
@@ -0,0 +1,300 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from spotcrates.client import TokenBucket
+from spotcrates.common import FetchProfile
+from spotcrates.filters import FieldName
+from spotcrates.playlists import PlaylistResult
+
+try:
+    import aiohttp
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    from spotcrates.aio import AsyncSpotify, AsyncPlaylists, gather_all
+except ImportError:
+    web = None
+
+
+class StaticAuthManager:
+    """Hands out a fixed access token, standing in for a spotipy auth manager."""
+
+    def get_access_token(self, as_dict=True):
+        return "test-token"
+
+
+class FakeSpotifyServer:
+    """A minimal stand-in for the Spotify Web API playlist endpoints."""
+
+    def __init__(self):
+        self.playlists = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rate_limit_next = 0
+        self.requests = []
+
+    def add_playlist(self, playlist_id, name, track_ids, added_at="2022-12-14T15:56:13Z"):
+        self.playlists[playlist_id] = {"id": playlist_id, "name": name, "owner": {"id": "testuser"},
+                                       "description": f"{name} description", "snapshot_id": "snap1",
+                                       "track_ids": list(track_ids), "added_at": added_at}
+
+    def get_app(self):
+        @web.middleware
+        async def middleware(request, handler):
+            return await self.check_request(request, handler)
+
+        app = web.Application(middlewares=[middleware])
+        app.router.add_get("/v1/me", self.me)
+        app.router.add_get("/v1/me/playlists", self.current_user_playlists)
+        app.router.add_get("/v1/playlists/{playlist_id}/items", self.playlist_items)
+        app.router.add_post("/v1/playlists/{playlist_id}/items", self.add_items)
+        app.router.add_put("/v1/playlists/{playlist_id}/items", self.replace_items)
+        app.router.add_post("/v1/users/{user}/playlists", self.create_playlist)
+        return app
+
+    async def check_request(self, request, handler):
+        if request.headers.get("Authorization") != "Bearer test-token":
+            return web.json_response({"error": {"status": 401, "message": "No token"}}, status=401)
+        if self.rate_limit_next:
+            self.rate_limit_next -= 1
+            return web.json_response({"error": {"status": 429, "message": "Slow down"}}, status=429,
+                                     headers={"Retry-After": "0"})
+        self.requests.append((request.method, request.path))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Hold each request open briefly so that concurrent requests overlap
+            await asyncio.sleep(0.01)
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    async def me(self, request):
+        return web.json_response({"id": "testuser"})
+
+    async def current_user_playlists(self, request):
+        entries = [{"id": playlist["id"], "name": playlist["name"], "owner": playlist["owner"],
+                    "description": playlist["description"], "snapshot_id": playlist["snapshot_id"],
+                    "tracks": {"total": len(playlist["track_ids"])}}
+                   for playlist in self.playlists.values()]
+        return web.json_response(self.get_page(request, entries))
+
+    async def playlist_items(self, request):
+        playlist = self.playlists[request.match_info["playlist_id"]]
+        items = [{"added_at": playlist["added_at"], "track": {"id": track_id}} for track_id in playlist["track_ids"]]
+        return web.json_response(self.get_page(request, items))
+
+    async def add_items(self, request):
+        playlist = self.playlists[request.match_info["playlist_id"]]
+        playlist["track_ids"].extend(uri.split(":")[-1] for uri in (await request.json())["uris"])
+        return web.json_response({"snapshot_id": "snap2"}, status=201)
+
+    async def replace_items(self, request):
+        playlist = self.playlists[request.match_info["playlist_id"]]
+        playlist["track_ids"] = [uri.split(":")[-1] for uri in (await request.json())["uris"]]
+        return web.json_response({"snapshot_id": "snap2"}, status=201)
+
+    async def create_playlist(self, request):
+        body = await request.json()
+        playlist_id = f"created{len(self.playlists)}"
+        self.add_playlist(playlist_id, body["name"], [])
+        return web.json_response({"id": playlist_id, "name": body["name"]}, status=201)
+
+    @staticmethod
+    def get_page(request, entries):
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 50))
+        return {"items": entries[offset:offset + limit], "offset": offset, "limit": limit, "total": len(entries),
+                "next": None}
+
+
+def make_ids(prefix, count):
+    return [f"{prefix}{i:03d}" for i in range(count)]
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class AsyncPlaylistsTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fake = FakeSpotifyServer()
+        self.server = TestServer(self.fake.get_app())
+        await self.server.start_server()
+        self.spotify = AsyncSpotify(StaticAuthManager(), api_prefix=str(self.server.make_url("/v1/")),
+                                    rate_limiter=TokenBucket(1000, 1000), max_concurrency=2, backoff_factor=0)
+
+    async def asyncTearDown(self):
+        await self.spotify.close()
+        await self.server.close()
+
+    async def test_list_all_playlists(self):
+        for i in range(120):
+            self.fake.add_playlist(f"playlist{i:03d}", f"List {i:03d}", make_ids("t", i % 3))
+        playlists = AsyncPlaylists(self.spotify)
+
+        rows = await playlists.list_all_playlists(filters="n:c:List 11")
+
+        self.assertEqual([f"List {i}" for i in range(110, 120)],
+                         sorted(row[FieldName.PLAYLIST_NAME] for row in rows))
+
+    async def test_append_daily_mix(self):
+        self.fake.add_playlist("target1", "Now", ["a005"])
+        self.fake.add_playlist("overplayed1", "Overplayed", ["a010"])
+        self.fake.add_playlist("daily1", "Daily Mix 1", make_ids("a", 60))
+        self.fake.add_playlist("daily2", "Daily Mix 2", make_ids("a", 150)[50:])
+        self.fake.add_playlist("daily3", "Daily Mix 3", make_ids("b", 10))
+
+        await AsyncPlaylists(self.spotify).append_daily_mix(randomize=False, target_name=None)
+
+        expected = ["a005"] + [f"a{i:03d}" for i in range(150) if i not in (5, 10)] + make_ids("b", 10)
+        self.assertEqual(expected, self.fake.playlists["target1"]["track_ids"])
+        self.assertLessEqual(self.fake.max_in_flight, 2)
+
+    async def test_append_recent_subscriptions(self):
+        self.fake.add_playlist("sub1", "Sub One", ["s001", "s002"])
+        self.fake.add_playlist("sub2", "Sub Two", ["s002", "s003"])
+        self.fake.add_playlist("old1", "Old One", ["o001"], added_at="2020-01-01T00:00:00Z")
+        self.fake.add_playlist("zero1", "Zero One", ["z001"], added_at="1970-01-01T00:00:00Z")
+        config = {"playlists": {"first": ["sub1", "old1"], "second": ["sub2", "zero1"]},
+                  "oldest_timestamp": "2022-12-10T15:56:13Z", "include_zero_timestamps": False}
+
+        await AsyncPlaylists(self.spotify, config).append_recent_subscriptions(randomize=False, target_name=None)
+
+        created = next(playlist for playlist in self.fake.playlists.values() if playlist["name"] == "NewSubscriptions")
+        self.assertEqual(["s001", "s002", "s003"], created["track_ids"])
+        reads = [path for method, path in self.fake.requests if method == "GET" and path.endswith("/items")]
+        self.assertEqual(1, reads.count("/v1/playlists/sub1/items"))
+
+    async def test_randomize_playlists(self):
+        for i in range(6):
+            self.fake.add_playlist(f"playlist{i}", f"Random {i}", make_ids(f"r{i}", 150))
+
+        results = await AsyncPlaylists(self.spotify).randomize_playlists(
+            [f"random {i}" for i in range(6)] + ["missing"])
+
+        self.assertEqual({**{f"Random {i}": PlaylistResult.SUCCESS for i in range(6)},
+                          "missing": PlaylistResult.NOT_FOUND}, results)
+        for i in range(6):
+            track_ids = self.fake.playlists[f"playlist{i}"]["track_ids"]
+            self.assertEqual(sorted(make_ids(f"r{i}", 150)), sorted(track_ids))
+            self.assertNotEqual(make_ids(f"r{i}", 150), track_ids)
+        self.assertLessEqual(self.fake.max_in_flight, 2)
+
+    async def test_copy_list(self):
+        self.fake.add_playlist("source1", "Source", make_ids("c", 120))
+
+        result = await AsyncPlaylists(self.spotify).copy_list(["Source"], randomize=False)
+
+        self.assertEqual((PlaylistResult.SUCCESS, "Source-01"), result)
+        copy = next(playlist for playlist in self.fake.playlists.values() if playlist["name"] == "Source-01")
+        self.assertEqual(make_ids("c", 120), copy["track_ids"])
+
+    async def test_copy_list_ignores_case(self):
+        self.fake.add_playlist("source1", "Source", make_ids("c", 3))
+
+        result, dest_name = await AsyncPlaylists(self.spotify).copy_list(["source"], randomize=False)
+
+        self.assertEqual(PlaylistResult.SUCCESS, result)
+        copy = next(playlist for playlist in self.fake.playlists.values() if playlist["name"] == dest_name)
+        self.assertEqual(make_ids("c", 3), copy["track_ids"])
+
+    async def test_cancelled_read_stops(self):
+        self.fake.add_playlist("big1", "Big", make_ids("g", 5000))
+        playlists = AsyncPlaylists(self.spotify)
+
+        async def fail_soon():
+            await asyncio.sleep(0.05)
+            raise ValueError("Test failure")
+
+        with self.assertRaises(ValueError):
+            await gather_all([playlists._get_tracks("big1", FetchProfile.TRACK_IDS),
+                              playlists._get_tracks("big1", FetchProfile.TRACK_IDS), fail_soon()])
+        await asyncio.sleep(0.05)
+        reads = len(self.fake.requests)
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(reads, len(self.fake.requests))
+        self.assertLess(reads, 50)
+        self.assertEqual({}, playlists._track_reads)
+
+    async def test_finished_read_not_reused(self):
+        self.fake.add_playlist("source1", "Source", make_ids("c", 3))
+        playlists = AsyncPlaylists(self.spotify)
+
+        first, second = await asyncio.gather(playlists._get_tracks("source1", FetchProfile.TRACK_IDS),
+                                             playlists._get_tracks("source1", FetchProfile.TRACK_IDS))
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(self.fake.requests))
+        await asyncio.sleep(0)
+        self.assertEqual({}, playlists._track_reads)
+
+        self.fake.playlists["source1"]["track_ids"].append("new1")
+
+        tracks = await playlists._get_tracks("source1", FetchProfile.TRACK_IDS)
+        self.assertEqual(make_ids("c", 3) + ["new1"], [track.id for track in tracks])
+        self.assertEqual(2, len(self.fake.requests))
+
+    async def test_copy_missing(self):
+        self.fake.add_playlist("source1", "Source", make_ids("c", 3))
+
+        self.assertEqual((PlaylistResult.NOT_FOUND, None),
+                         await AsyncPlaylists(self.spotify).copy_list(["Missing"], randomize=False))
+
+    async def test_rate_limited_retried(self):
+        self.fake.add_playlist("source1", "Source", make_ids("c", 3))
+        self.fake.rate_limit_next = 2
+
+        playlists = await AsyncPlaylists(self.spotify).get_all_playlists()
+
+        self.assertEqual(["Source"], [playlist["name"] for playlist in playlists])
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class AsyncSpotifyRetryTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.spotify = AsyncSpotify(StaticAuthManager(), rate_limiter=TokenBucket(1000, 1000), backoff_factor=0)
+
+    async def test_read_timeout_retried_for_reads(self):
+        with patch.object(AsyncSpotify, "_send", side_effect=[asyncio.TimeoutError(), {"id": "me"}]):
+            self.assertEqual({"id": "me"}, await self.spotify.request("GET", "me"))
+
+    async def test_read_timeout_not_retried_for_writes(self):
+        with patch.object(AsyncSpotify, "_send", side_effect=[aiohttp.SocketTimeoutError(), {}]) as send:
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.spotify.playlist_add_items("playlist1", ["track1"])
+
+        self.assertEqual(1, send.call_count)
+
+    async def test_connect_timeout_retried_for_writes(self):
+        with patch.object(AsyncSpotify, "_send", side_effect=[aiohttp.ConnectionTimeoutError(), {"snapshot_id": "s"}]):
+            self.assertEqual({"snapshot_id": "s"}, await self.spotify.playlist_add_items("playlist1", ["track1"]))
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class GatherAllTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failure_cancels_siblings(self):
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await gather_all([slow(), fail()])
+
+        self.assertEqual([True], cancelled)
+
+    async def test_results_in_order(self):
+        async def delayed(value, delay):
+            await asyncio.sleep(delay)
+            return value
+
+        self.assertEqual([1, 2, 3], await gather_all([delayed(1, 0.02), delayed(2, 0), delayed(3, 0.01)]))
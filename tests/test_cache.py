@@ -0,0 +1,265 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from spotcrates.cache import PlaylistCache, ExclusionIndex, SubscriptionState, HighWaterMark, ListingIndex, \
+    get_listing_index, _write_json_atomic, _load_json
+from spotcrates.common import FetchProfile
+from spotcrates.filters import FieldName, FilterType, filter_list
+from spotcrates.tracks import TrackRef, parse_added_at
+
+TRACKS = [TrackRef("3DrlHWCoFqHQYGwE8MWsuv", parse_added_at("2022-12-14T15:56:13Z"), ("artist1",), "album1"),
+          TrackRef("GWzB3Hhj22I8SLs6Gt9B5O")]
+
+
+class PlaylistCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = PlaylistCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get("playlist1", "snap1", FetchProfile.TRACK_IDS))
+
+    def test_hit(self):
+        self.cache.put("playlist1", "snap/1+", FetchProfile.TRACK_IDS, TRACKS)
+
+        self.assertEqual(TRACKS, self.cache.get("playlist1", "snap/1+", FetchProfile.TRACK_IDS))
+
+    def test_keyed_by_profile(self):
+        self.cache.put("playlist1", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+
+        self.assertIsNone(self.cache.get("playlist1", "snap1", FetchProfile.FULL))
+
+    def test_new_snapshot_replaces_old(self):
+        self.cache.put("playlist1", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+        self.cache.put("playlist1", "snap2", FetchProfile.TRACK_IDS, TRACKS[:1])
+
+        self.assertIsNone(self.cache.get("playlist1", "snap1", FetchProfile.TRACK_IDS))
+        self.assertEqual(TRACKS[:1], self.cache.get("playlist1", "snap2", FetchProfile.TRACK_IDS))
+        self.assertEqual(1, len(os.listdir(self.temp_dir.name)))
+
+    def test_lru_eviction(self):
+        self.cache.put("playlist1", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+        entry_size = os.path.getsize(os.path.join(self.temp_dir.name, os.listdir(self.temp_dir.name)[0]))
+        cache = PlaylistCache(self.temp_dir.name, max_bytes=entry_size * 2)
+
+        # Make playlist1 the oldest entry, then use it so that playlist2 becomes the eviction candidate
+        cache.put("playlist2", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+        past = time.time() - 100
+        for entry_name in os.listdir(self.temp_dir.name):
+            os.utime(os.path.join(self.temp_dir.name, entry_name), (past, past))
+        self.assertIsNotNone(cache.get("playlist1", "snap1", FetchProfile.TRACK_IDS))
+
+        cache.put("playlist3", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+
+        self.assertIsNotNone(cache.get("playlist1", "snap1", FetchProfile.TRACK_IDS))
+        self.assertIsNone(cache.get("playlist2", "snap1", FetchProfile.TRACK_IDS))
+        self.assertIsNotNone(cache.get("playlist3", "snap1", FetchProfile.TRACK_IDS))
+
+    def test_directory_scanned_once(self):
+        self.cache.put("playlist1", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+        entry_size = os.path.getsize(os.path.join(self.temp_dir.name, os.listdir(self.temp_dir.name)[0]))
+        cache = PlaylistCache(self.temp_dir.name, max_bytes=entry_size * 2)
+
+        with patch.object(Path, "glob", wraps=Path(self.temp_dir.name).glob) as glob:
+            for playlist_number in range(2, 6):
+                cache.put(f"playlist{playlist_number}", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+                cache.put(f"playlist{playlist_number}", "snap2", FetchProfile.TRACK_IDS, TRACKS)
+
+        self.assertEqual(1, glob.call_count)
+        self.assertEqual(2, len(os.listdir(self.temp_dir.name)))
+        self.assertEqual(entry_size * 2, cache._total_bytes)
+        self.assertIsNotNone(cache.get("playlist5", "snap2", FetchProfile.TRACK_IDS))
+
+    def test_unreadable_entry_is_miss(self):
+        self.cache.put("playlist1", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+        entry_name = os.listdir(self.temp_dir.name)[0]
+        with open(os.path.join(self.temp_dir.name, entry_name), "w") as entry_handle:
+            entry_handle.write('[{"track": {"id": "3DrlHWCoFqHQYGwE8MWsuv"}}]')
+
+        self.assertIsNone(self.cache.get("playlist1", "snap1", FetchProfile.TRACK_IDS))
+
+    def test_clear(self):
+        self.cache.put("playlist1", "snap1", FetchProfile.TRACK_IDS, TRACKS)
+
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get("playlist1", "snap1", FetchProfile.TRACK_IDS))
+
+
+class ExclusionIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_file = os.path.join(self.temp_dir.name, "exclusions.json")
+        self.loads = []
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def load(self, playlist_id, snapshot_id):
+        self.loads.append(playlist_id)
+        return {"playlist1": ["a", "b"], "playlist2": ["b", "c"]}[playlist_id]
+
+    def test_union(self):
+        index = ExclusionIndex(self.index_file)
+
+        track_ids = index.get_ids([("playlist1", "snap1"), ("playlist2", "snap1")], self.load)
+
+        self.assertEqual({"a", "b", "c"}, track_ids)
+
+    def test_unchanged_not_reloaded(self):
+        ExclusionIndex(self.index_file).get_ids([("playlist1", "snap1"), ("playlist2", "snap1")], self.load)
+        self.loads.clear()
+
+        track_ids = ExclusionIndex(self.index_file).get_ids([("playlist1", "snap1"), ("playlist2", "snap2")],
+                                                            self.load)
+
+        self.assertEqual({"a", "b", "c"}, track_ids)
+        self.assertEqual(["playlist2"], self.loads)
+
+    def test_no_snapshot_always_loaded(self):
+        index = ExclusionIndex(self.index_file)
+        index.get_ids([("playlist1", None)], self.load)
+        index.get_ids([("playlist1", None)], self.load)
+
+        self.assertEqual(["playlist1", "playlist1"], self.loads)
+
+    def test_add_ids(self):
+        index = ExclusionIndex(self.index_file)
+        index.get_ids([("playlist1", "snap1")], self.load)
+
+        index.add_ids("playlist1", "snap1", "snap2", ["d"])
+        self.loads.clear()
+
+        self.assertEqual({"a", "b", "d"}, ExclusionIndex(self.index_file).get_ids([("playlist1", "snap2")], self.load))
+        self.assertEqual([], self.loads)
+
+    def test_add_ids_stale_snapshot(self):
+        index = ExclusionIndex(self.index_file)
+        index.get_ids([("playlist1", "snap1")], self.load)
+
+        index.add_ids("playlist1", "snap0", "snap2", ["d"])
+
+        index.get_ids([("playlist1", "snap2")], self.load)
+        self.assertEqual(["playlist1", "playlist1"], self.loads)
+
+
+class SubscriptionStateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.temp_dir.name, "subscriptions.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_saved(self):
+        mark = HighWaterMark("snap1", 120, parse_added_at("2022-12-14T15:56:13Z"),
+                             parse_added_at("2022-12-11T15:56:13Z"))
+        state = SubscriptionState(self.state_file)
+        state.set("target1", "playlist1", mark)
+        state.save()
+
+        self.assertEqual(mark, SubscriptionState(self.state_file).get("target1", "playlist1"))
+        self.assertIsNone(SubscriptionState(self.state_file).get("target2", "playlist1"))
+
+    def test_unsaved(self):
+        state = SubscriptionState(self.state_file)
+        state.set("target1", "playlist1", HighWaterMark("snap1"))
+
+        self.assertEqual(HighWaterMark("snap1"), state.get("target1", "playlist1"))
+        self.assertIsNone(SubscriptionState(self.state_file).get("target1", "playlist1"))
+
+    def test_covers(self):
+        mark = HighWaterMark("snap1", oldest_added_at=1000)
+
+        self.assertTrue(mark.covers(1000))
+        self.assertTrue(mark.covers(2000))
+        self.assertFalse(mark.covers(999))
+        self.assertFalse(HighWaterMark("snap1").covers(1000))
+
+
+class AtomicFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name, "nested", "data.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        size = _write_json_atomic(self.path, {"ids": ["a", "b"]})
+
+        self.assertEqual(size, self.path.stat().st_size)
+        self.assertEqual(["data.json"], os.listdir(self.path.parent))
+        self.assertEqual(["a", "b"], _load_json(self.path, lambda data: data["ids"], "test data"))
+
+    def test_missing(self):
+        self.assertIsNone(_load_json(self.path, dict, "test data"))
+
+    def test_unparseable(self):
+        _write_json_atomic(self.path, ["a"])
+
+        with self.assertLogs("spotcrates.cache", "WARNING"):
+            self.assertIsNone(_load_json(self.path, lambda data: data["ids"], "test data"))
+
+
+class ListingIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_file = os.path.join(self.temp_dir.name, "listing_index.bin")
+        self.rows = [{FieldName.SPOTIFY_ID: "id1", FieldName.PLAYLIST_NAME: "Jazz Funk", FieldName.SIZE: 6,
+                      FieldName.OWNER: "testuser", FieldName.PLAYLIST_DESCRIPTION: ""}]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_saved(self):
+        ListingIndex(self.index_file).get_index(self.rows)
+
+        index = ListingIndex(self.index_file)._get_index()
+
+        self.assertEqual(1, len(index))
+        self.assertEqual({0}, index.search(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "funk"))
+
+    def test_loaded_lazily(self):
+        ListingIndex(self.index_file).get_index(self.rows)
+
+        index = ListingIndex(self.index_file).get_index(self.rows)
+
+        self.assertEqual([], index.ids)
+        self.assertEqual(self.rows, filter_list(self.rows, "n:funk", index))
+
+    def test_unchanged_not_saved(self):
+        ListingIndex(self.index_file).get_index(self.rows)
+        modified = os.stat(self.index_file).st_mtime_ns
+        time.sleep(0.01)
+
+        ListingIndex(self.index_file).get_index(self.rows)
+
+        self.assertEqual(modified, os.stat(self.index_file).st_mtime_ns)
+
+    def test_new_snapshot_saved(self):
+        ListingIndex(self.index_file).get_index(self.rows, ["snap1"])
+        self.rows[0][FieldName.PLAYLIST_NAME] = "Acid Blues"
+
+        ListingIndex(self.index_file).get_index(self.rows, ["snap2"])
+
+        index = ListingIndex(self.index_file).get_index(self.rows, ["snap2"])
+        self.assertEqual([], filter_list(self.rows, "n:funk", index))
+        self.assertEqual(self.rows, filter_list(self.rows, "n:blues", index))
+
+    def test_unreadable(self):
+        with open(self.index_file, "w") as index_handle:
+            index_handle.write("{")
+
+        self.assertEqual(1, len(ListingIndex(self.index_file).get_index(self.rows)))
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_listing_index({}))
+        self.assertIsNotNone(get_listing_index({"cache": {"use_listing_index": True}}))
@@ -1,6 +1,6 @@
 import unittest
 
-from spotcrates.cli import parse_cmdline
+from spotcrates.cli import parse_cmdline, get_cache_store
 
 
 class ArgparseTestCase(unittest.TestCase):
@@ -48,3 +48,42 @@ class ArgparseTestCase(unittest.TestCase):
         self.assertEqual('test-command', args.command)
         self.assertTrue(args.randomize)
         self.assertSequenceEqual(['arg1', 'arg2', 'arg3'], args.arguments)
+
+    def test_no_cache(self):
+        args, result_code = parse_cmdline(['test-command', '--no-cache'])
+        self.assertEqual(0, result_code)
+        self.assertTrue(args.no_cache)
+
+    def test_cache_default(self):
+        args, result_code = parse_cmdline(['test-command'])
+        self.assertEqual(0, result_code)
+        self.assertFalse(args.no_cache)
+
+    def test_cache_store(self):
+        args, _ = parse_cmdline(['test-command'])
+        self.assertEqual({"cache": {}}, get_cache_store(dict, {"cache": {}}, args))
+
+        args, _ = parse_cmdline(['test-command', '--no-cache'])
+        self.assertIsNone(get_cache_store(dict, {"cache": {}}, args))
+
+    def test_multiple(self):
+        args, result_code = parse_cmdline(['copy', 'arg1', 'arg2', '--multiple'])
+        self.assertEqual(0, result_code)
+        self.assertTrue(args.multiple)
+        self.assertSequenceEqual(['arg1', 'arg2'], args.arguments)
+
+    def test_limit(self):
+        args, result_code = parse_cmdline(['list-playlists', '--limit', '20'])
+        self.assertEqual(0, result_code)
+        self.assertEqual(20, args.limit)
+
+    def test_limit_default(self):
+        args, result_code = parse_cmdline(['list-playlists'])
+        self.assertEqual(0, result_code)
+        self.assertIsNone(args.limit)
+
+    def test_limit_invalid(self):
+        for limit in ('0', '-1', 'many'):
+            with self.assertRaises(SystemExit) as cm:
+                parse_cmdline(['list-playlists', '--limit', limit])
+            self.assertEqual(cm.exception.code, 2)
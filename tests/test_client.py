@@ -0,0 +1,240 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+import spotipy
+import urllib3
+from spotipy import SpotifyException
+
+from spotcrates.client import TokenBucket, RateLimitedSpotify, get_retry_after, is_retryable_status, SessionPool, \
+    get_client_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=2.0, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst(self):
+        self.bucket.acquire()
+        self.bucket.acquire()
+
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_waits_for_refill(self):
+        for _ in range(3):
+            self.bucket.acquire()
+
+        self.assertAlmostEqual(0.5, sum(self.clock.sleeps))
+
+    def test_try_acquire(self):
+        self.assertEqual(0, self.bucket.try_acquire())
+        self.assertEqual(0, self.bucket.try_acquire())
+
+        self.assertAlmostEqual(0.5, self.bucket.try_acquire())
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_block_for(self):
+        self.bucket.block_for(3)
+
+        self.bucket.acquire()
+
+        self.assertGreaterEqual(sum(self.clock.sleeps), 3)
+
+
+def rate_limited(retry_after="2"):
+    return SpotifyException(429, -1, "Too many requests", headers={"Retry-After": retry_after})
+
+
+class RateLimitedSpotifyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=100.0, capacity=10, clock=self.clock, sleep=self.clock.sleep)
+        self.spotify = RateLimitedSpotify(auth="token", rate_limiter=self.bucket, max_retries=2)
+
+    @patch("spotcrates.client.time.sleep")
+    def test_retry_after(self, mock_sleep):
+        with patch.object(spotipy.Spotify, "_internal_call", side_effect=[rate_limited(), {"id": "me"}]) as call:
+            self.assertEqual({"id": "me"}, self.spotify.me())
+
+        self.assertEqual(2, call.call_count)
+        self.assertGreaterEqual(sum(self.clock.sleeps), 2)
+
+    @patch("spotcrates.client.time.sleep")
+    def test_server_error_backoff(self, mock_sleep):
+        server_error = SpotifyException(502, -1, "Bad gateway")
+        with patch.object(spotipy.Spotify, "_internal_call", side_effect=[server_error, {"id": "me"}]):
+            self.assertEqual({"id": "me"}, self.spotify.me())
+
+        mock_sleep.assert_called_once()
+
+    @patch("spotcrates.client.time.sleep")
+    def test_connection_error(self, mock_sleep):
+        with patch.object(spotipy.Spotify, "_internal_call",
+                          side_effect=[requests.exceptions.ConnectionError(), {"id": "me"}]):
+            self.assertEqual({"id": "me"}, self.spotify.me())
+
+    @patch("spotcrates.client.time.sleep")
+    def test_read_timeout_retried_for_reads(self, mock_sleep):
+        with patch.object(spotipy.Spotify, "_internal_call",
+                          side_effect=[requests.exceptions.ReadTimeout(), {"id": "me"}]):
+            self.assertEqual({"id": "me"}, self.spotify.me())
+
+    @patch("spotcrates.client.time.sleep")
+    def test_read_timeout_not_retried_for_writes(self, mock_sleep):
+        with patch.object(spotipy.Spotify, "_internal_call",
+                          side_effect=[requests.exceptions.ReadTimeout(), {"snapshot_id": "snap1"}]) as call:
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.spotify.playlist_add_items("playlist1", ["track1"])
+
+        self.assertEqual(1, call.call_count)
+
+    @patch("spotcrates.client.time.sleep")
+    def test_dropped_connection_not_retried_for_writes(self, mock_sleep):
+        dropped = requests.exceptions.ConnectionError(urllib3.exceptions.ProtocolError("Connection aborted."))
+        with patch.object(spotipy.Spotify, "_internal_call", side_effect=[dropped, {"snapshot_id": "snap1"}]) as call:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.spotify.playlist_add_items("playlist1", ["track1"])
+
+        self.assertEqual(1, call.call_count)
+
+    @patch("spotcrates.client.time.sleep")
+    def test_connect_errors_retried_for_writes(self, mock_sleep):
+        refused = requests.exceptions.ConnectionError(urllib3.exceptions.MaxRetryError(
+            None, "/v1/playlists", urllib3.exceptions.NewConnectionError(None, "Connection refused")))
+        with patch.object(spotipy.Spotify, "_internal_call",
+                          side_effect=[refused, requests.exceptions.ConnectTimeout(), {"snapshot_id": "snap1"}]):
+            self.assertEqual({"snapshot_id": "snap1"}, self.spotify.playlist_add_items("playlist1", ["track1"]))
+
+    @patch("spotcrates.client.time.sleep")
+    def test_retries_exhausted(self, mock_sleep):
+        with patch.object(spotipy.Spotify, "_internal_call", side_effect=rate_limited("0")) as call:
+            with self.assertRaises(SpotifyException):
+                self.spotify.me()
+
+        self.assertEqual(3, call.call_count)
+
+    def test_client_error_not_retried(self):
+        with patch.object(spotipy.Spotify, "_internal_call",
+                          side_effect=SpotifyException(404, -1, "Not found")) as call:
+            with self.assertRaises(SpotifyException):
+                self.spotify.me()
+
+        self.assertEqual(1, call.call_count)
+
+
+class SessionPoolTestCase(unittest.TestCase):
+    def test_session_shared_across_threads(self):
+        pool = SessionPool()
+        thread_sessions = []
+        threads = [threading.Thread(target=lambda: thread_sessions.append(pool.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(8, len(thread_sessions))
+        for session in thread_sessions:
+            self.assertIs(pool.get(), session)
+
+    def test_pool_size(self):
+        adapter = SessionPool(pool_size=12).get().get_adapter("https://api.spotify.com/v1/me")
+
+        self.assertEqual(12, adapter._pool_maxsize)
+
+    def test_no_keep_alive(self):
+        self.assertEqual("close", SessionPool(keep_alive=False).get().headers["Connection"])
+
+    def test_close(self):
+        pool = SessionPool()
+        session = pool.get()
+
+        with patch.object(session, "close") as close:
+            pool.close()
+
+        close.assert_called_once_with()
+        self.assertIsNone(pool.session)
+        self.assertIsNot(session, pool.get())
+
+    def test_client_closes_pool(self):
+        pool = SessionPool()
+        pool.get()
+
+        with RateLimitedSpotify(auth="token", session_pool=pool):
+            pass
+
+        self.assertIsNone(pool.session)
+
+    def test_client_uses_pool(self):
+        pool = SessionPool()
+
+        spotify = RateLimitedSpotify(auth="token", session_pool=pool)
+
+        self.assertIs(pool, spotify._session)
+
+    def test_client_settings(self):
+        settings = get_client_settings({"pool_size": 12, "connect_timeout": 2, "read_timeout": 9})
+
+        self.assertEqual(12, settings["session_pool"].pool_size)
+        self.assertEqual((2.0, 9.0), settings["requests_timeout"])
+
+    def test_client_settings_pool_covers_concurrency(self):
+        settings = get_client_settings({"pool_size": 2, "max_concurrency": 16})
+
+        self.assertEqual(16, settings["session_pool"].pool_size)
+        self.assertEqual(16, get_client_settings({"max_concurrency": 16})["session_pool"].pool_size)
+
+
+class AuthHeadersTestCase(unittest.TestCase):
+    def test_token_held_until_expiry(self):
+        auth_manager = MagicMock()
+        auth_manager.get_access_token.return_value = "token1"
+        auth_manager.cache_handler.get_cached_token.return_value = {"expires_at": time.time() + 3600}
+        spotify = RateLimitedSpotify(auth_manager=auth_manager)
+
+        self.assertEqual({"Authorization": "Bearer token1"}, spotify._auth_headers())
+        self.assertEqual({"Authorization": "Bearer token1"}, spotify._auth_headers())
+
+        auth_manager.get_access_token.assert_called_once()
+
+    def test_expired_token_refreshed(self):
+        auth_manager = MagicMock()
+        auth_manager.get_access_token.side_effect = ["token1", "token2"]
+        auth_manager.cache_handler.get_cached_token.return_value = {"expires_at": time.time() + 10}
+        spotify = RateLimitedSpotify(auth_manager=auth_manager)
+
+        spotify._auth_headers()
+
+        self.assertEqual({"Authorization": "Bearer token2"}, spotify._auth_headers())
+
+
+class RetryHelpersTestCase(unittest.TestCase):
+    def test_retry_after(self):
+        self.assertEqual(3.0, get_retry_after({"Retry-After": "3"}))
+
+    def test_retry_after_missing(self):
+        self.assertIsNone(get_retry_after({}))
+
+    def test_retry_after_invalid(self):
+        self.assertIsNone(get_retry_after({"Retry-After": "soon"}))
+
+    def test_retryable(self):
+        self.assertTrue(is_retryable_status(429))
+        self.assertTrue(is_retryable_status(503))
+        self.assertFalse(is_retryable_status(404))
+        self.assertFalse(is_retryable_status(None))
@@ -1,6 +1,11 @@
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
 
-from spotcrates.common import truncate_long_value
+from spotcrates.common import truncate_long_value, get_all_items, get_page_offsets, PagingException, iter_all_items, \
+    SingleFlight
 
 
 # truncate_long_value
@@ -20,3 +25,178 @@ class TruncateLongValueTestCase(unittest.TestCase):
 
     def test_null(self):
         self.assertEqual(None, truncate_long_value(None, 5, trim_tail=False))
+
+
+# get_all_items
+
+def make_page(offset, limit, total):
+    return {
+        "items": [{"index": index} for index in range(offset, min(offset + limit, total))],
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+    }
+
+
+class GetAllItemsTestCase(unittest.TestCase):
+    def test_next_links(self):
+        spotify = MagicMock()
+        spotify.next.side_effect = [{"items": [{"index": 1}, None]}, None]
+
+        items = get_all_items(spotify, {"items": [{"index": 0}]})
+
+        self.assertEqual([{"index": 0}, {"index": 1}], items)
+
+    def test_next_link_failure(self):
+        spotify = MagicMock()
+        spotify.next.side_effect = [{"items": [{"index": 1}], "offset": 1}, IOError("Problems paging")]
+
+        with self.assertRaises(PagingException):
+            get_all_items(spotify, {"items": [{"index": 0}], "offset": 0})
+
+    def test_offset_pages_in_order(self):
+        spotify = MagicMock()
+        fetched_offsets = []
+
+        def fetch_page(offset):
+            fetched_offsets.append(offset)
+            return make_page(offset, 10, 95)
+
+        items = get_all_items(spotify, make_page(0, 10, 95), fetch_page, max_workers=4)
+
+        self.assertEqual(list(range(95)), [item["index"] for item in items])
+        self.assertEqual(list(range(10, 95, 10)), sorted(fetched_offsets))
+        spotify.next.assert_not_called()
+
+    def test_offset_pages_single_page(self):
+        fetch_page = MagicMock()
+
+        items = get_all_items(MagicMock(), make_page(0, 10, 5), fetch_page)
+
+        self.assertEqual(5, len(items))
+        fetch_page.assert_not_called()
+
+    def test_offset_page_retried(self):
+        failures = {30: 2}
+
+        def fetch_page(offset):
+            if failures.get(offset):
+                failures[offset] -= 1
+                raise IOError("Problems paging")
+            return make_page(offset, 10, 50)
+
+        items = get_all_items(MagicMock(), make_page(0, 10, 50), fetch_page, page_retries=2)
+
+        self.assertEqual(list(range(50)), [item["index"] for item in items])
+
+    def test_offset_page_failure(self):
+        def fetch_page(offset):
+            if offset == 30:
+                raise IOError("Problems paging")
+            return make_page(offset, 10, 50)
+
+        with self.assertRaises(PagingException):
+            get_all_items(MagicMock(), make_page(0, 10, 50), fetch_page, page_retries=1)
+
+
+class IterAllItemsTestCase(unittest.TestCase):
+    def test_lazy_next_links(self):
+        spotify = MagicMock()
+        spotify.next.return_value = None
+
+        items = iter_all_items(spotify, {"items": [{"index": 0}, None, {"index": 1}]})
+
+        self.assertEqual({"index": 0}, next(items))
+        spotify.next.assert_not_called()
+        self.assertEqual([{"index": 1}], list(items))
+        spotify.next.assert_called_once()
+
+    def test_next_link_failure_after_items(self):
+        spotify = MagicMock()
+        spotify.next.side_effect = IOError("Problems paging")
+
+        items = iter_all_items(spotify, {"items": [{"index": 0}]})
+
+        self.assertEqual({"index": 0}, next(items))
+        with self.assertRaises(PagingException):
+            next(items)
+
+    def test_offset_pages_windowed(self):
+        fetched_offsets = []
+
+        def fetch_page(offset):
+            fetched_offsets.append(offset)
+            return make_page(offset, 10, 1000)
+
+        items = iter_all_items(MagicMock(), make_page(0, 10, 1000), fetch_page, max_workers=2)
+
+        self.assertEqual(list(range(15)), [next(items)["index"] for _ in range(15)])
+        items.close()
+        self.assertLess(len(fetched_offsets), 10)
+
+
+class GetPageOffsetsTestCase(unittest.TestCase):
+    def test_offsets(self):
+        self.assertEqual([100, 200, 300], get_page_offsets({"offset": 0, "limit": 100, "total": 301}))
+
+    def test_no_total(self):
+        self.assertEqual([], get_page_offsets({"items": []}))
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_finished_calls_not_remembered(self):
+        flight = SingleFlight()
+        func = MagicMock(return_value=[1, 2])
+
+        self.assertEqual([1, 2], flight.do("key", func))
+        self.assertEqual([1, 2], flight.do("key", func))
+        self.assertEqual(2, func.call_count)
+        self.assertEqual({}, flight.calls)
+
+    def test_concurrent_calls_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flight.do, "key", fetch) for _ in range(4)]
+            time.sleep(0.05)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(["result"] * 4, results)
+        self.assertEqual(1, len(calls))
+
+    def test_failure_not_remembered(self):
+        flight = SingleFlight()
+        func = MagicMock(side_effect=[Exception("Test exception"), "result"])
+
+        with self.assertRaises(Exception):
+            flight.do("key", func)
+        self.assertEqual("result", flight.do("key", func))
+
+    def test_forget(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fetch():
+            started.set()
+            release.wait(5)
+            return "stale"
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            in_flight = executor.submit(flight.do, ("playlist1", "snap1"), fetch)
+            started.wait(5)
+            flight.forget(lambda key: key[0] == "playlist1")
+            fresh = flight.do(("playlist1", "snap1"), lambda: "fresh")
+            release.set()
+
+        self.assertEqual("fresh", fresh)
+        self.assertEqual("stale", in_flight.result())
+        self.assertEqual({}, flight.calls)
@@ -1,7 +1,7 @@
 import os
 import unittest
 
-from spotcrates.filters import filter_list, FieldName, sort_list
+from spotcrates.filters import filter_list, FieldName, sort_list, parse_filters, parse_sorts, get_sort_key
 from tests.utils import load_playlist_listing_file, get_all_field_val_str
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
@@ -118,6 +118,26 @@ class FilterListTestCase(unittest.TestCase):
         for playlist in filtered_list:
             self.assertTrue(int(playlist[FieldName.SIZE]) <= 100)
 
+    def test_parsed_filters(self):
+        self.assertEqual(filter_list(PLAYLISTS, "size:geq:101,all:Spotify"),
+                         filter_list(PLAYLISTS, parse_filters("size:geq:101,all:Spotify")))
+
+    def test_preserves_order(self):
+        filtered_list = filter_list(PLAYLISTS, "all:e")
+
+        self.assertEqual([playlist for playlist in PLAYLISTS if playlist in filtered_list], filtered_list)
+
+    def test_repeated_playlist_once(self):
+        self.assertEqual(filter_list(PLAYLISTS, "na:Songs"), filter_list(PLAYLISTS + PLAYLISTS, "na:Songs"))
+
+    def test_or_not_groups(self):
+        expected = [playlist for playlist in PLAYLISTS
+                    if ("songs" in playlist[FieldName.PLAYLIST_NAME].lower() or int(playlist[FieldName.SIZE]) > 100)
+                    and "spotify" not in playlist[FieldName.OWNER].lower()]
+
+        self.assertTrue(expected)
+        self.assertEqual(expected, filter_list(PLAYLISTS, "(n:songs | s:gt:100), !o:spotify"))
+
 
 class SortListTestCase(unittest.TestCase):
     playlists = PLAYLISTS
@@ -150,3 +170,42 @@ class SortListTestCase(unittest.TestCase):
             PLAYLISTS, key=lambda d: d[FieldName.SIZE], reverse=True
         )
         self.assertEqual(desc_count_sorted, sort_list(PLAYLISTS, "count:desc,name"))
+
+    def test_multi_mixed_directions(self):
+        rows = [{FieldName.PLAYLIST_NAME: name, FieldName.SIZE: size, FieldName.OWNER: owner}
+                for name, size, owner in (("b", 2, "x"), ("a", 2, "y"), ("c", 5, "x"), ("ab", 2, "x"),
+                                          ("a", 5, "x"), ("", 2, "x"), ("a", 2, "x"))]
+
+        self.assertEqual([("c", 5), ("a", 5), ("b", 2), ("ab", 2), ("a", 2), ("a", 2), ("", 2)],
+                         [(row[FieldName.PLAYLIST_NAME], row[FieldName.SIZE])
+                          for row in sort_list(rows, "size:desc,name:desc")])
+        self.assertEqual([("a", "x"), ("c", "x"), ("", "x"), ("a", "x"), ("ab", "x"), ("b", "x"), ("a", "y")],
+                         [(row[FieldName.PLAYLIST_NAME], row[FieldName.OWNER])
+                          for row in sort_list(rows, "size:desc,owner,name")])
+        self.assertEqual([("", 2), ("a", 2), ("a", 2), ("a", 5), ("ab", 2), ("b", 2), ("c", 5)],
+                         [(row[FieldName.PLAYLIST_NAME], row[FieldName.SIZE])
+                          for row in sort_list(rows, "name,size")])
+
+    def test_multi_matches_stable_sorts(self):
+        # Sorting by each field in turn, least significant first, gives the same order
+        expected = sorted(PLAYLISTS, key=lambda d: d[FieldName.PLAYLIST_NAME])
+        expected = sorted(expected, key=lambda d: d[FieldName.OWNER], reverse=True)
+
+        self.assertEqual(expected, sort_list(PLAYLISTS, "owner:desc,name"))
+
+    def test_sort_key(self):
+        key, reverse = get_sort_key(parse_sorts("size:desc,name:desc"))
+        self.assertTrue(reverse)
+        self.assertEqual((10, "b"), key({FieldName.SIZE: 10, FieldName.PLAYLIST_NAME: "b"}))
+
+        key, reverse = get_sort_key(parse_sorts("size:desc,name"))
+        self.assertFalse(reverse)
+        self.assertEqual((-10, "b"), key({FieldName.SIZE: 10, FieldName.PLAYLIST_NAME: "b"}))
+
+    def test_limit(self):
+        for sorts in ("count:desc,name", "name", "name:desc", "owner,size:desc"):
+            self.assertEqual(sort_list(PLAYLISTS, sorts)[:3], sort_list(PLAYLISTS, sorts, 3), sorts)
+            self.assertEqual(sort_list(PLAYLISTS, sorts), sort_list(PLAYLISTS, sorts, 100), sorts)
+
+    def test_limit_unsorted(self):
+        self.assertEqual(PLAYLISTS[:2], sort_list(PLAYLISTS, None, 2))
@@ -8,9 +8,31 @@ from spotcrates.filters import (
     FieldName,
     parse_filters,
     FieldFilter,
+    InvalidFilterException,
+    FILTER_LOOKUP,
+    FIELD_LOOKUP,
+    iter_filtered,
+    parse_query,
+    FilterTerm,
+    FilterAnd,
+    FilterOr,
+    FilterNot,
+    FilterNode,
 )
 
 
+class RecordingItem(dict):
+    """A playlist row that records which fields were read from it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+    def get(self, key, default=None):
+        self.reads.append(key)
+        return super().get(key, default)
+
+
 class FilterLookupTestCase(unittest.TestCase):
     def setUp(self):
         self.lookup = FilterLookup()
@@ -196,3 +218,200 @@ class ParseFiltersTestCase(unittest.TestCase):
 
     def test_null_filter(self):
         self.assertEqual({}, parse_filters(None))
+
+
+class FieldFilterTestCase(unittest.TestCase):
+    def test_shared_lookups(self):
+        first = FieldFilter("n", "c", "one")
+        second = FieldFilter("s", "gt", "2")
+
+        self.assertIs(FILTER_LOOKUP, first.filter_lookup)
+        self.assertIs(first.filter_lookup, second.filter_lookup)
+        self.assertIs(FIELD_LOOKUP, first.field_lookup)
+        self.assertIs(first.field_lookup, second.field_lookup)
+
+    def test_passes_caseless(self):
+        self.assertTrue(FieldFilter("n", "c", "PoP").passes("Happy Pop Songs"))
+        self.assertTrue(FieldFilter("n", "eq", "happy").passes("HAPPY"))
+        self.assertTrue(FieldFilter("n", "s", "HAP").passes("happy"))
+        self.assertTrue(FieldFilter("n", "en", "PY").passes("happy"))
+        self.assertFalse(FieldFilter("n", "en", "hap").passes("happy"))
+
+    def test_passes_numeric(self):
+        self.assertTrue(FieldFilter("s", "gt", "10").passes(11))
+        self.assertFalse(FieldFilter("s", "gt", "10").passes(10))
+        self.assertTrue(FieldFilter("s", "ge", "10").passes("10"))
+        self.assertTrue(FieldFilter("s", "l", 10).passes(9))
+        self.assertFalse(FieldFilter("s", "leq", "10").passes(11))
+
+    def test_non_numeric_target(self):
+        self.assertFalse(FieldFilter("s", "gt", "10").passes("Happy"))
+
+    def test_invalid_numeric_value(self):
+        with self.assertRaises(InvalidFilterException):
+            FieldFilter("s", "gt", "many")
+
+    def test_type_test_matches_compiled(self):
+        for filter_type, filter_val, target in ((FilterType.CONTAINS, "Op", "pop"), (FilterType.EQUALS, "a", "b"),
+                                                (FilterType.GREATER, "3", 4), (FilterType.LESS_EQUAL, 3, "4")):
+            self.assertEqual(filter_type.test(filter_val, target),
+                             filter_type.compile(filter_val)(filter_type.normalize(target)))
+
+
+class FilterSetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.item = {FieldName.SPOTIFY_ID: "id1", FieldName.PLAYLIST_NAME: "Happy Pop Songs", FieldName.SIZE: 42,
+                     FieldName.OWNER: "Spotify", FieldName.PLAYLIST_DESCRIPTION: "Upbeat tunes"}
+
+    def test_all_filters_must_pass(self):
+        self.assertTrue(parse_filters("n:pop,s:gt:40,o:eq:spotify")(self.item))
+        self.assertFalse(parse_filters("n:pop,s:gt:42")(self.item))
+
+    def test_all_field(self):
+        self.assertTrue(parse_filters("upbeat")(self.item))
+        self.assertTrue(parse_filters("all:s:happy")(self.item))
+        self.assertFalse(parse_filters("all:eq:pop")(self.item))
+
+    def test_empty_passes(self):
+        self.assertTrue(parse_filters("")(self.item))
+
+    def test_reusable(self):
+        filter_set = parse_filters("n:songs")
+
+        self.assertTrue(filter_set(self.item))
+        self.assertFalse(filter_set({**self.item, FieldName.PLAYLIST_NAME: "Jazz"}))
+        self.assertTrue(filter_set(self.item))
+
+    def test_cheapest_first(self):
+        item = RecordingItem(self.item)
+
+        self.assertFalse(parse_filters("d:tunes,n:pop,s:gt:50")(item))
+        self.assertEqual([FieldName.SIZE], item.reads)
+
+    def test_fields_read_once(self):
+        item = RecordingItem(self.item)
+
+        self.assertTrue(parse_filters("n:happy,n:en:songs,all:songs,s:gt:1,s:lt:50")(item))
+        self.assertEqual(sorted(set(item.reads), key=item.reads.index), item.reads)
+
+    def test_numeric_all(self):
+        self.assertTrue(parse_filters("all:eq:42")(self.item))
+        self.assertTrue(parse_filters("all:gt:41")(self.item))
+        self.assertFalse(parse_filters("all:gt:42")(self.item))
+
+    def test_cost(self):
+        self.assertLess(FieldFilter("s", "gt", "10").cost, FieldFilter("n", "c", "pop").cost)
+        self.assertLess(FieldFilter("n", "eq", "pop").cost, FieldFilter("n", "c", "pop").cost)
+        self.assertLess(FieldFilter("n", "c", "pop").cost, FieldFilter("d", "c", "pop").cost)
+        self.assertLess(FieldFilter("d", "c", "pop").cost, FieldFilter("a", "c", "pop").cost)
+
+
+class IterFilteredTestCase(unittest.TestCase):
+    def test_streams(self):
+        items = ({FieldName.SPOTIFY_ID: f"id{i}", FieldName.SIZE: i} for i in range(1000000))
+
+        filtered = iter_filtered(items, parse_filters("s:gt:10"))
+
+        self.assertEqual({FieldName.SPOTIFY_ID: "id11", FieldName.SIZE: 11}, next(filtered))
+        self.assertEqual("id12", next(filtered)[FieldName.SPOTIFY_ID])
+
+    def test_repeated_ids_once(self):
+        items = [{FieldName.SPOTIFY_ID: playlist_id, FieldName.SIZE: 1} for playlist_id in ("a", "b", "a", "c", "b")]
+
+        self.assertEqual(["a", "b", "c"], [item[FieldName.SPOTIFY_ID]
+                                           for item in iter_filtered(items, parse_filters("s:eq:1"))])
+
+
+def term(field, filter_type, value):
+    return FilterTerm(FieldFilter(field, filter_type, value))
+
+
+class ParseQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.item = {FieldName.SPOTIFY_ID: "id1", FieldName.PLAYLIST_NAME: "Songs (Live)", FieldName.SIZE: 42,
+                     FieldName.OWNER: "Spotify", FieldName.PLAYLIST_DESCRIPTION: "Recorded live, on tour"}
+
+    def test_empty(self):
+        for filters in ("", None, "  "):
+            query = parse_query(filters)
+            self.assertIsNone(query.root)
+            self.assertFalse(query)
+            self.assertTrue(query(self.item))
+
+    def test_or(self):
+        self.assertEqual(FilterOr([term("o", "c", "spotify"), term("n", "c", "jazz")]),
+                         parse_query("n:jazz|o:spotify").root)
+        self.assertTrue(parse_query("n:jazz|o:spotify")(self.item))
+        self.assertFalse(parse_query("n:jazz|o:me")(self.item))
+
+    def test_not(self):
+        self.assertEqual(FilterNot(term("o", "c", "spotify")), parse_query("!o:spotify").root)
+        self.assertFalse(parse_query("!o:spotify")(self.item))
+        self.assertTrue(parse_query("!n:jazz")(self.item))
+        self.assertTrue(parse_query("!!o:spotify")(self.item))
+
+    def test_and_binds_tighter_than_or(self):
+        self.assertTrue(parse_query("n:jazz,o:me|s:eq:42")(self.item))
+        self.assertFalse(parse_query("n:jazz,(o:me|s:eq:42)")(self.item))
+
+    def test_groups(self):
+        self.assertEqual(FilterAnd([term("s", "gt", "10"),
+                                    FilterOr([FilterNot(term("o", "c", "me")), term("n", "eq", "jazz")])]),
+                         parse_query("(n:eq:jazz | !o:me), s:gt:10").root)
+        self.assertTrue(parse_query("((n:jazz|n:songs)),!(o:me|s:lt:10)")(self.item))
+
+    def test_abbreviations(self):
+        self.assertEqual(parse_query("playlist_name:contains:jazz|size:greater:4").root,
+                         parse_query("n:c:jazz|s:g:4").root)
+
+    def test_literal_parenthesis(self):
+        self.assertTrue(parse_query("n:songs (live)")(self.item))
+        self.assertTrue(parse_query("n:en:(live)")(self.item))
+        self.assertFalse(parse_query("n:jazz)|n:eq:(")(self.item))
+
+    def test_quoted(self):
+        self.assertTrue(parse_query('(n:"songs (live)"|n:jazz)')(self.item))
+        self.assertTrue(parse_query('d:"live, on"')(self.item))
+        self.assertTrue(parse_query('"!"|s:eq:42')(self.item))
+        self.assertEqual(FieldFilter("d", "c", "a:b|c"), parse_query('d:c:"a:b|c"').root.field_filter)
+
+    def test_trailing_comma(self):
+        self.assertTrue(parse_query("n:songs,")(self.item))
+
+    def test_invalid(self):
+        for filters in ("(n:jazz", "(n:jazz))", "n:jazz,(", '"n:jazz', "zzz:jazz|n:jazz", "!", "n:jazz|", "()"):
+            with self.assertRaises(Exception, msg=filters):
+                parse_query(filters)
+
+    def test_unclosed_group(self):
+        with self.assertRaises(InvalidFilterException):
+            parse_query("(n:jazz|o:me")
+
+    def test_parse_filters_rejects_or(self):
+        with self.assertRaises(InvalidFilterException):
+            parse_filters("n:jazz|o:me")
+
+
+class PlanTestCase(unittest.TestCase):
+    def test_size_before_description(self):
+        self.assertEqual(FilterAnd([term("s", "gt", "10"), term("n", "eq", "jazz"), term("d", "c", "live")]),
+                         parse_query("d:live,n:eq:jazz,s:gt:10").root)
+
+    def test_or_most_selective_last(self):
+        self.assertEqual(FilterOr([term("n", "c", "jazz"), term("n", "eq", "funk")]),
+                         parse_query("n:eq:funk|n:jazz").root)
+
+    def test_flattens(self):
+        self.assertEqual(FilterAnd([term("s", "gt", "10"), term("o", "c", "me"), term("d", "c", "live")]),
+                         parse_query("(d:live,(o:me)),s:gt:10").root)
+        self.assertEqual(term("o", "c", "me"), parse_query("!!o:me").root)
+
+    def test_node_abstract(self):
+        with self.assertRaises(TypeError):
+            FilterNode()
+
+    def test_short_circuit(self):
+        item = RecordingItem({FieldName.SPOTIFY_ID: "id1", FieldName.SIZE: 5})
+
+        self.assertFalse(parse_query("(d:live|n:jazz),s:gt:10")(item))
+        self.assertEqual([FieldName.SIZE], item.reads)
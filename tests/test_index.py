@@ -0,0 +1,177 @@
+import os
+import unittest
+
+from spotcrates.filters import FieldName, FilterType, filter_list
+from spotcrates.index import PlaylistIndex, TrigramIndex
+from tests.utils import file_json, load_playlist_listing_file
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+PLAYLIST_LIST = file_json(os.path.join(DATA_DIR, "playlists.json"))
+PLAYLIST_ROWS = load_playlist_listing_file(os.path.join(DATA_DIR, "playlists.json"))
+
+
+class PlaylistIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = PlaylistIndex(PLAYLIST_LIST + [{}, {"id": "no_name"}])
+
+    def test_get(self):
+        self.assertEqual("Overplayed", self.index.get("0y8aCYE2OsnLzzxtqcDGf8")["name"])
+        self.assertIsNone(self.index.get("missing"))
+
+    def test_find_name(self):
+        self.assertEqual("1JJB9ICuIoE6aD4jg9vgmV", self.index.find_name("Now")["id"])
+        self.assertIsNone(self.index.find_name("now"))
+
+    def test_find_name_ignore_case(self):
+        self.assertEqual("1JJB9ICuIoE6aD4jg9vgmV", self.index.find_name("nOW", ignore_case=True)["id"])
+
+    def test_find_names_duplicates(self):
+        index = PlaylistIndex([{"id": "a", "name": "Jazz"}, {"id": "b", "name": "jazz"}])
+
+        self.assertEqual(["a", "b"], [playlist["id"] for playlist in index.find_names("JAZZ", ignore_case=True)])
+        self.assertEqual(["a"], [playlist["id"] for playlist in index.find_names("Jazz")])
+
+    def test_contains_name(self):
+        self.assertTrue(self.index.contains_name("exercise", ignore_case=True))
+        self.assertFalse(self.index.contains_name("exercise"))
+
+    def test_with_prefix(self):
+        self.assertEqual(["Your Top Songs 2022", "Your Top Songs 2021"],
+                         [playlist["name"] for playlist in self.index.with_prefix("Your Top")])
+
+    def test_with_prefixes_listing_order(self):
+        self.assertEqual(["Overplayed", "Daily Mix 1", "Your Top Songs 2022"],
+                         [playlist["name"] for playlist in self.index.with_prefix("Your Top Songs 2022", "Daily",
+                                                                                  "Over", "Daily Mix")])
+
+    def test_with_missing_prefix(self):
+        self.assertEqual([], self.index.with_prefix("Nothing"))
+
+    def test_len(self):
+        self.assertEqual(7, len(self.index))
+
+
+def make_row(playlist_id, name, size=10, owner="testuser", description=""):
+    return {FieldName.SPOTIFY_ID: playlist_id, FieldName.PLAYLIST_NAME: name, FieldName.SIZE: size,
+            FieldName.OWNER: owner, FieldName.PLAYLIST_DESCRIPTION: description}
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rows = [make_row("id1", "Jazz Funk", description="Jazz. But funky."),
+                     make_row("id2", "Acid Jazz", owner="spotify"),
+                     make_row("id3", "Classical Piano", size=120)]
+        self.index = TrigramIndex()
+        self.index.update(self.rows)
+
+    def search_ids(self, field, filter_type, value):
+        candidates = self.index.search(field, filter_type, value)
+        # Candidates may include the holes left by changed playlists
+        return None if candidates is None else {self.index.ids[doc] for doc in candidates} - {None}
+
+    def test_contains(self):
+        self.assertEqual({"id1", "id2"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "jazz"))
+        self.assertEqual(set(), self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "blues"))
+
+    def test_anchored(self):
+        self.assertEqual({"id1"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.STARTS, "ja"))
+        self.assertEqual({"id2"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.ENDS, "jazz"))
+        self.assertEqual({"id2"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.EQUALS, "acid jazz"))
+
+    def test_cannot_narrow(self):
+        self.assertIsNone(self.index.search(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "ja"))
+        self.assertIsNone(self.index.search(FieldName.PLAYLIST_NAME, FilterType.STARTS, "j"))
+        self.assertIsNone(self.index.search(FieldName.SIZE, FilterType.GREATER, 5))
+
+    def test_scanned_fields(self):
+        self.assertEqual({"id3"}, self.search_ids(FieldName.SIZE, FilterType.EQUALS, "120"))
+        self.assertEqual({"id2"}, self.search_ids(FieldName.SPOTIFY_ID, FilterType.ENDS, "2"))
+
+    def test_all(self):
+        self.assertEqual({"id1", "id2"}, self.search_ids(FieldName.ALL, FilterType.CONTAINS, "jazz"))
+        self.assertEqual({"id3"}, self.search_ids(FieldName.ALL, FilterType.CONTAINS, "120"))
+
+    def test_changed(self):
+        rows = [make_row("id1", "Jazz Funk", size=11, description="Jazz. But funky."),
+                make_row("id2", "Acid Blues", owner="spotify")]
+
+        self.assertTrue(self.index.update(rows))
+
+        self.assertEqual(2, len(self.index))
+        self.assertNotIn("id3", self.index)
+        self.assertEqual({"id1"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "jazz"))
+        self.assertEqual({"id1"}, self.search_ids(FieldName.SIZE, FilterType.EQUALS, "11"))
+        self.assertFalse(self.index.update(rows))
+
+    def test_compacted(self):
+        for i in range(5):
+            self.index.update([make_row("id1", f"Jazz Funk {i}")])
+
+        self.assertEqual(["id1"], [playlist_id for playlist_id in self.index.ids if playlist_id])
+        self.assertLessEqual(self.index.holes, len(self.index))
+        self.assertEqual({"id1"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "funk 4"))
+        self.assertEqual(set(), self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "funk 3"))
+
+    def test_round_trip(self):
+        index = TrigramIndex.from_bytes(self.index.to_bytes())
+
+        self.assertFalse(index.update(self.rows))
+        self.assertEqual(self.index.search(FieldName.ALL, FilterType.CONTAINS, "jazz"),
+                         index.search(FieldName.ALL, FilterType.CONTAINS, "jazz"))
+        self.assertEqual(3, len(index))
+        self.assertEqual(self.index.ids, index.ids)
+        self.assertEqual(self.index.postings, index.postings)
+
+    def test_loaded_postings_decoded_when_searched(self):
+        index = TrigramIndex.from_bytes(self.index.to_bytes())
+
+        self.assertEqual({0, 1}, index.search(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "jazz"))
+        self.assertEqual({"jaz", "azz"}, set(index.postings[FieldName.PLAYLIST_NAME]))
+        self.assertEqual([], index.ids)
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            TrigramIndex.from_bytes(self.index.to_bytes()[:-1])
+
+    def test_same_versions_not_read(self):
+        rows = [make_row("id1", "Blues"), make_row("id2", "Acid Jazz", owner="spotify")]
+
+        self.assertTrue(self.index.update(rows, ["snap1", "snap2"]))
+        self.assertFalse(self.index.update([make_row("id1", "Soul"), rows[1]], ["snap1", "snap2"]))
+        self.assertEqual({"id1"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "blues"))
+
+    def test_new_version_indexed(self):
+        self.index.update(self.rows, ["snap1", "snap2", "snap3"])
+
+        self.assertTrue(self.index.update([make_row("id1", "Blues")] + self.rows[1:], ["snap4", "snap2", "snap3"]))
+
+        self.assertEqual({"id1"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "blues"))
+        self.assertEqual({"id2"}, self.search_ids(FieldName.PLAYLIST_NAME, FilterType.CONTAINS, "jazz"))
+
+    def test_reordered(self):
+        rows = list(reversed(self.rows))
+
+        self.assertTrue(self.index.update(rows))
+
+        self.assertEqual(filter_list(rows, "n:jazz"), filter_list(rows, "n:jazz", self.index))
+        self.assertEqual({"id3"}, self.search_ids(FieldName.SIZE, FilterType.EQUALS, "120"))
+
+
+class IndexedFilterListTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.update(PLAYLIST_ROWS)
+
+    def test_same_results(self):
+        for filters in ("Spotify", "na:Songs", "n:s:happy", "n:en:songs", "o:eq:spotify", "all:e", "size:gt:100",
+                        "(n:songs|d:mix),!o:spotify", "zzzz", "all:eq:50"):
+            self.assertEqual(filter_list(PLAYLIST_ROWS, filters), filter_list(PLAYLIST_ROWS, filters, self.index),
+                             filters)
+
+    def test_other_rows(self):
+        rows = PLAYLIST_ROWS + [make_row("new1", "New Songs")]
+
+        filtered = filter_list(rows, "na:Songs", self.index)
+
+        self.assertEqual(filter_list(rows, "na:Songs"), filtered)
+        self.assertIn("new1", [row[FieldName.SPOTIFY_ID] for row in filtered])
@@ -1,9 +1,17 @@
+import datetime
 import os
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, ANY, Mock
 
+from spotcrates.cache import PlaylistCache, ExclusionIndex, SubscriptionState, ListingIndex
+from spotcrates.common import FetchProfile, PagingException
 from spotcrates.filters import FieldName
 from spotcrates.playlists import Playlists, PlaylistResult
+from spotcrates.tracks import to_added_at
 from tests.utils import file_json
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
@@ -20,19 +28,36 @@ TRACKS_TARGET = file_json(os.path.join(DATA_DIR, "tracks_target.json"))
 def get_canned_tracks(*args, **kwargs):
     playlist_id = args[0]
     if playlist_id == "37i9dQZF1E37hnawmowyJn":
-        return TRACKS_DAILY1
+        tracks = TRACKS_DAILY1
     elif playlist_id == "0y8aCYE2OsnLzzxtqcDGf8":
-        return TRACKS_OVERPLAYED
+        tracks = TRACKS_OVERPLAYED
     elif playlist_id == "1JJB9ICuIoE6aD4jg9vgmV":
-        return TRACKS_TARGET
+        tracks = TRACKS_TARGET
     elif playlist_id == "some_invalid":
-        return TRACKS_DAILY1_SOME_INVALID
+        tracks = TRACKS_DAILY1_SOME_INVALID
     elif playlist_id == "minus_invalid":
-        return TRACKS_DAILY1_MINUS_INVALID
+        tracks = TRACKS_DAILY1_MINUS_INVALID
     elif playlist_id == "some_epoch":
-        return TRACKS_DAILY1_SOME_EPOCH
+        tracks = TRACKS_DAILY1_SOME_EPOCH
     else:
         raise Exception(f"Unhandled tracks ID {playlist_id}")
+    # The canned pages are cut from a larger playlist; serve each as the whole playlist
+    return dict(tracks, total=len(tracks["items"]), next=None)
+
+
+def make_canned_pages(next_pages):
+    """Returns a playlist_items stand-in that serves each playlist's canned tracks as its first page,
+    followed by the pages given for it."""
+    def get_page(*args, **kwargs):
+        pages = [get_canned_tracks(*args)] + next_pages.get(args[0], [])
+        limit = kwargs.get("limit", 100)
+        offset = kwargs.get("offset", 0)
+        page = pages[offset // limit]
+        if isinstance(page, Exception):
+            raise page
+        return dict(page, offset=offset, limit=limit, total=limit * len(pages))
+
+    return get_page
 
 
 # noinspection DuplicatedCode,PyTypeChecker
@@ -126,16 +151,7 @@ class DailyAppendTestCase(unittest.TestCase):
     def test_append_daily_mix_paged(self):
         self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
 
-        self.spotify.playlist_items.side_effect = get_canned_tracks
-
-        def get_next_page(*args, **kwargs):
-            page = args[0]
-            if page == TRACKS_TARGET:
-                return TRACKS_DAILY1
-            else:
-                return None
-
-        self.spotify.next.side_effect = get_next_page
+        self.spotify.playlist_items.side_effect = make_canned_pages({"1JJB9ICuIoE6aD4jg9vgmV": [TRACKS_DAILY1]})
 
         self.playlists.append_daily_mix(randomize=False, target_name=None)
 
@@ -144,16 +160,7 @@ class DailyAppendTestCase(unittest.TestCase):
     def test_append_daily_mix_paged_tracks(self):
         self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
 
-        self.spotify.playlist_items.side_effect = get_canned_tracks
-
-        def get_next_page(*args, **kwargs):
-            page = args[0]
-            if page == TRACKS_DAILY1:
-                return TRACKS_TARGET
-            else:
-                return None
-
-        self.spotify.next.side_effect = get_next_page
+        self.spotify.playlist_items.side_effect = make_canned_pages({"37i9dQZF1E37hnawmowyJn": [TRACKS_TARGET]})
 
         self.playlists.append_daily_mix(randomize=False, target_name=None)
 
@@ -164,16 +171,8 @@ class DailyAppendTestCase(unittest.TestCase):
     def test_append_daily_mix_paged_tracks_filter_none(self):
         self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
 
-        self.spotify.playlist_items.side_effect = get_canned_tracks
-
-        def get_next_page(*args, **kwargs):
-            page = args[0]
-            if page == TRACKS_DAILY1:
-                return TRACKS_TARGET + [None]
-            else:
-                return None
-
-        self.spotify.next.side_effect = get_next_page
+        self.spotify.playlist_items.side_effect = make_canned_pages(
+            {"37i9dQZF1E37hnawmowyJn": [{"items": TRACKS_TARGET["items"] + [None]}]})
 
         self.playlists.append_daily_mix(randomize=False, target_name=None)
 
@@ -181,18 +180,16 @@ class DailyAppendTestCase(unittest.TestCase):
             "1JJB9ICuIoE6aD4jg9vgmV", ["3DrlHWCoFqHQYGwE8MWsuv"]
         )
 
-    def test_append_daily_mix_paged_tracks_exception_next(self):
+    def test_append_daily_mix_paged_tracks_page_fails(self):
         self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
 
-        self.spotify.playlist_items.side_effect = get_canned_tracks
-
-        self.spotify.next.side_effect = Mock(side_effect=IOError("Problems paging"))
+        self.spotify.playlist_items.side_effect = make_canned_pages(
+            {"37i9dQZF1E37hnawmowyJn": [IOError("Problems paging")]})
 
-        self.playlists.append_daily_mix(randomize=False, target_name=None)
+        with self.assertRaises(PagingException):
+            self.playlists.append_daily_mix(randomize=False, target_name=None)
 
-        self.spotify.playlist_add_items.assert_called_with(
-            "1JJB9ICuIoE6aD4jg9vgmV", ["3DrlHWCoFqHQYGwE8MWsuv"]
-        )
+        self.spotify.playlist_add_items.assert_not_called()
 
 
 class ListPlaylistsTestCase(unittest.TestCase):
@@ -224,6 +221,24 @@ class ListPlaylistsTestCase(unittest.TestCase):
         self.assertEqual("Your Top Songs 2022", playlists[0][FieldName.PLAYLIST_NAME])
         print(playlists)
 
+    def test_limit(self):
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+
+        playlists = self.playlists.list_all_playlists(sort_fields="size:desc", limit=2)
+        self.assertEqual(["Overplayed", "Now"], [playlist[FieldName.PLAYLIST_NAME] for playlist in playlists])
+        self.assertEqual(3, len(self.playlists.list_all_playlists(limit=3)))
+        self.assertEqual(1, len(self.playlists.list_all_playlists(filters="o:spotify", limit=1)))
+
+    def test_filter_listing_index(self):
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index_file = os.path.join(temp_dir, "listing_index.bin")
+            playlists = Playlists(self.spotify, listing_index=ListingIndex(index_file))
+
+            self.assertEqual(self.playlists.list_all_playlists(filters="n:songs|o:eq:spotify"),
+                             playlists.list_all_playlists(filters="n:songs|o:eq:spotify"))
+            self.assertTrue(os.path.exists(index_file))
+
 
 class RandomizePlaylistTestCase(unittest.TestCase):
     def setUp(self):
@@ -241,6 +256,16 @@ class RandomizePlaylistTestCase(unittest.TestCase):
         self.spotify.playlist_replace_items.assert_called_with(
             '37i9dQZF1E37hnawmowyJn', ANY)
 
+    def test_randomize_changes_order(self):
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+        track_ids = [item['track']['id'] for item in TRACKS_DAILY1['items']]
+
+        self.playlists.randomize_playlist({'id': '37i9dQZF1E37hnawmowyJn', 'name': 'test_name'})
+
+        written_ids = self.spotify.playlist_replace_items.call_args.args[1]
+        self.assertCountEqual(track_ids, written_ids)
+        self.assertNotEqual(track_ids, written_ids)
+
     def test_randomize_exception(self):
         self.spotify.playlist_items.side_effect = Mock(side_effect=Exception('Bad playlist items'))
 
@@ -296,6 +321,26 @@ class RecentSubscriptionsTestCase(unittest.TestCase):
         self.assertListEqual(sorted(all_track_ids), sorted(call_args[1]))
         print(f"Call args: {call_args}")
 
+    def test_recent_subscriptions_shared_playlist(self):
+        config = {
+            "playlists": {"first": ["some_epoch"], "second": ["some_epoch", "minus_invalid"]},
+            "oldest_timestamp": "2022-12-10T15:56:13Z",
+            "include_zero_timestamps": False,
+        }
+        local_playlists = Playlists(self.spotify, config=config)
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+        local_playlists._get_new_subscription_tracks = Mock(wraps=local_playlists._get_new_subscription_tracks)
+
+        with self.assertLogs("spotcrates.playlists", level="DEBUG") as logs:
+            track_ids = local_playlists._get_subscription_playlist_ids(
+                local_playlists._get_oldest_timestamp(), set(), False)
+
+        read_ids = sorted(call.args[0] for call in local_playlists._get_new_subscription_tracks.call_args_list)
+        self.assertEqual(["minus_invalid", "some_epoch"], read_ids)
+        self.assertIn("Found 4 newer than 2022-12-10 15:56:13 in playlist set 'first'", "\n".join(logs.output))
+        self.assertIn("Found 9 newer than 2022-12-10 15:56:13 in playlist set 'second'", "\n".join(logs.output))
+        self.assertEqual(9, len(track_ids))
+
     def test_recent_subscriptions_include_zeros(self):
         config = {
             "playlists": {"test": ["some_epoch"]},
@@ -322,6 +367,161 @@ class RecentSubscriptionsTestCase(unittest.TestCase):
         self.assertListEqual(sorted(all_track_ids), sorted(call_args[1]))
         print(f"Call args: {call_args}")
 
+    def test_max_age_is_utc(self):
+        local_playlists = Playlists(self.spotify, config={"max_age": "1 hour"})
+
+        oldest_added_at = to_added_at(local_playlists._get_oldest_timestamp())
+
+        self.assertAlmostEqual(time.time() - 3600, oldest_added_at, delta=5)
+
+
+def make_paged_tracks(added_ats):
+    """Returns a playlist_items stand-in that pages through tracks with the given 'added_at' values."""
+    items = [{"added_at": added_at, "track": {"id": f"track{position:05d}"}}
+             for position, added_at in enumerate(added_ats)]
+
+    def get_page(*args, **kwargs):
+        offset = kwargs.get("offset", 0)
+        limit = kwargs.get("limit", 100)
+        return {"items": items[offset:offset + limit], "offset": offset, "limit": limit, "total": len(items),
+                "next": None}
+
+    return get_page
+
+
+class TailFirstTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.playlists = Playlists(self.spotify, {"page_workers": 4})
+        self.start = datetime.datetime(2022, 12, 1)
+        self.oldest_timestamp = self.start + datetime.timedelta(hours=950)
+        self.oldest_added_at = to_added_at(self.oldest_timestamp)
+
+    def get_added_ats(self, count):
+        return [(self.start + datetime.timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M:%SZ") for hour in range(count)]
+
+    def test_reads_tail(self):
+        self.spotify.playlist_items.side_effect = make_paged_tracks(self.get_added_ats(1000))
+
+        tracks = self.playlists._get_recent_tracks("playlist1", self.oldest_added_at)
+
+        self.assertEqual([f"track{position:05d}" for position in range(900, 1000)], [track.id for track in tracks])
+        offsets = [call.kwargs.get("offset", 0) for call in self.spotify.playlist_items.call_args_list]
+        self.assertEqual([0, 900, 800], offsets)
+
+    def test_all_recent(self):
+        self.spotify.playlist_items.side_effect = make_paged_tracks(self.get_added_ats(250))
+
+        tracks = self.playlists._get_recent_tracks("playlist1", to_added_at(self.start))
+
+        self.assertEqual(250, len(tracks))
+        self.assertEqual(3, self.spotify.playlist_items.call_count)
+
+    def test_unordered_reads_all(self):
+        added_ats = self.get_added_ats(1000)
+        added_ats[990], added_ats[10] = added_ats[10], added_ats[990]
+        self.spotify.playlist_items.side_effect = make_paged_tracks(added_ats)
+
+        tracks = self.playlists._get_recent_tracks("playlist1", self.oldest_added_at)
+
+        self.assertEqual(1000, len(tracks))
+
+    def test_zero_reads_all(self):
+        added_ats = self.get_added_ats(1000)
+        added_ats[995] = "1970-01-01T00:00:00Z"
+        self.spotify.playlist_items.side_effect = make_paged_tracks(added_ats)
+
+        tracks = self.playlists._get_recent_tracks("playlist1", self.oldest_added_at)
+
+        self.assertEqual(1000, len(tracks))
+
+    def test_subscriptions(self):
+        self.spotify.playlist_items.side_effect = make_paged_tracks(self.get_added_ats(1000))
+        local_playlists = Playlists(self.spotify, {"playlists": {"test": ["playlist1"]}})
+
+        track_ids = local_playlists._get_subscription_playlist_ids(self.oldest_timestamp, set(), False)
+
+        self.assertEqual({f"track{position:05d}" for position in range(950, 1000)}, track_ids)
+        self.assertEqual(3, self.spotify.playlist_items.call_count)
+
+
+class SubscriptionStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        start = datetime.datetime(2022, 12, 1)
+        self.added_ats = [(start + datetime.timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M:%SZ")
+                          for hour in range(1000)]
+        self.config = {"playlists": {"test": ["playlist1"]}, "oldest_timestamp": "2022-12-01T00:00:00Z"}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_subscriptions(self, snapshot_id, track_count, target_name=None):
+        def get_tracks(*args, **kwargs):
+            if args[0] == "playlist1":
+                return make_paged_tracks(self.added_ats[:track_count])(*args, **kwargs)
+            return get_canned_tracks(*args, **kwargs)
+
+        self.spotify.reset_mock()
+        self.spotify.playlist_items.side_effect = get_tracks
+        self.spotify.playlist.return_value = {"snapshot_id": snapshot_id, "tracks": {"total": track_count}}
+        self.spotify.me.return_value = {"id": "testuser"}
+        self.spotify.user_playlist_create.return_value = {"id": "1JJB9ICuIoE6aD4jg9vgmV"}
+        state = SubscriptionState(os.path.join(self.temp_dir.name, "subscriptions.json"))
+        Playlists(self.spotify, self.config, subscription_state=state).append_recent_subscriptions(
+            randomize=False, target_name=target_name)
+
+    def get_added_ids(self):
+        return [track_id for call in self.spotify.playlist_add_items.call_args_list for track_id in call.args[1]]
+
+    def test_unchanged_skipped(self):
+        self.run_subscriptions("snap1", 900)
+        self.assertEqual(900, len(self.get_added_ids()))
+
+        self.run_subscriptions("snap1", 900)
+
+        fetched = [call.args[0] for call in self.spotify.playlist_items.call_args_list]
+        self.assertNotIn("playlist1", fetched)
+        self.spotify.playlist_add_items.assert_not_called()
+
+    def test_changed_read_past_mark(self):
+        self.run_subscriptions("snap1", 900)
+
+        self.run_subscriptions("snap2", 1000)
+
+        offsets = [call.kwargs.get("offset", 0) for call in self.spotify.playlist_items.call_args_list
+                   if call.args[0] == "playlist1"]
+        self.assertEqual([0, 900, 800], offsets)
+        self.assertEqual([f"track{position:05d}" for position in range(900, 1000)], sorted(self.get_added_ids()))
+
+    def test_other_target_read(self):
+        self.run_subscriptions("snap1", 900)
+
+        self.run_subscriptions("snap1", 900, target_name="Overplayed")
+
+        self.assertEqual(900, len(self.get_added_ids()))
+        self.assertEqual("0y8aCYE2OsnLzzxtqcDGf8", self.spotify.playlist_add_items.call_args.args[0])
+
+    def test_longer_max_age_read(self):
+        self.config["oldest_timestamp"] = "2022-12-20T00:00:00Z"
+        self.run_subscriptions("snap1", 900)
+        self.assertEqual(900 - 19 * 24, len(self.get_added_ids()))
+
+        self.config["oldest_timestamp"] = "2022-12-01T00:00:00Z"
+        self.run_subscriptions("snap1", 900)
+
+        self.assertEqual(900, len(self.get_added_ids()))
+
+        self.run_subscriptions("snap1", 900)
+
+        self.spotify.playlist_add_items.assert_not_called()
+
 
 class PlaylistFilterTestCase(unittest.TestCase):
 
@@ -333,17 +533,341 @@ class PlaylistFilterTestCase(unittest.TestCase):
     def test_all_valid(self):
         self.spotify.playlist_items.side_effect = get_canned_tracks
 
-        result = self.playlists._filter_for_tracks('37i9dQZF1E37hnawmowyJn')
+        result = self.playlists._iter_tracks('37i9dQZF1E37hnawmowyJn')
 
         tracks = get_canned_tracks('37i9dQZF1E37hnawmowyJn')
 
-        self.assertEqual(tracks['items'], result)
+        self.assertEqual([item['track']['id'] for item in tracks['items']], [track.id for track in result])
 
     def test_some_invalid(self):
         self.spotify.playlist_items.side_effect = get_canned_tracks
 
-        result = self.playlists._filter_for_tracks('some_invalid')
+        result = self.playlists._iter_tracks('some_invalid')
 
         tracks = get_canned_tracks('minus_invalid')
 
-        self.assertEqual(tracks['items'], result)
+        self.assertEqual([item['track']['id'] for item in tracks['items']], [track.id for track in result])
+
+    def test_parallel_pages(self):
+        local_playlists = Playlists(self.spotify, {"page_workers": 4})
+        items = TRACKS_DAILY1["items"]
+
+        def get_page(*args, **kwargs):
+            offset = kwargs.get("offset", 0)
+            return {"items": items[offset:offset + 2], "offset": offset, "limit": 2, "total": len(items)}
+
+        self.spotify.playlist_items.side_effect = get_page
+
+        result = local_playlists._iter_tracks('37i9dQZF1E37hnawmowyJn')
+
+        self.assertEqual([item['track']['id'] for item in items], [track.id for track in result])
+        self.spotify.next.assert_not_called()
+
+    def test_track_id_profile(self):
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+
+        track_ids = self.playlists._get_playlist_track_ids('37i9dQZF1E37hnawmowyJn')
+
+        self.assertEqual({item["track"]["id"] for item in TRACKS_DAILY1["items"]}, track_ids)
+        self.spotify.playlist_items.assert_called_with(
+            '37i9dQZF1E37hnawmowyJn', fields=FetchProfile.TRACK_IDS.fields, limit=100)
+
+
+class PlaylistCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.playlists = Playlists(self.spotify, cache=PlaylistCache(self.temp_dir.name))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_cache_hit_skips_network(self):
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+        playlist = {'id': '37i9dQZF1E37hnawmowyJn', 'snapshot_id': 'snap1'}
+
+        first_ids = self.playlists._get_playlist_track_ids(playlist)
+        second_ids = self.playlists._get_playlist_track_ids(playlist)
+
+        self.assertEqual(first_ids, second_ids)
+        self.assertEqual(1, self.spotify.playlist_items.call_count)
+
+    def test_new_snapshot_refetches(self):
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+
+        self.playlists._get_playlist_track_ids({'id': '37i9dQZF1E37hnawmowyJn', 'snapshot_id': 'snap1'})
+        self.playlists._get_playlist_track_ids({'id': '37i9dQZF1E37hnawmowyJn', 'snapshot_id': 'snap2'})
+
+        self.assertEqual(2, self.spotify.playlist_items.call_count)
+
+    def test_no_snapshot_bypasses_cache(self):
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+
+        self.playlists._get_playlist_track_ids('37i9dQZF1E37hnawmowyJn')
+        Playlists(self.spotify, cache=self.playlists.cache)._get_playlist_track_ids('37i9dQZF1E37hnawmowyJn')
+
+        self.assertEqual(2, self.spotify.playlist_items.call_count)
+
+
+class TrackReadsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+        self.playlists = Playlists(self.spotify, cache=PlaylistCache(self.temp_dir.name))
+        self.playlist = {'id': '37i9dQZF1E37hnawmowyJn', 'snapshot_id': 'snap1'}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_concurrent_reads_shared(self):
+        release = threading.Event()
+
+        def get_tracks(*args, **kwargs):
+            release.wait(5)
+            return get_canned_tracks(*args, **kwargs)
+
+        self.spotify.playlist_items.side_effect = get_tracks
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(self.playlists._get_playlist_track_ids, self.playlist) for _ in range(4)]
+            time.sleep(0.05)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(1, self.spotify.playlist_items.call_count)
+
+    def test_finished_reads_not_kept(self):
+        self.playlists._get_playlist_track_ids(self.playlist)
+        self.playlists._get_playlist_track_ids(self.playlist)
+
+        self.assertEqual(1, self.spotify.playlist_items.call_count)
+        self.assertEqual({}, self.playlists._track_reads.calls)
+
+    def test_uncached_reads_streamed(self):
+        self.spotify.playlist_items.side_effect = make_canned_pages({'37i9dQZF1E37hnawmowyJn': [TRACKS_TARGET]})
+
+        tracks = Playlists(self.spotify)._iter_tracks('37i9dQZF1E37hnawmowyJn', FetchProfile.TRACK_IDS)
+
+        self.assertEqual(TRACKS_DAILY1["items"][0]["track"]["id"], next(tracks).id)
+        self.assertEqual(1, self.spotify.playlist_items.call_count)
+        self.assertEqual(len(TRACKS_DAILY1["items"]) + len(TRACKS_TARGET["items"]) - 1, len(list(tracks)))
+        self.assertEqual(2, self.spotify.playlist_items.call_count)
+
+
+class ExclusionIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_playlists(self):
+        return Playlists(self.spotify, exclusions=ExclusionIndex(os.path.join(self.temp_dir.name, "exclusions.json")))
+
+    def test_excludes_read_once(self):
+        self.get_playlists().append_daily_mix(randomize=False, target_name=None)
+        self.spotify.playlist_add_items.reset_mock()
+        first_reads = self.spotify.playlist_items.call_count
+
+        self.get_playlists().append_daily_mix(randomize=False, target_name=None)
+
+        # Only the daily mix is read again
+        self.assertEqual(1, self.spotify.playlist_items.call_count - first_reads)
+        self.spotify.playlist_add_items.assert_called_with("1JJB9ICuIoE6aD4jg9vgmV", ["3DrlHWCoFqHQYGwE8MWsuv"])
+
+
+class RunMemoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        self.spotify.me.return_value = {"id": "testuser"}
+        self.playlists = Playlists(self.spotify)
+
+    def test_listing_memoized(self):
+        self.playlists.get_all_playlists()
+        self.playlists._get_playlist_index()
+        self.playlists._get_playlist_index()
+
+        self.assertEqual(1, self.spotify.current_user_playlists.call_count)
+
+    def test_create_invalidates(self):
+        self.spotify.user_playlist_create.return_value = {"id": "new_playlist"}
+        self.playlists.get_all_playlists()
+
+        self.playlists._create_playlist("New List")
+        self.playlists._create_playlist("Other List")
+        self.playlists.get_all_playlists()
+
+        self.assertEqual(2, self.spotify.current_user_playlists.call_count)
+        self.spotify.me.assert_called_once()
+
+    def test_copy_fetches_listing_once(self):
+        self.spotify.user_playlist_create.return_value = {"id": "new_playlist"}
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+
+        result, dest_name = self.playlists.copy_list(["Daily Mix 1"], randomize=False)
+
+        self.assertEqual(PlaylistResult.SUCCESS, result)
+        self.assertEqual("Daily Mix 1-01", dest_name)
+        self.assertEqual(1, self.spotify.current_user_playlists.call_count)
+        self.spotify.user_playlist_create.assert_called_with("testuser", "Daily Mix 1-01", public=False)
+        self.spotify.playlist_add_items.assert_called()
+
+
+class RandomizePlaylistsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+        self.playlists = Playlists(self.spotify)
+
+    def test_name_and_id(self):
+        results = self.playlists.randomize_playlists(["daily mix 1", "1JJB9ICuIoE6aD4jg9vgmV", "missing"])
+
+        self.assertEqual({"Daily Mix 1": PlaylistResult.SUCCESS,
+                          "1JJB9ICuIoE6aD4jg9vgmV": PlaylistResult.SUCCESS,
+                          "missing": PlaylistResult.NOT_FOUND}, results)
+
+    def test_serial(self):
+        local_playlists = Playlists(self.spotify, {"playlist_workers": 1})
+
+        results = local_playlists.randomize_playlists(["daily mix 1", "1JJB9ICuIoE6aD4jg9vgmV"])
+
+        self.assertEqual([PlaylistResult.SUCCESS, PlaylistResult.SUCCESS], list(results.values()))
+        self.assertEqual(2, self.spotify.playlist_replace_items.call_count)
+
+    def test_failure_isolated(self):
+        def get_tracks(*args, **kwargs):
+            if args[0] == "1JJB9ICuIoE6aD4jg9vgmV":
+                raise Exception("Test exception")
+            return get_canned_tracks(*args, **kwargs)
+
+        self.spotify.playlist_items.side_effect = get_tracks
+
+        results = self.playlists.randomize_playlists(["daily mix 1", "1JJB9ICuIoE6aD4jg9vgmV"])
+
+        self.assertEqual({"Daily Mix 1": PlaylistResult.SUCCESS,
+                          "1JJB9ICuIoE6aD4jg9vgmV": PlaylistResult.FAILURE}, results)
+
+
+class CopyListsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+        self.spotify.me.return_value = {"id": "testuser"}
+        self.spotify.user_playlist_create.side_effect = lambda user, name, public: {"id": f"{name}-id"}
+        self.playlists = Playlists(self.spotify)
+
+    def test_copy_many(self):
+        results = self.playlists.copy_lists(["Daily Mix 1", "overplayed", "missing"], randomize=False)
+
+        self.assertEqual({"Daily Mix 1": (PlaylistResult.SUCCESS, "Daily Mix 1-01"),
+                          "overplayed": (PlaylistResult.SUCCESS, "overplayed-01"),
+                          "missing": (PlaylistResult.NOT_FOUND, None)}, results)
+        self.assertEqual(2, self.spotify.user_playlist_create.call_count)
+        self.assertEqual(1, self.spotify.current_user_playlists.call_count)
+
+    def test_reserved_names(self):
+        results = self.playlists.copy_lists(["Daily Mix 1", "daily mix 1"], randomize=False)
+
+        self.assertEqual((PlaylistResult.SUCCESS, "Daily Mix 1-01"), results["Daily Mix 1"])
+        self.assertEqual((PlaylistResult.SUCCESS, "daily mix 1-02"), results["daily mix 1"])
+
+
+class MultiplePrefixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": PLAYLIST_LIST}
+        self.spotify.playlist_items.side_effect = get_canned_tracks
+
+    def test_exclude_prefixes(self):
+        local_playlists = Playlists(self.spotify, {"daily_mix_exclude_prefix": ["Overplayed", "Your Top"]})
+        playlist_index = local_playlists._get_playlist_index()
+
+        exclude_lists = local_playlists._get_exclude_lists(playlist_index, set(), playlist_index.find_name("Now"))
+
+        self.assertEqual(["Overplayed", "Your Top Songs 2022", "Your Top Songs 2021"],
+                         [playlist["name"] for playlist in exclude_lists])
+
+    def test_daily_prefixes(self):
+        local_playlists = Playlists(self.spotify, {"daily_mix_prefix": ["Nothing", "Daily"]})
+
+        local_playlists.append_daily_mix(randomize=False, target_name=None)
+
+        self.spotify.playlist_add_items.assert_called_with(
+            "1JJB9ICuIoE6aD4jg9vgmV", ["3DrlHWCoFqHQYGwE8MWsuv"]
+        )
+
+
+class PipelinedDailyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.next.return_value = None
+        self.spotify.current_user_playlists.return_value = {"items": [
+            {"id": "target1", "name": "Now"}, {"id": "daily1", "name": "Daily Mix 1"},
+            {"id": "daily2", "name": "Daily Mix 2"}, {"id": "daily3", "name": "Daily Mix 3"},
+        ]}
+        self.spotify.playlist_add_items.return_value = {"snapshot_id": "snap2"}
+        self.daily_ids = {
+            "target1": ["a005"],
+            "daily1": [f"a{i:03d}" for i in range(60)],
+            "daily2": [f"a{i:03d}" for i in range(50, 150)],
+            "daily3": [f"b{i:03d}" for i in range(10)],
+        }
+
+    def get_tracks(self, *args, **kwargs):
+        return {"items": [{"track": {"id": track_id}} for track_id in self.daily_ids[args[0]]], "next": None}
+
+    def get_added_ids(self):
+        return [track_id for call in self.spotify.playlist_add_items.call_args_list for track_id in call.args[1]]
+
+    def test_order_and_duplicates(self):
+        self.spotify.playlist_items.side_effect = self.get_tracks
+
+        Playlists(self.spotify).append_daily_mix(randomize=False, target_name=None)
+
+        expected = [f"a{i:03d}" for i in range(150) if i != 5] + [f"b{i:03d}" for i in range(10)]
+        self.assertEqual(expected, self.get_added_ids())
+        self.assertEqual([100, 59], [len(call.args[1]) for call in self.spotify.playlist_add_items.call_args_list])
+
+    def test_writes_before_reads_finish(self):
+        first_write = threading.Event()
+        seen_by_last_read = []
+
+        def get_tracks(*args, **kwargs):
+            if args[0] == "daily3":
+                seen_by_last_read.append(first_write.wait(timeout=5))
+            return self.get_tracks(*args, **kwargs)
+
+        def add_items(*args, **kwargs):
+            first_write.set()
+            return {"snapshot_id": "snap2"}
+
+        self.spotify.playlist_items.side_effect = get_tracks
+        self.spotify.playlist_add_items.side_effect = add_items
+
+        Playlists(self.spotify, {"playlist_workers": 4}).append_daily_mix(randomize=False, target_name=None)
+
+        self.assertEqual([True], seen_by_last_read)
+        self.assertEqual(159, len(self.get_added_ids()))
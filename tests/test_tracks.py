@@ -0,0 +1,176 @@
+import datetime
+import unittest
+
+from spotcrates.tracks import TrackRef, TrackIdSet, parse_added_at, format_added_at, to_added_at, encode_track_id, \
+    decode_track_id
+
+
+class TrackRefTestCase(unittest.TestCase):
+    def test_from_item(self):
+        track = TrackRef.from_item({
+            "added_at": "2022-12-14T15:56:13Z",
+            "track": {"id": "3DrlHWCoFqHQYGwE8MWsuv", "name": "Some Song",
+                      "artists": [{"id": "artist1"}, {"id": "artist2"}], "album": {"id": "album1"}},
+        })
+
+        self.assertEqual("3DrlHWCoFqHQYGwE8MWsuv", track.id)
+        self.assertEqual(1671033373, track.added_at)
+        self.assertEqual(("artist1", "artist2"), track.artist_ids)
+        self.assertEqual("album1", track.album_id)
+
+    def test_from_item_id_only(self):
+        track = TrackRef.from_item({"track": {"id": "3DrlHWCoFqHQYGwE8MWsuv"}})
+
+        self.assertEqual("3DrlHWCoFqHQYGwE8MWsuv", track.id)
+        self.assertIsNone(track.added_at)
+        self.assertEqual((), track.artist_ids)
+        self.assertIsNone(track.album_id)
+
+    def test_from_item_invalid(self):
+        self.assertIsNone(TrackRef.from_item({"track": None}))
+        self.assertIsNone(TrackRef.from_item({"track": {"id": None}}))
+        self.assertIsNone(TrackRef.from_item({}))
+
+    def test_shared_high_words(self):
+        values = [(7 << 64) | low for low in (3, 9, 12)] + [(8 << 64) | 1]
+        track_ids = TrackIdSet(decode_track_id(value.to_bytes(16, "big")) for value in values)
+
+        for value in values:
+            self.assertIn(decode_track_id(value.to_bytes(16, "big")), track_ids)
+        for value in [(7 << 64) | 4, (7 << 64) | 13, (8 << 64), (6 << 64) | 3]:
+            self.assertNotIn(decode_track_id(value.to_bytes(16, "big")), track_ids)
+
+    def test_row_round_trip(self):
+        track = TrackRef("3DrlHWCoFqHQYGwE8MWsuv", 1671033373, ("artist1",), "album1")
+
+        self.assertEqual(track, TrackRef.from_row(track.to_row()))
+
+    def test_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            TrackRef("3DrlHWCoFqHQYGwE8MWsuv").name = "Some Song"
+
+
+class ParseAddedAtTestCase(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(1671033373, parse_added_at("2022-12-14T15:56:13Z"))
+
+    def test_matches_strptime(self):
+        for iso_added in ("2022-12-14T15:56:13Z", "2000-02-29T23:59:59Z", "1999-12-31T00:00:00Z"):
+            expected = datetime.datetime.strptime(iso_added, "%Y-%m-%dT%H:%M:%SZ").replace(
+                tzinfo=datetime.timezone.utc).timestamp()
+            self.assertEqual(expected, parse_added_at(iso_added))
+
+    def test_zero(self):
+        self.assertEqual(0, parse_added_at("1970-01-01T00:00:00Z"))
+
+    def test_missing(self):
+        self.assertIsNone(parse_added_at(None))
+        self.assertIsNone(parse_added_at(""))
+
+    def test_invalid(self):
+        self.assertIsNone(parse_added_at("yesterday"))
+        self.assertIsNone(parse_added_at("2022-13-14T15:56:13Z"))
+        self.assertIsNone(parse_added_at("2022-12-14 15:56:13Z"))
+        self.assertIsNone(parse_added_at("2022-12-14T15:5a:13Z"))
+        self.assertIsNone(parse_added_at("2022-12-14T15:56:13+00:00"))
+
+    def test_format_round_trip(self):
+        self.assertEqual("2022-12-14T15:56:13Z", format_added_at(parse_added_at("2022-12-14T15:56:13Z")))
+        self.assertEqual("1970-01-01T00:00:00Z", format_added_at(0))
+        self.assertIsNone(format_added_at(None))
+
+    def test_naive_times_are_utc(self):
+        self.assertEqual(1671033373, to_added_at(datetime.datetime(2022, 12, 14, 15, 56, 13)))
+        self.assertEqual(1671033373, to_added_at(datetime.datetime(
+            2022, 12, 14, 10, 56, 13, tzinfo=datetime.timezone(datetime.timedelta(hours=-5)))))
+
+
+class TrackIdCodecTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        for track_id in ["4iV5W9uYEdYUVa79Axb7Rh", "1301WleyT98MSxVHPZCA6M", "0000000000000000000000"]:
+            self.assertEqual(track_id, decode_track_id(encode_track_id(track_id)))
+
+    def test_order_preserved(self):
+        self.assertLess(encode_track_id("1301WleyT98MSxVHPZCA6M"), encode_track_id("4iV5W9uYEdYUVa79Axb7Rh"))
+
+    def test_not_encodable(self):
+        self.assertIsNone(encode_track_id("short"))
+        self.assertIsNone(encode_track_id("4iV5W9uYEdYUVa79Axb7R-"))
+        # Larger than 128 bits
+        self.assertIsNone(encode_track_id("GWzB3Hhj22I8SLs6Gt9B5O"))
+
+
+class TrackIdSetTestCase(unittest.TestCase):
+    def test_membership(self):
+        track_ids = TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh", "1301WleyT98MSxVHPZCA6M", "GWzB3Hhj22I8SLs6Gt9B5O"])
+
+        self.assertEqual(3, len(track_ids))
+        self.assertIn("4iV5W9uYEdYUVa79Axb7Rh", track_ids)
+        self.assertIn("GWzB3Hhj22I8SLs6Gt9B5O", track_ids)
+        self.assertNotIn("3DrlHWCoFqHQYGwE8MWsuv", track_ids)
+        self.assertNotIn(None, track_ids)
+
+    def test_deduplicates(self):
+        self.assertEqual(1, len(TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh", "4iV5W9uYEdYUVa79Axb7Rh"])))
+
+    def test_compact(self):
+        track_ids = TrackIdSet(decode_track_id(value.to_bytes(16, "big")) for value in range(0, 10 ** 36, 10 ** 32))
+
+        self.assertEqual(10000, len(track_ids))
+        self.assertEqual(160000, len(track_ids.buffer))
+
+    def test_union(self):
+        first = TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh", "GWzB3Hhj22I8SLs6Gt9B5O"])
+        second = TrackIdSet(["1301WleyT98MSxVHPZCA6M", "4iV5W9uYEdYUVa79Axb7Rh"])
+
+        union = first.union(second, ["3DrlHWCoFqHQYGwE8MWsuv"])
+
+        self.assertEqual({"4iV5W9uYEdYUVa79Axb7Rh", "GWzB3Hhj22I8SLs6Gt9B5O", "1301WleyT98MSxVHPZCA6M",
+                          "3DrlHWCoFqHQYGwE8MWsuv"}, set(union))
+        self.assertEqual(2, len(first))
+
+    def test_update(self):
+        track_ids = TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh"])
+
+        track_ids.update(["1301WleyT98MSxVHPZCA6M"])
+
+        self.assertEqual({"4iV5W9uYEdYUVa79Axb7Rh", "1301WleyT98MSxVHPZCA6M"}, track_ids)
+
+    def test_missing(self):
+        track_ids = TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh"])
+
+        self.assertEqual(["1301WleyT98MSxVHPZCA6M"],
+                         track_ids.missing(["1301WleyT98MSxVHPZCA6M", "4iV5W9uYEdYUVa79Axb7Rh"]))
+
+    def test_missing_from_loaded(self):
+        track_ids = TrackIdSet.from_row(TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh", "GWzB3Hhj22I8SLs6Gt9B5O"]).to_row())
+
+        self.assertEqual(2, len(track_ids))
+        self.assertEqual(["1301WleyT98MSxVHPZCA6M", "3DrlHWCoFqHQYGwE8MWsuv"],
+                         track_ids.missing(["1301WleyT98MSxVHPZCA6M", "GWzB3Hhj22I8SLs6Gt9B5O",
+                                            "3DrlHWCoFqHQYGwE8MWsuv", "4iV5W9uYEdYUVa79Axb7Rh"]))
+
+    def test_update_repacks(self):
+        track_ids = TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh"])
+        buffer = track_ids.buffer
+
+        track_ids.update(TrackIdSet(["1301WleyT98MSxVHPZCA6M"]))
+
+        self.assertEqual(2 * len(buffer), len(track_ids.buffer))
+        self.assertEqual(sorted([encode_track_id("4iV5W9uYEdYUVa79Axb7Rh"), encode_track_id("1301WleyT98MSxVHPZCA6M")]),
+                         [track_ids.buffer[:16], track_ids.buffer[16:]])
+
+    def test_shared_high_words(self):
+        values = [(7 << 64) | low for low in (3, 9, 12)] + [(8 << 64) | 1]
+        track_ids = TrackIdSet(decode_track_id(value.to_bytes(16, "big")) for value in values)
+
+        for value in values:
+            self.assertIn(decode_track_id(value.to_bytes(16, "big")), track_ids)
+        for value in [(7 << 64) | 4, (7 << 64) | 13, (8 << 64), (6 << 64) | 3]:
+            self.assertNotIn(decode_track_id(value.to_bytes(16, "big")), track_ids)
+
+    def test_row_round_trip(self):
+        track_ids = TrackIdSet(["4iV5W9uYEdYUVa79Axb7Rh", "GWzB3Hhj22I8SLs6Gt9B5O"])
+
+        self.assertEqual(track_ids, TrackIdSet.from_row(track_ids.to_row()))
+        self.assertEqual(TrackIdSet.from_row(track_ids.to_row()), TrackIdSet.from_row(track_ids.to_row()))
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import MagicMock
+
+from spotcrates.writer import PlaylistWriter, dedupe, iter_unique
+
+
+def make_ids(count):
+    return [f"track{i:05d}" for i in range(count)]
+
+
+class PlaylistWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.spotify = MagicMock()
+        self.spotify.playlist_add_items.return_value = {"snapshot_id": "snap3"}
+        self.writer = PlaylistWriter(self.spotify)
+
+    def test_append_keeps_order(self):
+        self.writer.append("playlist1", ["c", "a", "b", "a"])
+
+        self.spotify.playlist_add_items.assert_called_once_with("playlist1", ["c", "a", "b"])
+
+    def test_append_streams(self):
+        batches_before = []
+
+        def produce_ids():
+            yield from make_ids(150)
+            batches_before.append(self.spotify.playlist_add_items.call_count)
+            yield "track00000"
+
+        self.writer.append("playlist1", produce_ids())
+
+        self.assertEqual([1], batches_before)
+        self.assertEqual(2, self.spotify.playlist_add_items.call_count)
+        self.spotify.playlist_add_items.assert_called_with("playlist1", make_ids(150)[100:])
+
+    def test_replace_keeps_order(self):
+        tracks = make_ids(250)
+        desired = list(reversed(tracks))
+
+        self.assertEqual(3, self.writer.replace("playlist1", desired + desired[:5]))
+
+        self.spotify.playlist_replace_items.assert_called_once_with("playlist1", desired[:100])
+        self.assertEqual(2, self.spotify.playlist_add_items.call_count)
+        self.spotify.playlist_add_items.assert_called_with("playlist1", desired[200:])
+
+    def test_replace_empty(self):
+        self.assertEqual(1, self.writer.replace("playlist1", []))
+
+        self.spotify.playlist_replace_items.assert_called_once_with("playlist1", [])
+        self.spotify.playlist_add_items.assert_not_called()
+
+
+class DedupeTestCase(unittest.TestCase):
+    def test_keeps_first(self):
+        self.assertEqual(["b", "a", "c"], dedupe(["b", "a", "b", "c", "a"]))
+
+    def test_iter_unique(self):
+        self.assertEqual(["b", "a", "c"], list(iter_unique(iter(["b", "a", "b", "c", "a"]))))